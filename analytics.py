@@ -0,0 +1,214 @@
+import os
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from pull_updated_data import NYC_FIPS, group_day_keys, rolling_calendar_mean
+from county_store import load_counties_df
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+GEOGRAPHIES = ['county', 'state', 'nation']
+ROLLING_WINDOWS = [7, 14, 28]
+NATION = 'United States'
+
+# metric name -> (count, measure)
+#   new            daily increase
+#   sum, mean      over the trailing window of calendar days
+#   per100k        window mean per 100k population
+#   growth         window sum over the window sum one window earlier, minus one
+#   doubling_time  days for the cumulative count to double at the window's growth
+METRICS = {'new_cases': ('cases', 'new'), 'new_deaths': ('deaths', 'new')}
+for count in ['cases', 'deaths']:
+    for measure in ['sum', 'mean', 'per100k', 'growth', 'doubling_time']:
+        METRICS[count + '_' + measure] = (count, measure)
+
+# computed metric frames kept per analytics instance
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', 64))
+# trailing days of the county store the dashboard's metric views can select from
+ANALYTICS_DAYS = int(os.environ.get('ANALYTICS_DAYS', 180))
+
+
+# value of the row exactly `days` calendar days earlier in the same group, NaN if not reported
+def calendar_lag(keys, values, days):
+    lagged_keys = keys - days
+    i = np.minimum(np.searchsorted(keys, lagged_keys, side='left'), len(keys) - 1)
+    return np.where(keys[i] == lagged_keys, values[i], np.nan)
+
+
+def new_counts(keys, cumulative):
+    new = np.r_[np.nan, np.diff(cumulative)]
+    new[np.r_[True, (keys[1:] >> 32) != (keys[:-1] >> 32)]] = np.nan
+    return np.maximum(new, 0)
+
+
+# METRICS OVER THE PROCESSED COUNTY SERIES, ROLLED UP TO STATES AND THE NATION
+class CountyAnalytics:
+
+    def __init__(self, counties_df):
+        counties_df = counties_df[['date', 'county', 'state', 'fips', 'cases', 'deaths', 'popest']]
+        self.frame = counties_df.assign(fips=counties_df['fips'].astype('category'))
+        # county name and state of every fips
+        self.counties = self.frame[['fips', 'county', 'state']].drop_duplicates('fips') \
+            .astype(str).set_index('fips')
+        self._series = {}
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_store(cls, since=None):
+        return cls(load_counties_df(columns=['date', 'county', 'state', 'fips', 'cases', 'deaths', 'popest'],
+                                    since=since))
+
+    # SERIES OF EVERY GEOGRAPHY ALREADY COMPUTED BY THE INGESTING PROCESS
+    # the arrays are read-only maps of the shared snapshot, only metric results are private
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        analytics = cls.__new__(cls)
+        analytics.frame = None
+        analytics.counties = snapshot.frame('counties').astype(str).set_index('fips')
+        analytics._series = {geography: {column: snapshot.column('series_' + geography, column)
+                                         for column in snapshot.columns['series_' + geography]}
+                             for geography in GEOGRAPHIES}
+        analytics._cache = OrderedDict()
+        return analytics
+
+    # the tables from_snapshot reads, for shared_snapshot.publish_snapshot
+    def snapshot_tables(self) -> dict:
+        tables = {'counties': {'fips': self.counties.index.to_numpy(dtype=object),
+                               'county': self.counties['county'].to_numpy(dtype=object),
+                               'state': self.counties['state'].to_numpy(dtype=object)}}
+        for geography in GEOGRAPHIES:
+            tables['series_' + geography] = self.series(geography)
+        return tables
+
+    # one row per (geography, day), sorted by group_day_keys, with daily and cumulative counts
+    def series(self, geography):
+        if geography in self._series:
+            return self._series[geography]
+        if geography not in GEOGRAPHIES:
+            raise ValueError('unknown geography ' + str(geography))
+
+        df = self.frame
+        if geography == 'county':
+            geo = df['fips']
+            popest = df['popest'].to_numpy(dtype='float64')
+            counts = df[['cases', 'deaths']]
+            dates = df['date']
+        else:
+            # nyc's five boroughs all carry the city's counts and the city's population,
+            # so only the first borough is summed for either
+            counted = df[~df['fips'].isin(NYC_FIPS[1:])]
+            population = counted.drop_duplicates('fips').astype({'state': str})
+            population = population.groupby('state')['popest'].sum() if geography == 'state' \
+                else pd.Series({NATION: population['popest'].sum()})
+
+            group = counted['state'].astype(str) if geography == 'state' else pd.Series(NATION, index=counted.index)
+            totals = counted[['cases', 'deaths']].groupby([group.rename('geo'), counted['date']]).sum()
+            geo = totals.index.get_level_values('geo').astype('category')
+            popest = population.reindex(geo).to_numpy(dtype='float64')
+            counts = totals.reset_index(drop=True)
+            dates = totals.index.get_level_values('date')
+
+        geo = pd.Categorical(geo)
+        keys = group_day_keys(geo.codes, pd.DatetimeIndex(dates).to_numpy())
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        series = {'keys': keys,
+                  'geo': geo[order],
+                  'date': pd.DatetimeIndex(dates)[order],
+                  'popest': popest[order]}
+        for count in ['cases', 'deaths']:
+            cumulative = counts[count].to_numpy(dtype='float64')[order]
+            series[count] = cumulative
+            series['new_' + count] = new_counts(keys, cumulative)
+
+        self._series[geography] = series
+        return series
+
+    # values of one metric for every (geography, day), in series order
+    def values(self, metric, window, geography):
+        count, measure = METRICS[metric]
+        series = self.series(geography)
+        keys, new = series['keys'], series['new_' + count]
+
+        if measure == 'new':
+            return new
+        if measure == 'mean':
+            return rolling_calendar_mean(keys, new, window)
+        if measure == 'sum':
+            return rolling_calendar_mean(keys, new, window) * window
+        if measure == 'per100k':
+            return self.values(count + '_mean', window, geography) / series['popest'] * 100000
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if measure == 'growth':
+                window_sum = self.values(count + '_sum', window, geography)
+                growth = window_sum / calendar_lag(keys, window_sum, window) - 1
+                return np.where(np.isfinite(growth), growth, np.nan)
+            if measure == 'doubling_time':
+                cumulative = series[count]
+                ratio = cumulative / calendar_lag(keys, cumulative, window)
+                # no doubling without growth
+                return np.where(ratio > 1, window * np.log(2) / np.log(ratio), np.nan)
+
+    # MEMOIZED FRAME OF geo, date, value FOR ONE (metric, window, geography)
+    def metric(self, metric, window=7, geography='county'):
+        if metric not in METRICS:
+            raise ValueError('unknown metric ' + str(metric))
+        if METRICS[metric][1] == 'new':
+            window = None
+        key = (metric, window, geography)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        series = self.series(geography)
+        result = pd.DataFrame({'geo': series['geo'],
+                               'date': series['date'],
+                               'value': self.values(metric, window, geography)})
+
+        self._cache[key] = result
+        if len(self._cache) > ANALYTICS_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    # rows of a metric between two dates, for the counties or states of some states only
+    def select(self, metric, window=7, geography='county', start=None, end=None, states=None):
+        result = self.metric(metric, window, geography)
+        mask = np.ones(len(result), dtype=bool)
+        if start is not None:
+            mask &= (result['date'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (result['date'] <= pd.Timestamp(end)).to_numpy()
+        if states and geography == 'county':
+            in_states = self.counties.index[self.counties['state'].isin(states)]
+            mask &= result['geo'].isin(in_states).to_numpy()
+        elif states and geography == 'state':
+            mask &= result['geo'].isin(states).to_numpy()
+        return result[mask]
+
+    # last reported value of every geography
+    def latest(self, metric, window=7, geography='county'):
+        result = self.metric(metric, window, geography)
+        last = np.r_[result['geo'].to_numpy()[1:] != result['geo'].to_numpy()[:-1], True]
+        return result[last].set_index('geo')['value']
+
+
+# export one metric from the county store: python analytics.py cases_per100k --window 14 --geography state
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='export a county series metric as csv')
+    parser.add_argument('metric', choices=sorted(METRICS))
+    parser.add_argument('--window', type=int, default=7, choices=ROLLING_WINDOWS)
+    parser.add_argument('--geography', default='county', choices=GEOGRAPHIES)
+    parser.add_argument('--since', default=None)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    result = CountyAnalytics.from_store(since=args.since).metric(args.metric, args.window, args.geography)
+    out = args.out or args.metric + '_' + str(args.window) + '_' + args.geography + '.csv'
+    result.to_csv(out, index=False)
+    logger.info(str(len(result)) + ' ROWS EXPORTED TO ' + out)
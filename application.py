@@ -2,36 +2,25 @@ import dash
 from dash import dash_table
 from dash import dcc
 from dash import html
-import plotly.graph_objects as go
 import logging
-import sqlite3
 import datetime
-import math
-import pandas as pd
-import numpy as np
-from urllib.request import urlopen
-import json
-
-from update_db import update_db
-from pull_updated_data import (
-    get_counties_geojson,
-    pull_table, 
-    get_counties_df,
-    make_current_counties_df,
-    get_counties_geojson
-)
-from make_figures import (
-    make_cases_by_state_chloropleth,
-    make_cases_by_county_chloropleth,
-    make_cases_by_date_bar
-)
+
+import flask
+from dash import callback_context
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+
+from refresh import RefreshScheduler
+from callback_cache import CallbackCache
+from http_cache import register_http_cache
+from instrument import register_metrics
+
+# importing this module only defines the app: the pipeline, pandas and plotly are imported
+# where they are first used, and create_app builds the app and starts the refresh
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-logger.info('INITIALIZE DB CONNECTION')
-conn = sqlite3.connect('2019-nCoV-CDC.db')
-
 # constants
 STATE_COL_MAP = {
     'state': {'name': 'Jurisdiction', 'id': 'state'},
@@ -40,264 +29,571 @@ STATE_COL_MAP = {
     'community_spread': {'name': 'Community Spread', 'id': 'community_spread'}
 }
 
-STATE_COLS = ['state','n_cases','range','community_spread']
-
-# UPDATE DB
-logger.info('UPDATE DATABASE W CDC DATA')
-update_db(conn)
-
-# PULL UPDATED DATA
-cases_by_state_df = (
-    pull_table(conn, 'cdc_cases_by_state')
-        .sort_values('n_cases',ascending=False)
-        .dropna().reset_index(drop=False)[STATE_COLS]
-)
-cases_by_report_date_df = pull_table(conn, 'cdc_cases_by_report_date').transpose()
-cases_by_onset_date_df = pull_table(conn, 'cdc_cases_by_onset_date').transpose()
-
-# show data tables
-# make bar chart Plotly figures
-logger.info('cases by report date figure')
-cases_by_report_date_bar = make_cases_by_date_bar(cases_by_report_date_df)
-
-logger.info('cases by onset date figure')
-cases_by_onset_date_bar = make_cases_by_date_bar(cases_by_onset_date_df)
-
-logger.info('make cases by state chloropleth')
-cases_by_state_chloropleth = make_cases_by_state_chloropleth(cases_by_state_df)
-
-logger.info('cases by county')
-counties_df = get_counties_df()
-current_counties_df = make_current_counties_df(counties_df)
-
-counties = get_counties_geojson()
-
-cases_by_county_chloropleth = make_cases_by_county_chloropleth(counties_df, current_counties_df, counties)
-
-display_counties_df = current_counties_df[['date','county','state','new_cases_per100k','deaths']] \
-                        .drop_duplicates() \
-                        .set_index('date') \
-                        .sort_values('new_cases_per100k', ascending=False)
-
+# every datatable pages, sorts and filters server side from these payloads
+TABLES = {
+    'cases-by-county-dash-table': {'records': 'display_counties_records',
+                                   'columns': 'display_counties_columns',
+                                   'page_size': 25},
+    'cases-by-state-dash-table': {'records': 'cases_by_state_records',
+                                  'columns': None,
+                                  'page_size': 20},
+    'cases_by_report_date_table': {'records': 'cases_by_report_date_records',
+                                   'columns': 'cases_by_report_date_columns',
+                                   'page_size': 10},
+    'cases_by_onset_date_table': {'records': 'cases_by_onset_date_records',
+                                  'columns': 'cases_by_onset_date_columns',
+                                  'page_size': 10}
+}
+# metric shown by the maps and metric bar until another is picked
+DEFAULT_METRIC = 'cases_per100k'
+
+# the county map until a state is clicked or filtered: the page opens on the state map alone
+COUNTY_MAP_PROMPT = {'data': [],
+                     'layout': {'height': 500,
+                                'xaxis': {'visible': False},
+                                'yaxis': {'visible': False},
+                                'annotations': [{'text': 'Click a state on the state map to see its counties',
+                                                 'showarrow': False,
+                                                 'font': {'size': 16}}]}}
+
+SERVER_SIDE_TABLE_PROPS = dict(page_action='custom',
+                               page_current=0,
+                               sort_action='custom',
+                               sort_mode='single',
+                               sort_by=[],
+                               filter_action='custom',
+                               filter_query='')
+
+# figures built for a control selection, reused until the next build
+callback_cache = CallbackCache()
 
-#######################
-### CREATE DASH APP ###
-#######################
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-application = app.server
-
 colors = {
     'background': '#011f4b',
     'text': '#ffffff'
 }
 
-logger.info('create app layout')
-app.layout = html.Div(children=[
-    html.H1(children='COVID-19 Dashboard',
-            style={
-                'textAlign': 'center',
-                'color': colors['text'],
-                'font':'Helvetica',
-                'font-weight':'bold'
-            }
-            ),
 
-    html.Div(children=html.P(['Tracking the 2019 novel coronavirus pandemic.',
-                     html.Br(),
-                     'Created by Lily Roberts',
-                     html.Br(),
-                     'Project repository: ',
-                     html.A('https://github.com/lilyroberts/SARS-CoV-2-Analysis',
-                            href='https://github.com/lilyroberts/SARS-CoV-2-Analysis',
-                            target='_blank'),
-                     html.Br(),
-                     html.A('Donate to the Food Bank for New York City',
-                            href='https://secure3.convio.net/fbnyc/site/Donation2?df_id=9776&mfc_pref=T&9776.donation=form1&multiply=10&commas=yes',
-                            target='_blank'),
-                     html.Br()]),
-             style={'textAlign': 'center', 'color': colors['text'], 'backgroundColor': colors['background'],
-                'font':'Helvetica', 'display':'block'}),
-
-    # dcc.Graph(
-    #     id='cases-by-state-table',
-    #     figure=cases_by_state_table
-    # ),
-
-    # dcc.Graph(
-    #     id='cases-by-report-date-table',
-    #     figure=cases_by_report_date_table
-    # ),
-    html.Div(children = [
-        html.H4(children='Reported Cases by US County',
+def metric_label(metric):
+    return metric.replace('_', ' ').replace('per100k', 'per 100k').capitalize()
+
+
+def make_layout(payloads):
+    from analytics import METRICS, ROLLING_WINDOWS
+    from build_dashboard import STATE_COLS
+
+    updated_at = datetime.datetime.strftime(datetime.datetime.fromisoformat(payloads['built_at']),
+                                            '%Y-%m-%d %I:%M:%S %p' + ' ET')
+
+    return html.Div(children=[
+        html.H1(children='COVID-19 Dashboard',
                 style={
                     'textAlign': 'center',
                     'color': colors['text'],
-                    'font': 'Helvetica'
+                    'font':'Helvetica',
+                    'font-weight':'bold'
                 }
                 ),
 
+        html.Div(children=html.P(['Tracking the 2019 novel coronavirus pandemic.',
+                         html.Br(),
+                         'Created by Lily Roberts',
+                         html.Br(),
+                         'Project repository: ',
+                         html.A('https://github.com/lilyroberts/SARS-CoV-2-Analysis',
+                                href='https://github.com/lilyroberts/SARS-CoV-2-Analysis',
+                                target='_blank'),
+                         html.Br(),
+                         html.A('Donate to the Food Bank for New York City',
+                                href='https://secure3.convio.net/fbnyc/site/Donation2?df_id=9776&mfc_pref=T&9776.donation=form1&multiply=10&commas=yes',
+                                target='_blank'),
+                         html.Br()]),
+                 style={'textAlign': 'center', 'color': colors['text'], 'backgroundColor': colors['background'],
+                    'font':'Helvetica', 'display':'block'}),
+
+        # dcc.Graph(
+        #     id='cases-by-state-table',
+        #     figure=cases_by_state_table
+        # ),
+
+        # dcc.Graph(
+        #     id='cases-by-report-date-table',
+        #     figure=cases_by_report_date_table
+        # ),
         html.Div(children=[
-            dcc.Graph(id='cases_by_county_chloropleth',
-                    figure=cases_by_county_chloropleth)
-            ],
-            style={'width': '50%', 'display': 'inline-block'}
-        ),
+            html.Div(children=dcc.Dropdown(id='metric-dropdown',
+                                           options=[{'label': metric_label(i), 'value': i} for i in METRICS],
+                                           value=DEFAULT_METRIC,
+                                           clearable=False),
+                     style={'width': '25%', 'display': 'inline-block', 'verticalAlign': 'middle'}),
+            html.Div(children=dcc.RadioItems(id='window-radio',
+                                             options=[{'label': str(i) + ' days', 'value': i} for i in ROLLING_WINDOWS],
+                                             value=ROLLING_WINDOWS[0],
+                                             inline=True),
+                     style={'width': '20%', 'display': 'inline-block', 'verticalAlign': 'middle',
+                            'color': colors['text'], 'font': 'Helvetica'}),
+            html.Div(children=dcc.DatePickerRange(id='date-range',
+                                                  min_date_allowed=payloads.get('analytics_start'),
+                                                  max_date_allowed=payloads.get('analytics_end'),
+                                                  start_date=payloads.get('analytics_start'),
+                                                  end_date=payloads.get('analytics_end'),
+                                                  display_format='YYYY-MM-DD'),
+                     style={'width': '25%', 'display': 'inline-block', 'verticalAlign': 'middle'}),
+            html.Div(children=dcc.Dropdown(id='state-filter',
+                                           options=[{'label': i, 'value': i}
+                                                    for i in payloads.get('analytics_states', [])],
+                                           value=[],
+                                           multi=True,
+                                           placeholder='All states'),
+                     style={'width': '30%', 'display': 'inline-block', 'verticalAlign': 'middle'})
+        ],
+        style={'padding': '0% 2%'}),
 
         html.Div(children = [
-            dash_table.DataTable(id='cases-by-county-dash-table',
-                                columns=[{"name": i, "id": i} for i in display_counties_df.columns],
-                                data=display_counties_df.to_dict('records'),
-                                style_cell={'textAlign': 'left'},
-                                style_table={'overflowX': 'scroll',
-                                            'overflowY':'scroll',
-                                            'maxHeight':'500px',
-                                            'backgroundColor': colors['background'],
-                                            'color': colors['background']},
-                                style_header={'backgroundColor': '#b3cde0',
-                                            'fontWeight': 'bold',
-                                            'textAlign': 'center'})#,
-
-            # html.Caption('Data from New York Times - Updated at '
-            #             + str(datetime.datetime.strftime(datetime.datetime.now(),
-            #                                             '%Y-%m-%d %I:%M:%S %p' + ' ET')),
-            #             style={'font': 'Helvetica',
-            #                     'font-style':'italic',
-            #                     'font-weight':'light',
-            #                     'white-space': 'nowrap',
-            #                     'overflowY': 'hidden',
-            #                     'color': colors['text']})#,
-            ],
-            style={'width': '50%', 'display': 'inline-block'}
-        )
-    ],
-    className = 'double-graph'),
-    html.Br(),
-
-    html.H4(children='Reported Cases by US State/Territory',
-            style={
-                'textAlign': 'center',
-                'color': colors['text'],
-                'font':'Helvetica'
-            }
+            html.H4(children='Reported Cases by US County',
+                    style={
+                        'textAlign': 'center',
+                        'color': colors['text'],
+                        'font': 'Helvetica'
+                    }
+                    ),
+
+            html.Div(children=[
+                dcc.Graph(id='cases_by_county_chloropleth',
+                        figure=COUNTY_MAP_PROMPT)
+                ],
+                style={'width': '50%', 'display': 'inline-block'}
             ),
 
-    html.Br(),
-
-    dcc.Graph(id='cases-by-state-chloropleth',
-              figure=cases_by_state_chloropleth,
-              style={'textAlign': 'center'}),
-
-    html.Br(),
-
-    dash_table.DataTable(id='cases-by-state-dash-table',
-                         columns=[{"name": STATE_COL_MAP.get(i).get('name'),
-                                   "id": STATE_COL_MAP.get(i).get('id')}
-                                  for i in STATE_COLS],
-                         data=cases_by_state_df.to_dict('records'),
-                         style_table={'overflowX': 'scroll',
-                                      'backgroundColor':colors['background'],
-                                      'overflowY':'scroll',
-                                      'maxHeight':'330px'},
-                         style_cell={'textAlign':'left'},
-                         style_header={'backgroundColor':'#b3cde0',
-                                       'fontWeight':'bold',
-                                       'textAlign':'center'}),
-
-    html.Caption('Data from CDC.gov - Updated at '
-                 + str(datetime.datetime.strftime(datetime.datetime.now(),
-                                                  '%Y-%m-%d %I:%M:%S %p' + ' ET')),
-                 style={'font': 'Helvetica',
-                        'font-style':'italic',
-                        'font-weight':'light',
-                        'white-space': 'nowrap',
-                        'overflow': 'hidden',
-                        'color': colors['text']}),
-
-    html.H4(children='Total Confirmed Cases of SARS-CoV-2 in United States',
-            style={
-                'textAlign': 'center',
-                'color': colors['text'],
-                'font':'Helvetica'
-            }
-            ),
+            html.Div(children = [
+                dash_table.DataTable(id='cases-by-county-dash-table',
+                                    columns=[{"name": i, "id": i} for i in payloads['display_counties_columns']],
+                                    data=[],
+                                    **SERVER_SIDE_TABLE_PROPS,
+                                    page_size=TABLES['cases-by-county-dash-table']['page_size'],
+                                    style_cell={'textAlign': 'left'},
+                                    style_table={'overflowX': 'scroll',
+                                                'overflowY':'scroll',
+                                                'maxHeight':'500px',
+                                                'backgroundColor': colors['background'],
+                                                'color': colors['background']},
+                                    style_header={'backgroundColor': '#b3cde0',
+                                                'fontWeight': 'bold',
+                                                'textAlign': 'center'})#,
+
+                # html.Caption('Data from New York Times - Updated at '
+                #             + str(datetime.datetime.strftime(datetime.datetime.now(),
+                #                                             '%Y-%m-%d %I:%M:%S %p' + ' ET')),
+                #             style={'font': 'Helvetica',
+                #                     'font-style':'italic',
+                #                     'font-weight':'light',
+                #                     'white-space': 'nowrap',
+                #                     'overflowY': 'hidden',
+                #                     'color': colors['text']})#,
+                ],
+                style={'width': '50%', 'display': 'inline-block'}
+            )
+        ],
+        className = 'double-graph'),
+        html.Br(),
+
+        html.H4(children='Reported Cases by US State/Territory',
+                style={
+                    'textAlign': 'center',
+                    'color': colors['text'],
+                    'font':'Helvetica'
+                }
+                ),
 
-    dcc.Graph(id='cases-by-report-date-bar',
-              figure=cases_by_report_date_bar),
-
-    html.Br(),
-
-    html.Div(children='scroll >>>',
-             style={'textAlign': 'right',
-                    'color':'#b3cde0',
-                    'font': 'Helvetica',
-                    'font-style':'italic'}),
-
-    dash_table.DataTable(id='cases_by_report_date_table',
-                         columns=[{"name": str(i)[:11], "id": i} for i in cases_by_report_date_df.columns],
-                         data=cases_by_report_date_df.to_dict('records'),
-                         style_cell={'textAlign': 'left'},
-                         style_table={'overflowX': 'scroll',
-                                      'backgroundColor': colors['background'],
-                                      'color':colors['background']},
-                         style_header={'backgroundColor': '#b3cde0',
-                                       'fontWeight': 'bold',
-                                       'textAlign': 'center'}
-                         ),
-
-    html.Caption('Data from CDC.gov - Updated at '
-                 + str(datetime.datetime.strftime(datetime.datetime.now(),
-                                                  '%Y-%m-%d %I:%M:%S %p' + ' ET')),
-                 style={'font': 'Helvetica',
-                        'font-style': 'italic',
-                        'font-weight': 'light',
-                        'white-space': 'nowrap',
-                        'overflow': 'hidden',
-                        'color': colors['text']}),
-
-    html.H4(children='Count of Cases in United States by Onset Date',
-            style={
-                'textAlign': 'center',
-                'color': colors['text'],
-                'font':'Helvetica'
-            }
-            ),
+        html.Br(),
+
+        dcc.Graph(id='cases-by-state-chloropleth',
+                  figure=payloads['cases_by_state_chloropleth'],
+                  style={'textAlign': 'center'}),
+
+        html.Br(),
+
+        dash_table.DataTable(id='cases-by-state-dash-table',
+                             columns=[{"name": STATE_COL_MAP.get(i).get('name'),
+                                       "id": STATE_COL_MAP.get(i).get('id')}
+                                      for i in STATE_COLS],
+                             data=[],
+                             **SERVER_SIDE_TABLE_PROPS,
+                             page_size=TABLES['cases-by-state-dash-table']['page_size'],
+                             style_table={'overflowX': 'scroll',
+                                          'backgroundColor':colors['background'],
+                                          'overflowY':'scroll',
+                                          'maxHeight':'330px'},
+                             style_cell={'textAlign':'left'},
+                             style_header={'backgroundColor':'#b3cde0',
+                                           'fontWeight':'bold',
+                                           'textAlign':'center'}),
+
+        html.Caption('Data from CDC.gov - Updated at ' + updated_at,
+                     style={'font': 'Helvetica',
+                            'font-style':'italic',
+                            'font-weight':'light',
+                            'white-space': 'nowrap',
+                            'overflow': 'hidden',
+                            'color': colors['text']}),
+
+        html.H4(children='Total Confirmed Cases of SARS-CoV-2 in United States',
+                style={
+                    'textAlign': 'center',
+                    'color': colors['text'],
+                    'font':'Helvetica'
+                }
+                ),
+
+        dcc.Graph(id='metric-by-date-bar'),
+
+        html.Br(),
+
+        dcc.Graph(id='cases-by-report-date-bar',
+                  figure=payloads['cases_by_report_date_bar']),
+
+        html.Br(),
+
+        html.Div(children='scroll >>>',
+                 style={'textAlign': 'right',
+                        'color':'#b3cde0',
+                        'font': 'Helvetica',
+                        'font-style':'italic'}),
+
+        dash_table.DataTable(id='cases_by_report_date_table',
+                             columns=[{"name": str(i)[:11], "id": i} for i in payloads['cases_by_report_date_columns']],
+                             data=[],
+                             **SERVER_SIDE_TABLE_PROPS,
+                             page_size=TABLES['cases_by_report_date_table']['page_size'],
+                             style_cell={'textAlign': 'left'},
+                             style_table={'overflowX': 'scroll',
+                                          'backgroundColor': colors['background'],
+                                          'color':colors['background']},
+                             style_header={'backgroundColor': '#b3cde0',
+                                           'fontWeight': 'bold',
+                                           'textAlign': 'center'}
+                             ),
+
+        html.Caption('Data from CDC.gov - Updated at ' + updated_at,
+                     style={'font': 'Helvetica',
+                            'font-style': 'italic',
+                            'font-weight': 'light',
+                            'white-space': 'nowrap',
+                            'overflow': 'hidden',
+                            'color': colors['text']}),
+
+        html.H4(children='Count of Cases in United States by Onset Date',
+                style={
+                    'textAlign': 'center',
+                    'color': colors['text'],
+                    'font':'Helvetica'
+                }
+                ),
+
+        dcc.Graph(id='cases-by-onset-date-bar',
+                  figure=payloads['cases_by_onset_date_bar']),
+
+        html.Br(),
+
+        html.Div(children='scroll >>>',
+                 style={'textAlign': 'right',
+                        'color': '#b3cde0',
+                        'font': 'Helvetica',
+                        'font-style': 'italic'}),
+
+        dash_table.DataTable(id='cases_by_onset_date_table',
+                             columns=[{"name": str(i)[:11], "id": i} for i in payloads['cases_by_onset_date_columns']],
+                             data=[],
+                             **SERVER_SIDE_TABLE_PROPS,
+                             page_size=TABLES['cases_by_onset_date_table']['page_size'],
+                             style_table={'overflowX': 'scroll'},
+                             style_cell={'textAlign': 'left'},
+                             style_header={'backgroundColor': '#b3cde0',
+                                           'fontWeight': 'bold',
+                                           'font':'Helvetica',
+                                           'textAlign': 'center'}
+                             ),
+        html.Caption('Data from CDC.gov - Updated at ' + updated_at,
+                     style={'font': 'Helvetica',
+                            'font-style': 'italic',
+                            'font-weight': 'light',
+                            'white-space': 'nowrap',
+                            'overflow': 'hidden',
+                            'color': colors['text']})
+        ],
+        style=dict(padding='0%',
+                   margin='auto',
+                   backgroundColor=colors['background']))
+
+
+# SERVE THE CURRENT SNAPSHOT, NEVER WAITING ON INGESTION
+def serve_layout():
+    payloads = scheduler.snapshot
+    if payloads is None:
+        return html.Div(children=html.H4('Loading the latest data, refresh in a few minutes.',
+                                         style={'textAlign': 'center',
+                                                'color': colors['text'],
+                                                'font': 'Helvetica'}),
+                        style=dict(padding='0%',
+                                   margin='auto',
+                                   backgroundColor=colors['background']))
+    return make_layout(payloads)
+
+
+# built once per snapshot and kept on it, so a new build brings fresh indexes
+def get_table_index(payloads, table_id):
+    from build_dashboard import STATE_COLS
+    from table_index import TableIndex
+
+    indexes = payloads.setdefault('table_indexes', {})
+    if table_id not in indexes:
+        table = TABLES[table_id]
+        columns = payloads[table['columns']] if table['columns'] else STATE_COLS
+        indexes[table_id] = TableIndex.from_records(payloads[table['records']], columns)
+    return indexes[table_id]
+
+
+def register_table_callback(app, table_id):
+    @app.callback(Output(table_id, 'data'),
+                  Output(table_id, 'page_count'),
+                  Input(table_id, 'page_current'),
+                  Input(table_id, 'page_size'),
+                  Input(table_id, 'sort_by'),
+                  Input(table_id, 'filter_query'))
+    def update_table(page_current, page_size, sort_by, filter_query):
+        payloads = scheduler.snapshot
+        if payloads is None:
+            raise PreventUpdate
+        return get_table_index(payloads, table_id).page(page_current, page_size, sort_by, filter_query)
+
+
+# attached to the build's shared snapshot on the first metric callback after each build,
+# or loaded from the county store by builds published without one
+def get_analytics(payloads):
+    from analytics import CountyAnalytics
+    from shared_snapshot import attach_snapshot
+
+    if 'analytics' not in payloads:
+        snapshot = None
+        if payloads.get('shared_snapshot_version'):
+            try:
+                snapshot = attach_snapshot(payloads['shared_snapshot_version'])
+            except OSError:
+                logger.warning('snapshot v' + str(payloads['shared_snapshot_version']) + ' is gone, load the county store')
+        payloads['analytics'] = CountyAnalytics.from_snapshot(snapshot) if snapshot is not None \
+            else CountyAnalytics.from_store(since=payloads['analytics_start'])
+    return payloads['analytics']
+
+
+# the current snapshot, or no update while the first build is still running or a date is cleared
+def current_payloads(*dates):
+    payloads = scheduler.snapshot
+    if payloads is None or 'analytics_start' not in payloads or not all(dates):
+        raise PreventUpdate
+    return payloads
+
+
+def selection_key(metric, window, date, states):
+    return metric, window, str(date)[:10], tuple(sorted(states or []))
+
+
+# the county borders of these states, only theirs go over the wire
+def state_geometry(payloads, states):
+    from geometry import load_state_geometry
+
+    prefixes = [payloads['state_fips_prefixes'][state] for state in states if state in payloads['state_fips_prefixes']]
+    return load_state_geometry(payloads['county_geometry_key'], prefixes)
+
+
+# the state whose counties are shown for a click on the state map, None for a click elsewhere
+def clicked_state(click_data):
+    from reference import state_abbrevs
+
+    points = (click_data or {}).get('points') or [{}]
+    names = {abbrev: name for name, abbrev in state_abbrevs().items()}
+    return names.get(points[0].get('location'))
+
+
+def build_county_chloropleth(payloads, metric, window, date, states):
+    from make_figures import make_metric_county_chloropleth
+
+    analytics = get_analytics(payloads)
+    values_df = analytics.select(metric, window, 'county', start=date[:10], end=date[:10], states=states)
+    return make_metric_county_chloropleth(values_df, state_geometry(payloads, states), analytics.counties,
+                                          metric_label(metric))
+
+
+# one state of the build's county map, over that state's geometry shard
+def build_state_drilldown(payloads, state):
+    from make_figures import make_state_county_chloropleth
+
+    if state not in payloads['state_fips_prefixes']:
+        raise PreventUpdate
+    return make_state_county_chloropleth(payloads['cases_by_county_chloropleth'],
+                                         payloads['state_fips_prefixes'][state],
+                                         state_geometry(payloads, [state]), state)
+
+
+def build_state_chloropleth(payloads, metric, window, date, states):
+    from make_figures import make_metric_state_chloropleth
+
+    values_df = get_analytics(payloads).select(metric, window, 'state', start=date[:10], end=date[:10], states=states)
+    return make_metric_state_chloropleth(values_df, metric_label(metric))
+
+
+def build_metric_bar(payloads, metric, window, start_date, end_date, states):
+    from make_figures import make_metric_by_date_bar
+
+    analytics = get_analytics(payloads)
+    if states:
+        values_df = analytics.select(metric, window, 'state', start=start_date[:10], end=end_date[:10], states=states)
+    else:
+        values_df = analytics.select(metric, window, 'nation', start=start_date[:10], end=end_date[:10])
+    return make_metric_by_date_bar(values_df, metric_label(metric))
+
+
+# the cdc bars keep their data and only zoom to the selected dates
+def build_date_range_bar(payloads, figure_name, start_date, end_date):
+    figure = payloads[figure_name]
+    layout = dict(figure.get('layout', {}))
+    layout['xaxis'] = dict(layout.get('xaxis', {}), range=[start_date[:10], end_date[:10]])
+    return dict(figure, layout=layout)
+
+
+# a click on the state map drills down into that state's county map; the metric controls
+# draw the filtered states, or the clicked one, and never every county at once
+def update_county_chloropleth(metric, window, date, states, click_data):
+    payloads = current_payloads(date)
+    if 'county_geometry_key' not in payloads:
+        # a build from before the geometry was sharded, until the next refresh replaces it
+        raise PreventUpdate
+    state = clicked_state(click_data)
+    if any(t['prop_id'] == 'cases-by-state-chloropleth.clickData' for t in callback_context.triggered):
+        if state is None:
+            raise PreventUpdate
+        return callback_cache.get(payloads['built_at'], ('drilldown', state),
+                                  lambda: build_state_drilldown(payloads, state))
+
+    states = states or ([state] if state else [])
+    if not states:
+        return COUNTY_MAP_PROMPT
+    return callback_cache.get(payloads['built_at'], ('county',) + selection_key(metric, window, date, states),
+                              lambda: build_county_chloropleth(payloads, metric, window, date, states))
+
+
+def update_state_chloropleth(metric, window, date, states):
+    payloads = current_payloads(date)
+    return callback_cache.get(payloads['built_at'], ('state',) + selection_key(metric, window, date, states),
+                              lambda: build_state_chloropleth(payloads, metric, window, date, states))
+
+
+def update_metric_bar(metric, window, start_date, end_date, states):
+    payloads = current_payloads(start_date, end_date)
+    key = ('bar', start_date[:10]) + selection_key(metric, window, end_date, states)
+    return callback_cache.get(payloads['built_at'], key,
+                              lambda: build_metric_bar(payloads, metric, window, start_date, end_date, states))
+
+
+def register_date_range_callback(app, graph_id, figure_name):
+    @app.callback(Output(graph_id, 'figure'),
+                  Input('date-range', 'start_date'),
+                  Input('date-range', 'end_date'),
+                  prevent_initial_call=True)
+    def update_date_range_bar(start_date, end_date):
+        payloads = current_payloads(start_date, end_date)
+        return callback_cache.get(payloads['built_at'], (figure_name, start_date[:10], end_date[:10]),
+                                  lambda: build_date_range_bar(payloads, figure_name, start_date, end_date))
+
+
+# metric controls -> county map, state map and metric bar
+def register_metric_callbacks(app):
+    app.callback(Output('cases_by_county_chloropleth', 'figure'),
+                 Input('metric-dropdown', 'value'),
+                 Input('window-radio', 'value'),
+                 Input('date-range', 'end_date'),
+                 Input('state-filter', 'value'),
+                 Input('cases-by-state-chloropleth', 'clickData'),
+                 prevent_initial_call=True)(update_county_chloropleth)
+    app.callback(Output('cases-by-state-chloropleth', 'figure'),
+                 Input('metric-dropdown', 'value'),
+                 Input('window-radio', 'value'),
+                 Input('date-range', 'end_date'),
+                 Input('state-filter', 'value'),
+                 prevent_initial_call=True)(update_state_chloropleth)
+    app.callback(Output('metric-by-date-bar', 'figure'),
+                 Input('metric-dropdown', 'value'),
+                 Input('window-radio', 'value'),
+                 Input('date-range', 'start_date'),
+                 Input('date-range', 'end_date'),
+                 Input('state-filter', 'value'))(update_metric_bar)
+
+
+# threads don't survive fork, so each serving process starts its own refresh on its first request
+def start_refresh():
+    scheduler.start()
+
+
+def refresh_status():
+    return flask.jsonify(scheduler.status())
+
+
+# ready once this worker serves a build and runs its own refresh; answers straight away while loading
+def ready():
+    status = scheduler.status()
+    status['ready'] = scheduler.snapshot is not None and (scheduler.running() or not refresh_enabled)
+    return flask.jsonify(status), 200 if status['ready'] else 503
+
+
+# APP FACTORY: SERVE snapshot, OR THE CACHED BUILD ONCE LOADED, AND REFRESH IN THE BACKGROUND
+# one app per process, the callbacks read the module's scheduler. with defer_refresh the refresh
+# starts on the first request instead, in whichever process serves it
+def create_app(snapshot=None, refresh=True, defer_refresh=False):
+    global app, application, scheduler, refresh_enabled
+
+    # a new app replaces the previous one, whose refresh stops with it
+    if globals().get('scheduler') is not None:
+        scheduler.stop()
+
+    scheduler = RefreshScheduler(snapshot=snapshot)
+    refresh_enabled = refresh
+    if refresh and not defer_refresh:
+        logger.info('START REFRESH SCHEDULER')
+        scheduler.start()
+
+    app = dash.Dash(__name__,
+                    external_stylesheets=external_stylesheets,
+                    suppress_callback_exceptions=True)
+    application = app.server
+    app.layout = serve_layout
+
+    for table_id in TABLES:
+        register_table_callback(app, table_id)
+    register_metric_callbacks(app)
+    for graph_id, figure_name in [('cases-by-report-date-bar', 'cases_by_report_date_bar'),
+                                  ('cases-by-onset-date-bar', 'cases_by_onset_date_bar')]:
+        register_date_range_callback(app, graph_id, figure_name)
+
+    if refresh:
+        application.before_request(start_refresh)
+
+    application.add_url_rule('/refresh-status', 'refresh_status', refresh_status)
+    application.add_url_rule('/ready', 'ready', ready)
+    # pipeline stage timings and callback latency, before the http cache so 304s are timed too
+    register_metrics(application)
+    # the layout and callbacks only change with the build they are served from
+    register_http_cache(application, lambda: scheduler.snapshot['built_at'] if scheduler.snapshot else None)
+    return app
+
+
+# wsgi servers look up application:application, which builds the default app on first access.
+# with --preload that is the gunicorn master, so its refresh waits for a worker's first request
+def __getattr__(name):
+    if name in ('app', 'application', 'scheduler'):
+        create_app(defer_refresh=True)
+        return globals()[name]
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
 
-    dcc.Graph(id='cases-by-onset-date-bar',
-              figure=cases_by_onset_date_bar),
-
-    html.Br(),
-
-    html.Div(children='scroll >>>',
-             style={'textAlign': 'right',
-                    'color': '#b3cde0',
-                    'font': 'Helvetica',
-                    'font-style': 'italic'}),
-
-    dash_table.DataTable(id='cases_by_onset_date_table',
-                         columns=[{"name": str(i)[:11], "id": i} for i in cases_by_onset_date_df.columns],
-                         data=cases_by_onset_date_df.to_dict('records'),
-                         style_table={'overflowX': 'scroll'},
-                         style_cell={'textAlign': 'left'},
-                         style_header={'backgroundColor': '#b3cde0',
-                                       'fontWeight': 'bold',
-                                       'font':'Helvetica',
-                                       'textAlign': 'center'}
-                         ),
-    html.Caption('Data from CDC.gov - Updated at '
-                 + str(datetime.datetime.strftime(datetime.datetime.now(),
-                                                    '%Y-%m-%d %I:%M:%S %p' + ' ET')),
-                 style={'font': 'Helvetica',
-                        'font-style': 'italic',
-                        'font-weight': 'light',
-                        'white-space': 'nowrap',
-                        'overflow': 'hidden',
-                        'color': colors['text']})
-    ],
-    style=dict(padding='0%',
-               margin='auto',
-               backgroundColor=colors['background']))
 
 if __name__ == '__main__':
-    app.run_server(debug=False, port=8080)
+    create_app().run_server(debug=False, port=8080)
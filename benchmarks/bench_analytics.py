@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import GEOGRAPHIES, METRICS, ROLLING_WINDOWS, CountyAnalytics
+from pull_updated_data import NYC_FIPS, calculate_counties_metrics, expand_nyc_fips
+from synthetic import make_counties_df
+
+
+# the same metrics as pandas chains over a gap-free series, one group at a time
+def reference(counties_df, metric, window, geography):
+    count, measure = METRICS[metric]
+    df = counties_df.astype({'fips': str, 'state': str, 'cases': 'float64', 'deaths': 'float64'})
+    if geography == 'county':
+        df = df.assign(geo=df['fips'])
+        popest = df.drop_duplicates('fips').set_index('fips')['popest']
+    else:
+        df = df[~df['fips'].isin(NYC_FIPS[1:])]
+        population = df.drop_duplicates('fips')
+        df = df.assign(geo=df['state'] if geography == 'state' else 'United States')
+        popest = population.groupby('state')['popest'].sum() if geography == 'state' \
+            else pd.Series({'United States': population['popest'].sum()})
+    df = df.groupby(['geo', 'date'])[[count]].sum().reset_index().sort_values(['geo', 'date'])
+
+    by_geo = df.groupby('geo')[count]
+    new = (df[count] - by_geo.shift(1)).clip(lower=0)
+    rolling_sum = new.groupby(df['geo']).rolling(window).sum().droplevel(0)
+    values = {
+        'new': new,
+        'sum': rolling_sum,
+        'mean': rolling_sum / window,
+        'per100k': rolling_sum / window / df['geo'].map(popest) * 100000,
+        'growth': rolling_sum / rolling_sum.groupby(df['geo']).shift(window) - 1,
+        'doubling_time': window * np.log(2) / np.log(df[count] / by_geo.shift(window))
+    }[measure]
+    values = values.replace([np.inf, -np.inf], np.nan)
+    if measure == 'doubling_time':
+        values[df[count] / by_geo.shift(window) <= 1] = np.nan
+    return values.to_numpy()
+
+
+# run from the project root: python benchmarks/bench_analytics.py
+def main():
+    parser = argparse.ArgumentParser(description='county analytics: agreement with pandas chains, cold and memoized')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    fixture = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=40, n_days=70)))
+    analytics = CountyAnalytics(fixture)
+    for geography in GEOGRAPHIES:
+        for metric in METRICS:
+            for window in ROLLING_WINDOWS:
+                actual = analytics.metric(metric, window, geography)['value'].to_numpy()
+                np.testing.assert_allclose(actual, reference(fixture, metric, window, geography), rtol=1e-9,
+                                           err_msg=metric + ' ' + str(window) + ' ' + geography)
+    print('every metric, window and geography matches the pandas reference')
+
+    counties_df = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=args.counties,
+                                                                              n_days=args.days)))
+    analytics = CountyAnalytics(counties_df)
+    print('%d county rows' % len(counties_df))
+    print('%-24s %-8s %6s %10s %10s' % ('metric', 'geo', 'window', 'cold', 'memoized'))
+    for metric, window, geography in [('cases_per100k', 7, 'county'), ('deaths_growth', 14, 'county'),
+                                      ('cases_doubling_time', 28, 'state'), ('new_deaths', 7, 'nation')]:
+        start = time.perf_counter()
+        analytics.metric(metric, window, geography)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        analytics.metric(metric, window, geography)
+        warm = time.perf_counter() - start
+        print('%-24s %-8s %6d %9.4fs %9.6fs' % (metric, geography, window, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import METRICS, ROLLING_WINDOWS
+from offline_app import start_offline_app, stop_offline_app
+
+# graph id -> the control inputs its callback reads
+CALLBACK_INPUTS = {
+    'cases_by_county_chloropleth': [('metric-dropdown', 'value'), ('window-radio', 'value'),
+                                    ('date-range', 'end_date'), ('state-filter', 'value'),
+                                    ('cases-by-state-chloropleth', 'clickData')],
+    'cases-by-state-chloropleth': [('metric-dropdown', 'value'), ('window-radio', 'value'),
+                                   ('date-range', 'end_date'), ('state-filter', 'value')],
+    'metric-by-date-bar': [('metric-dropdown', 'value'), ('window-radio', 'value'),
+                           ('date-range', 'start_date'), ('date-range', 'end_date'), ('state-filter', 'value')],
+    'cases-by-report-date-bar': [('date-range', 'start_date'), ('date-range', 'end_date')],
+}
+
+
+# the body dash's renderer posts to /_dash-update-component for one output
+def update_request(graph_id, selection):
+    inputs = [{'id': id, 'property': prop, 'value': selection.get((id, prop))} for id, prop in CALLBACK_INPUTS[graph_id]]
+    return {'output': graph_id + '.figure',
+            'outputs': {'id': graph_id, 'property': 'figure'},
+            'inputs': inputs,
+            'changedPropIds': ['metric-dropdown.value'],
+            'state': []}
+
+
+def make_selections(payloads, n, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = [str(d.date()) for d in np.arange(np.datetime64(payloads['analytics_start']),
+                                               np.datetime64(payloads['analytics_end']) + 1).astype('M8[ms]').tolist()]
+    states = payloads['analytics_states']
+    selections = []
+    for _ in range(n):
+        start, end = sorted(rng.choice(len(dates), 2, replace=False))
+        selections.append({('metric-dropdown', 'value'): str(rng.choice(sorted(METRICS))),
+                           ('window-radio', 'value'): int(rng.choice(ROLLING_WINDOWS)),
+                           ('date-range', 'start_date'): dates[start],
+                           ('date-range', 'end_date'): dates[end],
+                           ('state-filter', 'value'): sorted(rng.choice(states, rng.integers(0, 3), replace=False).tolist())})
+    return selections
+
+
+def run(client, requests):
+    timings = []
+    for body in requests:
+        start = time.perf_counter()
+        response = client.post('/_dash-update-component', json=body)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return np.array(timings) * 1000
+
+
+def report(label, timings):
+    print('%-6s %4d requests  p50 %8.2f ms  p99 %8.2f ms' % (label, len(timings),
+                                                            np.percentile(timings, 50), np.percentile(timings, 99)))
+
+
+# run from the project root: python benchmarks/bench_callbacks.py
+def main():
+    parser = argparse.ArgumentParser(description='load test the dashboard control callbacks through the flask test client')
+    parser.add_argument('--counties', type=int, default=200)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--selections', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    application, server, work_dir = start_offline_app(n_counties=args.counties, n_days=args.days)
+    try:
+        client = application.application.test_client()
+        selections = make_selections(application.scheduler.snapshot, args.selections)
+        requests = [update_request(graph_id, selection) for selection in selections for graph_id in CALLBACK_INPUTS]
+
+        # the first request also loads the analytics frame from the county store
+        application.callback_cache.clear()
+        application.scheduler.snapshot.pop('analytics', None)
+        start = time.perf_counter()
+        run(client, requests[:1])
+        print('analytics load and first callback: %.3fs' % (time.perf_counter() - start))
+
+        application.callback_cache.clear()
+        cold = run(client, requests)
+        warm = run(client, requests * args.repeats)
+        report('cold', cold)
+        report('warm', warm)
+        print('cache', application.callback_cache.stats())
+
+        assert np.percentile(warm, 50) < np.percentile(cold, 50), 'warm cache is not faster than cold'
+    finally:
+        stop_offline_app(application, server, work_dir)
+
+
+if __name__ == '__main__':
+    main()
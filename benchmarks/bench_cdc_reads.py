@@ -0,0 +1,103 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from db import connect
+from pull_updated_data import pull_table
+from update_db import CDC_TABLE_SCHEMA, migrate_snapshot_tables
+
+# the original reader: every column of a per-day table, sliced and renamed by position
+LEGACY_SLICE = {'cdc_cases_by_state': [0, 1, 2, 3, 4],
+                'cdc_cases_by_report_date': [1, 2],
+                'cdc_cases_by_onset_date': [1, 2]}
+LEGACY_NAMES = {'cdc_cases_by_state': {0: 'state', 1: 'range', 2: 'n_cases', 3: 'community_spread', 4: 'url'},
+                'cdc_cases_by_report_date': {1: 'date', 2: 'n_cases'},
+                'cdc_cases_by_onset_date': {1: 'date', 2: 'n_cases'}}
+LEGACY_INDEX = {'cdc_cases_by_state': 'state',
+                'cdc_cases_by_report_date': 'date',
+                'cdc_cases_by_onset_date': 'date'}
+
+
+def legacy_pull_table(conn, name, stamp):
+    c = conn.cursor()
+    c.execute('SELECT * FROM ' + name + stamp)
+    return pd.DataFrame(c.fetchall())[LEGACY_SLICE[name]].rename(columns=LEGACY_NAMES[name]) \
+        .set_index(LEGACY_INDEX[name], drop=True)
+
+
+def legacy_count(conn, name, stamp):
+    c = conn.cursor()
+    c.execute('SELECT * FROM ' + name + stamp)
+    return len(pd.DataFrame(c.fetchall()))
+
+
+def count(conn, name, snapshot_date):
+    return conn.execute('SELECT COUNT(*) FROM ' + name + ' WHERE snapshot_date = ?', (snapshot_date,)).fetchone()[0]
+
+
+def timed(f, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats
+
+
+# run from the project root: python benchmarks/bench_cdc_reads.py
+def main():
+    parser = argparse.ArgumentParser(description='cdc snapshot reads: per-day select * and fetchall vs the typed read layer')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, '2019-nCoV-CDC.db')
+        shutil.copy(os.path.join(REPO_ROOT, '2019-nCoV-CDC.db'), db_path)
+
+        legacy_conn = sqlite3.connect(db_path)
+        stamps = sorted({name[-8:] for (name,) in legacy_conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'cdc_cases_by_state[0-9]*'")})
+        reads = [(name, stamp, stamp[:4] + '-' + stamp[4:6] + '-' + stamp[6:])
+                 for stamp in stamps for name in CDC_TABLE_SCHEMA]
+
+        # the legacy tables stay in place so both paths read the same snapshots
+        conn = connect(db_path)
+        migrate_snapshot_tables(conn, drop=False)
+
+        mislabelled = 0
+        for name, stamp, snapshot_date in reads:
+            actual = pull_table(conn, name, snapshot_date=snapshot_date)
+            assert count(conn, name, snapshot_date) == legacy_count(legacy_conn, name, stamp)
+            # a few early snapshots were saved with their columns in another order,
+            # which the positional reader mislabels and the read layer selects by name
+            legacy_cols = [row[1] for row in legacy_conn.execute('PRAGMA table_info(' + name + stamp + ')')]
+            if legacy_cols[-len(CDC_TABLE_SCHEMA[name]):] != list(CDC_TABLE_SCHEMA[name]):
+                mislabelled += 1
+                continue
+            expected = legacy_pull_table(legacy_conn, name, stamp)
+            pd.testing.assert_frame_equal(actual.sort_index(), expected.sort_index(), check_dtype=False)
+        print('%d snapshot reads match the legacy reader, %d it mislabels by position' % (len(reads) - mislabelled, mislabelled))
+
+        legacy_read = timed(lambda: [legacy_pull_table(legacy_conn, name, stamp) for name, stamp, _ in reads], args.repeats)
+        read = timed(lambda: [pull_table(conn, name, snapshot_date=d) for name, _, d in reads], args.repeats)
+        legacy_counts = timed(lambda: [legacy_count(legacy_conn, name, stamp) for name, stamp, _ in reads], args.repeats)
+        counts = timed(lambda: [count(conn, name, d) for name, _, d in reads], args.repeats)
+
+        print('journal mode %s, mmap_size %d, cache_size %d' % (conn.execute('PRAGMA journal_mode').fetchone()[0],
+                                                                conn.execute('PRAGMA mmap_size').fetchone()[0],
+                                                                conn.execute('PRAGMA cache_size').fetchone()[0]))
+        print('reads  select * + fetchall: %8.2f ms   typed columns:  %8.2f ms' % (legacy_read * 1000, read * 1000))
+        print('counts select * + fetchall: %8.2f ms   COUNT(*):       %8.2f ms' % (legacy_counts * 1000, counts * 1000))
+        legacy_conn.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
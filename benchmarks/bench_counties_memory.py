@@ -0,0 +1,124 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch import FetchResult
+from instrument import peak_rss_mb, reset_peak_rss, rss_mb
+from pull_updated_data import COUNTIES_COLS, NYC_FIPS, ROLLING_WINDOW, get_counties_df
+from synthetic import make_counties_df
+
+# documented target: on a full-history-sized series the compact pipeline needs at most
+# half the peak memory of the object-dtype one
+MEMORY_TARGET = 0.5
+
+
+# the pipeline as it was before compact dtypes: object strings, float64 and a merge per stage
+def legacy_counties_df(content):
+    counties_df = pd.read_csv(io.BytesIO(content), dtype={'fips': 'str'})
+    is_nyc = (counties_df['county'] == 'New York City').values
+    nyc_df = counties_df.loc[is_nyc, COUNTIES_COLS]
+    nyc_df = nyc_df.iloc[np.repeat(np.arange(len(nyc_df)), len(NYC_FIPS))].reset_index(drop=True)
+    nyc_df['fips'] = np.tile(NYC_FIPS, len(nyc_df) // len(NYC_FIPS))
+    counties_df = pd.concat([counties_df[~is_nyc], nyc_df])
+
+    counties_df = counties_df.sort_values(by='date', ascending=True)
+    counties_df['cases_lagged'] = counties_df.groupby('fips')['cases'].shift(1)
+    counties_df['new_cases'] = counties_df['cases'] - counties_df['cases_lagged']
+    counties_df.loc[counties_df['new_cases'] < 0, 'new_cases'] = 0
+    newcases_rolling = (counties_df.set_index(['fips', 'date']).drop(columns=['county', 'state'])
+                        .groupby('fips').rolling(window=ROLLING_WINDOW).mean()['new_cases']
+                        .rename('new_cases_rolling').droplevel(0))
+    counties_df = counties_df.merge(pd.DataFrame(newcases_rolling), on=['fips', 'date'], how='left')
+    popest = pd.read_excel('popest2019_nyc.xlsx', dtype={'fips': str, 'county_fips': str})[['fips', 'popest']]
+    counties_df = counties_df.merge(popest, on='fips')
+    counties_df['new_cases_per100k'] = (counties_df['new_cases_rolling'] / counties_df['popest']) * 100000
+    return counties_df
+
+
+# measured in a fresh interpreter per pipeline, so each peak starts from the same baseline.
+# the peak restarts at the current rss where linux allows it, so reading the file doesn't count
+def measure(pipeline, csv_path):
+    with open(csv_path, 'rb') as f:
+        source = FetchResult(csv_path, f.read(), True)
+    baseline = rss_mb() if reset_peak_rss() else peak_rss_mb()
+    start = time.perf_counter()
+    counties_df = legacy_counties_df(source.content) if pipeline == 'legacy' else get_counties_df(source)
+    seconds = time.perf_counter() - start
+    print(json.dumps({'peak_mb': peak_rss_mb() - baseline,
+                      'frame_mb': counties_df.memory_usage(deep=True).sum() / 1024 ** 2,
+                      'seconds': seconds}))
+
+
+# each step runs in its own interpreter: a child inherits the peak rss of its parent
+# at fork, so the parent stays small and never holds a frame itself
+def run_step(*step_args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + list(step_args),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# write the synthetic history and check both pipelines give the same rows and
+# values, up to float32 precision
+def prepare(n_counties, n_days, csv_path):
+    raw_df = make_counties_df(n_counties=n_counties, n_days=n_days)
+    raw_df.to_csv(csv_path, index=False)
+
+    with open(csv_path, 'rb') as f:
+        content = f.read()
+    expected = legacy_counties_df(content)
+    actual = get_counties_df(FetchResult(csv_path, content, True))
+    key = ['fips', 'date']
+    expected = expected.sort_values(key).reset_index(drop=True)
+    actual = actual.astype({'county': str, 'state': str, 'fips': str})
+    actual['date'] = actual['date'].dt.strftime('%Y-%m-%d')
+    actual = actual.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected[actual.columns], check_dtype=False, rtol=1e-5)
+    print(json.dumps({'rows': len(raw_df)}))
+
+
+# run from the project root: python benchmarks/bench_counties_memory.py
+def main():
+    parser = argparse.ArgumentParser(description='peak memory of the county pipeline, object vs compact dtypes')
+    # about the size of the full NYT county history
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=830)
+    parser.add_argument('--measure', nargs=2, metavar=('PIPELINE', 'CSV'), help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', metavar='CSV', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+    if args.prepare:
+        prepare(args.counties, args.days, args.prepare)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'us-counties.csv')
+        n_rows = run_step('--prepare', csv_path, '--counties', str(args.counties), '--days', str(args.days))['rows']
+        print('compact series matches object-dtype series')
+        legacy = run_step('--measure', 'legacy', csv_path)
+        compact = run_step('--measure', 'compact', csv_path)
+
+    print('%d rows' % n_rows)
+    for label, result in [('object dtypes', legacy), ('compact dtypes', compact)]:
+        print('%-15s peak +%7.1f MB, result frame %6.1f MB, %.2fs'
+              % (label, result['peak_mb'], result['frame_mb'], result['seconds']))
+
+    ratio = compact['peak_mb'] / legacy['peak_mb']
+    print('peak memory ratio %.2f (target <= %.2f)' % (ratio, MEMORY_TARGET))
+    assert ratio <= MEMORY_TARGET, 'compact pipeline peak memory above target'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import json
+import os
+import sys
+
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_figures import make_cases_by_county_chloropleth
+from pull_updated_data import expand_nyc_fips, calculate_counties_metrics, make_current_counties_df
+from synthetic import make_counties_df, make_counties_geojson
+
+
+# run from the project root: python benchmarks/bench_county_frames.py
+# county map payload per animated day against the geometry; tests/test_county_frames.py
+# checks it grows by one day of values per day, never by the geometry
+def main():
+    parser = argparse.ArgumentParser(description='county map payload bytes vs animated days')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--vertices-per-edge', type=int, default=20)
+    parser.add_argument('--days', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    counties_df = calculate_counties_metrics(
+        expand_nyc_fips(make_counties_df(n_counties=args.counties, n_days=max(args.days) + 7)))
+    current_counties_df = make_current_counties_df(counties_df)
+    counties = make_counties_geojson(counties_df['fips'].unique(), vertices_per_edge=args.vertices_per_edge)
+    geometry_bytes = len(json.dumps(counties))
+
+    sizes = []
+    print('%6s %14s %14s' % ('days', 'figure bytes', 'bytes/day'))
+    for n_days in args.days:
+        figure = make_cases_by_county_chloropleth(counties_df, current_counties_df, counties, n_days=n_days)
+        sizes.append(len(pio.to_json(figure, validate=False)))
+        per_day = (sizes[-1] - sizes[0]) / (n_days - args.days[0]) if n_days != args.days[0] else float('nan')
+        print('%6d %14d %14.0f' % (n_days, sizes[-1], per_day))
+
+    per_day = (sizes[-1] - sizes[0]) / (args.days[-1] - args.days[0])
+    print('geometry bytes: %d, bytes per animated day: %.0f' % (geometry_bytes, per_day))
+
+
+if __name__ == '__main__':
+    main()
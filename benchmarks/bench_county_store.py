@@ -0,0 +1,77 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import county_store
+from pull_updated_data import COUNTIES_TABLE, calculate_counties_metrics, expand_nyc_fips, get_counties_df, read_counties_df
+from synthetic import make_counties_df
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def frame_bytes(df):
+    return df.memory_usage(deep=True).sum()
+
+
+# run from the project root: python benchmarks/bench_county_store.py
+def main():
+    parser = argparse.ArgumentParser(description='county series warm start: csv, sqlite and parquet store reads')
+    parser.add_argument('--counties', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--working-days', type=int, default=30)
+    args = parser.parse_args()
+
+    raw_df = make_counties_df(n_counties=args.counties, n_days=args.days)
+    counties_df = calculate_counties_metrics(expand_nyc_fips(raw_df))
+    last_day = pd.Timestamp(counties_df['date'].max())
+    since = last_day - pd.Timedelta(days=args.working_days - 1)
+    state = counties_df['state'].iloc[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'us-counties.csv')
+        raw_df.to_csv(csv_path, index=False)
+        conn = sqlite3.connect(os.path.join(tmp, 'counties.db'))
+        counties_df.to_sql(COUNTIES_TABLE, conn, index=False)
+        county_store.COUNTY_STORE_DIR = os.path.join(tmp, 'county_store')
+        county_store.rebuild_county_store(conn, COUNTIES_TABLE)
+
+        results = [
+            ('csv parse + metrics', timed(lambda: get_counties_df(csv_path))),
+            ('sqlite full table', timed(lambda: read_counties_df(conn))),
+            ('store full series', timed(lambda: county_store.load_counties_df())),
+            ('store last %d days' % args.working_days,
+             timed(lambda: county_store.load_counties_df(since=since))),
+            ('store one state', timed(lambda: county_store.load_counties_df(states=[state]))),
+            ('store working set', timed(lambda: county_store.load_counties_df(
+                columns=['date', 'county', 'state', 'fips', 'deaths', 'new_cases_per100k'], since=since)))
+        ]
+        store_bytes = sum(os.path.getsize(os.path.join(root, name))
+                          for root, _, names in os.walk(county_store.COUNTY_STORE_DIR) for name in names)
+        conn.close()
+
+    full_df = results[2][1][1]
+    assert len(full_df) == len(counties_df)
+    assert str(full_df['date'].dtype) == 'datetime64[ns]'
+    assert str(full_df['county'].dtype) == 'category'
+    assert full_df['date'].min() >= pd.Timestamp(counties_df['date'].min())
+    assert results[3][1][1]['date'].min() >= since
+    assert set(results[4][1][1]['state']) == {state}
+
+    print('%d rows, store on disk %.1f MB' % (len(counties_df), store_bytes / 1e6))
+    for label, (seconds, df) in results:
+        print('%-22s %7.3fs %9d rows %8.1f MB in memory' % (label, seconds, len(df), frame_bytes(df) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry
+from bench_callbacks import update_request
+from offline_app import start_offline_app, stop_offline_app
+from reference import state_abbrevs
+
+
+def selection_for(payloads, states=(), click_data=None):
+    return {('metric-dropdown', 'value'): 'cases_per100k',
+            ('window-radio', 'value'): 7,
+            ('date-range', 'end_date'): payloads['analytics_end'],
+            ('state-filter', 'value'): list(states),
+            ('cases-by-state-chloropleth', 'clickData'): click_data}
+
+
+def click_request(payloads, abbrev):
+    body = update_request('cases_by_county_chloropleth', selection_for(payloads, click_data={'points': [{'location': abbrev}]}))
+    body['changedPropIds'] = ['cases-by-state-chloropleth.clickData']
+    return body
+
+
+# milliseconds, the figure and its size raw and gzipped, as the browser receives it
+def post(client, body):
+    start = time.perf_counter()
+    response = client.post('/_dash-update-component', json=body)
+    ms = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, response.status_code
+    return ms, response.get_json()['response']['cases_by_county_chloropleth']['figure'], \
+        len(response.data), len(gzip.compress(response.data))
+
+
+# run from the project root: python benchmarks/bench_drilldown.py
+def main():
+    parser = argparse.ArgumentParser(description='per-state county drill-down against the all-counties map')
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=60)
+    args = parser.parse_args()
+
+    application, server, work_dir = start_offline_app(n_counties=args.counties, n_days=args.days)
+    try:
+        client = application.application.test_client()
+        payloads = application.scheduler.snapshot
+        prefixes = payloads['state_fips_prefixes']
+        abbrevs = {state: abbrev for state, abbrev in state_abbrevs().items() if state in prefixes}
+
+        # first paint: the state map only, the layout carries no county geometry
+        layout = client.get('/_dash-layout').data
+        assert b'"geojson"' not in layout
+        print('layout %d bytes (%d gzipped), no county geometry' % (len(layout), len(gzip.compress(layout))))
+
+        # the all-counties map as the layout shipped it before: the build's map over every shard
+        national = dict(payloads['cases_by_county_chloropleth'])
+        national['data'] = [dict(national['data'][0],
+                                 geojson=geometry.load_state_geometry(payloads['county_geometry_key'], prefixes.values()))]
+        national_text = json.dumps(national).encode()
+        national_bytes, national_gzip = len(national_text), len(gzip.compress(national_text))
+        print('all-counties map %d bytes (%d gzipped), %d counties'
+              % (national_bytes, national_gzip, len(national['data'][0]['geojson']['features'])))
+
+        # the all-counties metric map, drawn for every state as the empty state filter did
+        application.callback_cache.clear()
+        all_states = update_request('cases_by_county_chloropleth', selection_for(payloads, states=sorted(prefixes)))
+        metric_ms, _, metric_bytes, _ = post(client, all_states)
+        print('all-counties metric map callback %.1f ms, %d bytes' % (metric_ms, metric_bytes))
+
+        # every state drilled into cold (shards not loaded, nothing memoized), then again memoized
+        application.callback_cache.clear()
+        geometry._shards.clear()
+        cold, warm, sizes, gzip_sizes = [], [], [], []
+        for state, abbrev in sorted(abbrevs.items()):
+            ms, figure, n_bytes, n_gzip = post(client, click_request(payloads, abbrev))
+            locations = figure['data'][0]['locations']
+            assert locations and all(str(fips).startswith(prefixes[state]) for fips in locations), state
+            assert {f['id'] for f in figure['data'][0]['geojson']['features']} >= set(locations), state
+            assert all(set(frame['data'][0]['locations']) <= set(locations) for frame in figure['frames']), state
+            cold.append(ms)
+            sizes.append(n_bytes)
+            gzip_sizes.append(n_gzip)
+        for state, abbrev in sorted(abbrevs.items()):
+            warm.append(post(client, click_request(payloads, abbrev))[0])
+    finally:
+        stop_offline_app(application, server, work_dir)
+
+    print('%d states drilled into' % len(sizes))
+    print('%-10s %10s %10s %10s' % ('', 'median', 'max', 'of all'))
+    print('%-10s %10d %10d %9.1f%%' % ('bytes', np.median(sizes), max(sizes), 100 * np.median(sizes) / national_bytes))
+    print('%-10s %10d %10d %9.1f%%' % ('gzipped', np.median(gzip_sizes), max(gzip_sizes),
+                                       100 * np.median(gzip_sizes) / national_gzip))
+    print('%-10s %8.1f ms %7.1f ms' % ('cold', np.median(cold), max(cold)))
+    print('%-10s %8.1f ms %7.1f ms' % ('memoized', np.median(warm), max(warm)))
+
+    assert np.median(sizes) < 0.1 * national_bytes, 'a state drill-down is not a small fraction of the national map'
+    assert max(sizes) < national_bytes
+    assert np.median(cold) < metric_ms, 'a state drill-down is slower than the all-counties map'
+    assert np.median(warm) < np.median(cold), 'memoized drill-downs are not faster'
+
+
+if __name__ == '__main__':
+    main()
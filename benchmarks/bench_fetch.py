@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetch
+from http_standin import StandinServer
+from synthetic import make_cdc_payloads, make_counties_df, make_counties_geojson
+
+
+# the sequential downloads update_db, get_counties_df and get_counties_geojson used to make
+def fetch_sequential(urls):
+    cdc = [requests.get(urls[name]).text for name in ['cases_by_state', 'cases_by_report_date', 'cases_by_onset_date']]
+    counties_df = pd.read_csv(urls['counties'], dtype={'fips': 'str'})
+    with urlopen(urls['counties_geojson']) as response:
+        counties = json.load(response)
+    return cdc, counties_df, counties
+
+
+# run from the project root: python benchmarks/bench_fetch.py
+def main():
+    parser = argparse.ArgumentParser(description='sequential vs pooled concurrent source downloads')
+    parser.add_argument('--delay', type=float, default=0.25, help='simulated per-request latency, seconds')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=120)
+    args = parser.parse_args()
+
+    counties_df = make_counties_df(n_counties=args.counties, n_days=args.days)
+    payloads = {'/' + name + '.json': body for name, body in make_cdc_payloads().items()}
+    payloads['/us-counties.csv'] = counties_df.to_csv(index=False).encode()
+    payloads['/counties.geojson'] = json.dumps(make_counties_geojson(counties_df['fips'].dropna().unique())).encode()
+
+    fetch.FETCH_CACHE_DIR = tempfile.mkdtemp()
+    try:
+        with StandinServer(payloads, delay=args.delay) as server:
+            urls = {'cases_by_state': server.url('/cases_by_state.json'),
+                    'cases_by_report_date': server.url('/cases_by_report_date.json'),
+                    'cases_by_onset_date': server.url('/cases_by_onset_date.json'),
+                    'counties': server.url('/us-counties.csv'),
+                    'counties_geojson': server.url('/counties.geojson')}
+            sources = {name: (url, fetch.DEFAULT_TIMEOUT) for name, url in urls.items()}
+
+            start = time.perf_counter()
+            fetch_sequential(urls)
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cold = fetch.fetch_all(sources)
+            concurrent = time.perf_counter() - start
+            assert all(result.changed for result in cold.values())
+
+            # nothing ingested yet: the sources come back in full until their results are committed
+            assert all(result.changed for result in fetch.fetch_all(sources).values())
+            for result in cold.values():
+                fetch.commit_fetched(result)
+
+            start = time.perf_counter()
+            warm = fetch.fetch_all(sources)
+            conditional = time.perf_counter() - start
+            assert not any(result.changed for result in warm.values())
+            assert all(warm[name].content == cold[name].content for name in sources)
+    finally:
+        shutil.rmtree(fetch.FETCH_CACHE_DIR)
+
+    print('payload bytes:              %d' % sum(len(body) for body in payloads.values()))
+    print('sequential, no session:     %.3fs' % sequential)
+    print('concurrent, pooled session: %.3fs' % concurrent)
+    print('concurrent, all 304:        %.3fs' % conditional)
+
+
+if __name__ == '__main__':
+    main()
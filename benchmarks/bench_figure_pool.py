@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from figure_pool import figure_json, get_figure_pool, shutdown_figure_pool
+from make_figures import make_cases_by_county_chloropleth, make_cases_by_date_bar, make_cases_by_state_chloropleth
+from pull_updated_data import calculate_counties_metrics, expand_nyc_fips, make_current_counties_df
+from reference import state_abbrevs
+from synthetic import make_counties_df, make_counties_geojson
+
+
+# the cdc frames as build_dashboard pulls them from the database
+def make_cdc_frames(n_days=300, seed=0):
+    rng = np.random.default_rng(seed)
+    states = sorted(state_abbrevs())
+    cases_by_state_df = pd.DataFrame({'state': states,
+                                      'n_cases': rng.integers(0, 100000, len(states)).astype(float),
+                                      'range': '1001 to 5000',
+                                      'community_spread': 'Yes'})
+    dates = pd.date_range('2020-01-22', periods=n_days).strftime('%Y-%m-%d %H:%M:%S')
+    by_date = [pd.DataFrame({'n_cases': rng.integers(0, 50000, n_days)}, index=pd.Index(dates, name='date')).transpose()
+               for _ in range(2)]
+    return cases_by_state_df, by_date[0], by_date[1]
+
+
+# every figure of a build, as json text, the way build_dashboard schedules them
+def build_figures(pool, inputs):
+    counties_df, current_counties_df, counties, n_days, cdc = inputs
+    pending = {name: pool.submit(figure_json, build, df) for name, (build, df) in cdc.items()}
+    county_figure = make_cases_by_county_chloropleth(counties_df, current_counties_df, counties,
+                                                     n_days=n_days, map=pool.map)
+    figures = {name: future.result() for name, future in pending.items()}
+    figures['cases_by_county_chloropleth'] = pio.to_json(county_figure, validate=False)
+    return figures
+
+
+# run from the project root: python benchmarks/bench_figure_pool.py
+def main():
+    parser = argparse.ArgumentParser(description='figure build time with 1, 2, 4 and 8 pool workers')
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    counties_df = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=args.counties,
+                                                                              n_days=args.days + 7)))
+    current_counties_df = make_current_counties_df(counties_df)
+    counties = make_counties_geojson(counties_df['fips'].unique())
+    cases_by_state_df, cases_by_report_date_df, cases_by_onset_date_df = make_cdc_frames()
+    cdc = {'cases_by_report_date_bar': (make_cases_by_date_bar, cases_by_report_date_df),
+           'cases_by_onset_date_bar': (make_cases_by_date_bar, cases_by_onset_date_df),
+           'cases_by_state_chloropleth': (make_cases_by_state_chloropleth, cases_by_state_df)}
+    inputs = (counties_df, current_counties_df, counties, args.days, cdc)
+
+    # the dict-built county map is exactly what plotly validation would produce
+    county_figure = json.loads(build_figures(get_figure_pool(1), inputs)['cases_by_county_chloropleth'])
+    assert json.loads(go.Figure(county_figure).to_json()) == county_figure
+    print('county map with %d frames matches a validated figure' % args.days)
+
+    print('%d cpus' % (os.cpu_count() or 1))
+    print('%8s %10s %8s' % ('workers', 'build', 'speedup'))
+    expected = None
+    serial = None
+    for workers in args.workers:
+        pool = get_figure_pool(workers)
+        # workers start and import plotly once, outside the timed build
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        figures = build_figures(pool, inputs)
+        elapsed = time.perf_counter() - start
+        shutdown_figure_pool()
+
+        expected = expected or figures
+        assert figures == expected, 'figures differ with %d workers' % workers
+        serial = serial or elapsed
+        print('%8d %9.2fs %7.2fx' % (workers, elapsed, serial / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry
+from make_figures import make_cases_by_county_chloropleth
+from pull_updated_data import expand_nyc_fips, calculate_counties_metrics, make_current_counties_df
+from synthetic import make_counties_df, make_counties_geojson
+
+
+# run from the project root: python benchmarks/bench_geometry.py [--geojson geojson-counties-fips.json]
+def main():
+    parser = argparse.ArgumentParser(description='county geometry payload and preparation time per simplification level')
+    parser.add_argument('--geojson', help='county geojson to use instead of the synthetic grid')
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--vertices-per-edge', type=int, default=40)
+    parser.add_argument('--tolerances', type=float, nargs='+', default=[0, 0.001, 0.005, 0.01, 0.02, 0.05])
+    parser.add_argument('--quantization', type=int, default=geometry.COUNTY_GEOMETRY_QUANTIZATION)
+    args = parser.parse_args()
+
+    counties_df = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=args.counties, n_days=14)))
+    current_counties_df = make_current_counties_df(counties_df)
+    if args.geojson:
+        with open(args.geojson) as f:
+            counties = json.load(f)
+    else:
+        counties = make_counties_geojson(counties_df['fips'].unique(), vertices_per_edge=args.vertices_per_edge)
+
+    print('%10s %14s %14s %12s %14s %12s' % ('tolerance', 'geojson bytes', 'topojson bytes',
+                                             'simplify', 'figure bytes', 'figure prep'))
+
+    start = time.perf_counter()
+    figure_json = pio.to_json(make_cases_by_county_chloropleth(counties_df, current_counties_df, counties), validate=False)
+    prep = time.perf_counter() - start
+    print('%10s %14d %14s %12s %14d %11.2fs' % ('raw', len(json.dumps(counties)), '-', '-', len(figure_json), prep))
+
+    for tolerance in args.tolerances:
+        start = time.perf_counter()
+        topology = geometry.to_topology(counties, tolerance, args.quantization)
+        simplified = geometry.from_topology(topology, precision=geometry.grid_precision(topology))
+        simplify = time.perf_counter() - start
+
+        start = time.perf_counter()
+        figure_json = pio.to_json(make_cases_by_county_chloropleth(counties_df, current_counties_df, simplified), validate=False)
+        prep = time.perf_counter() - start
+
+        print('%10g %14d %14d %11.2fs %14d %11.2fs' % (tolerance, len(json.dumps(simplified)),
+                                                       len(json.dumps(topology, separators=(',', ':'))),
+                                                       simplify, len(figure_json), prep))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_cache import ENCODINGS
+from bench_callbacks import make_selections, update_request
+from offline_app import start_offline_app, stop_offline_app
+
+
+def decode(response):
+    if response.headers.get('Content-Encoding') == 'gzip':
+        return gzip.decompress(response.data)
+    if response.headers.get('Content-Encoding') == 'br':
+        import brotli
+        return brotli.decompress(response.data)
+    return response.data
+
+
+# plain and compressed bodies, then repeated revalidations at the same data version
+def check(label, send, repeats):
+    plain = send({})
+    assert plain.status_code == 200, plain.status_code
+    assert plain.headers['Cache-Control'] == 'no-cache'
+    etag = plain.headers['ETag']
+
+    for encoding in ENCODINGS:
+        compressed = send({'Accept-Encoding': encoding})
+        assert compressed.headers['Content-Encoding'] == encoding
+        assert decode(compressed) == plain.data
+        assert compressed.headers['ETag'] != etag, 'compressed and plain bodies share an etag'
+        print('%-24s %-5s %9d -> %8d bytes (%.1fx)' % (label, encoding, len(plain.data), len(compressed.data),
+                                                       len(plain.data) / len(compressed.data)))
+
+        for _ in range(repeats):
+            revalidated = send({'Accept-Encoding': encoding, 'If-None-Match': compressed.headers['ETag']})
+            assert revalidated.status_code == 304, revalidated.status_code
+            assert revalidated.data == b''
+            assert revalidated.headers['ETag'] == compressed.headers['ETag']
+    print('%-24s %d revalidations per encoding answered 304 with no body' % (label, repeats))
+    return etag
+
+
+# run from the project root: python benchmarks/bench_http_cache.py
+def main():
+    parser = argparse.ArgumentParser(description='compression, etags and 304s on the layout and callback responses')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    application, server, work_dir = start_offline_app(n_counties=200, n_days=120)
+    try:
+        client = application.application.test_client()
+        body = update_request('metric-by-date-bar', make_selections(application.scheduler.snapshot, 1)[0])
+
+        def get_layout(headers):
+            return client.get('/_dash-layout', headers=headers)
+
+        def post_callback(headers):
+            return client.post('/_dash-update-component', json=body, headers=headers)
+
+        layout_etag = check('/_dash-layout', get_layout, args.repeats)
+        check('/_dash-update-component', post_callback, args.repeats)
+
+        # a new build is a new data version, the old validator no longer matches
+        application.scheduler.snapshot = dict(application.scheduler.snapshot, built_at=datetime.datetime.now().isoformat())
+        response = get_layout({'If-None-Match': layout_etag})
+        assert response.status_code == 200 and response.headers['ETag'] != layout_etag
+        print('a new data version answers 200 with a new etag')
+    finally:
+        stop_offline_app(application, server, work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import county_store
+from pull_updated_data import get_counties_df, read_counties_df, update_counties_table
+from synthetic import make_counties_df
+
+
+# categoricals compare by value, their category order depends on how the frame was built
+def normalized(df):
+    df = df.astype({'county': str, 'state': str, 'fips': str})
+    return df.sort_values(['fips', 'date']).reset_index(drop=True)
+
+
+# run from the project root: python benchmarks/bench_incremental_ingest.py
+def main():
+    parser = argparse.ArgumentParser(description='full vs incremental county ingest against local csv stand-ins')
+    parser.add_argument('--counties', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--new-days', type=int, default=1)
+    args = parser.parse_args()
+
+    history_df = make_counties_df(n_counties=args.counties, n_days=args.days)
+    dates = history_df['date'].unique()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        initial_csv = os.path.join(tmp, 'us-counties-initial.csv')
+        full_csv = os.path.join(tmp, 'us-counties.csv')
+        recent_csv = os.path.join(tmp, 'us-counties-recent.csv')
+        history_df[history_df['date'] <= dates[-args.new_days - 1]].to_csv(initial_csv, index=False)
+        history_df.to_csv(full_csv, index=False)
+        history_df[history_df['date'] >= dates[-30]].to_csv(recent_csv, index=False)
+
+        conn = sqlite3.connect(os.path.join(tmp, 'counties.db'))
+        county_store.COUNTY_STORE_DIR = os.path.join(tmp, 'county_store')
+
+        start = time.perf_counter()
+        update_counties_table(conn, url=initial_csv, recent_url=recent_csv)
+        initial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_appended = update_counties_table(conn, url=full_csv, recent_url=recent_csv)
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = get_counties_df(full_csv)
+        full = time.perf_counter() - start
+
+        actual = read_counties_df(conn)
+        stored = county_store.load_counties_df()
+        conn.close()
+
+    pd.testing.assert_frame_equal(normalized(actual), normalized(expected[actual.columns]), check_dtype=False)
+    print('incremental series matches full recompute')
+
+    pd.testing.assert_frame_equal(normalized(stored), normalized(actual[stored.columns]), check_dtype=False)
+    print('county store matches county table')
+
+    print('initial ingest (%d days):     %.3fs' % (args.days - args.new_days, initial))
+    print('incremental ingest (%d days): %.3fs, %d rows appended' % (args.new_days, incremental, n_appended))
+    print('full recompute (%d days):     %.3fs' % (args.days, full))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# one sample line of the text exposition format: name{labels} value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? \S+$')
+EXPECTED_STAGES = ['fetch.fetch_all', 'update_db.update_db', 'pull_updated_data.calculate_counties_metrics',
+                   'pull_updated_data.make_current_counties_df', 'make_figures.make_cases_by_county_chloropleth',
+                   'build_dashboard.build_dashboard']
+
+
+# child: best time of the county metrics with instrumentation as INSTRUMENT sets it
+def time_pipeline(counties, days, repeats):
+    from instrument import INSTRUMENT, timed
+    from pull_updated_data import calculate_counties_metrics, expand_nyc_fips
+    from synthetic import make_counties_df
+
+    def undecorated():
+        pass
+    assert (timed(undecorated) is undecorated) != INSTRUMENT
+
+    raw_df = expand_nyc_fips(make_counties_df(n_counties=counties, n_days=days))
+    seconds = []
+    for _ in range(repeats):
+        counties_df = raw_df.copy()
+        start = time.perf_counter()
+        calculate_counties_metrics(counties_df)
+        seconds.append(time.perf_counter() - start)
+    print(json.dumps({'seconds': min(seconds)}))
+
+
+def run_pipeline(instrument, args):
+    env = dict(os.environ, INSTRUMENT=instrument)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--pipeline', '--counties', str(args.counties),
+                             '--days', str(args.days), '--repeats', str(args.repeats)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])['seconds']
+
+
+# the endpoint of an app on offline sources, after its first build and a few callbacks
+def check_endpoint(n_callbacks):
+    from bench_callbacks import make_selections, update_request
+    from offline_app import start_offline_app, stop_offline_app
+
+    application, server, work_dir = start_offline_app(n_counties=200, n_days=120)
+    try:
+        client = application.application.test_client()
+        for selection in make_selections(application.scheduler.snapshot, n_callbacks):
+            response = client.post('/_dash-update-component', json=update_request('metric-by-date-bar', selection))
+            assert response.status_code in (200, 204), response.status_code
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        text = response.get_data(as_text=True)
+    finally:
+        stop_offline_app(application, server, work_dir)
+
+    samples = [line for line in text.splitlines() if not line.startswith('#')]
+    for line in samples:
+        assert SAMPLE_LINE.match(line), 'malformed sample: ' + line
+    for stage in EXPECTED_STAGES:
+        assert 'dashboard_stage_calls_total{stage="' + stage + '"}' in text, stage + ' not timed'
+    assert 'dashboard_payload_json_bytes{payload="cases_by_county_chloropleth"}' in text
+    count = [line for line in samples
+             if line.startswith('dashboard_callback_seconds_count{callback="metric-by-date-bar.figure"}')]
+    assert count and int(count[0].split()[-1]) == n_callbacks, count
+    print('/metrics: %d samples, %d bytes, every stage timed and %d callbacks in the latency histogram'
+          % (len(samples), len(text), n_callbacks))
+    for line in samples:
+        if 'calculate_counties_metrics' in line or 'payload="cases_by_county_chloropleth"' in line:
+            print('    ' + line)
+
+
+# run from the project root: python benchmarks/bench_instrument.py
+def main():
+    parser = argparse.ArgumentParser(description='overhead of the stage instrumentation and the /metrics endpoint')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--callbacks', type=int, default=20)
+    parser.add_argument('--pipeline', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.pipeline:
+        return time_pipeline(args.counties, args.days, args.repeats)
+
+    from instrument import timed
+
+    def stage(x):
+        return x
+    n = 200000
+    plain = timeit.timeit(lambda: stage(1), number=n) / n
+    decorated = timed(stage)
+    instrumented = timeit.timeit(lambda: decorated(1), number=n) / n
+    print('per call: %.2f us undecorated, %.2f us timed (+%.2f us)'
+          % (plain * 1e6, instrumented * 1e6, (instrumented - plain) * 1e6))
+
+    disabled = run_pipeline('0', args)
+    enabled = run_pipeline('1', args)
+    print('calculate_counties_metrics: %.3fs with INSTRUMENT=0, %.3fs with INSTRUMENT=1 (%+.1f%%)'
+          % (disabled, enabled, 100 * (enabled / disabled - 1)))
+
+    check_endpoint(args.callbacks)
+
+
+if __name__ == '__main__':
+    main()
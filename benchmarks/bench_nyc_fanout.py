@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pull_updated_data import COUNTIES_COLS, NYC_FIPS, expand_nyc_fips
+from synthetic import make_counties_df
+
+
+# the row-at-a-time fan-out expand_nyc_fips replaced, kept as the reference output
+def expand_nyc_fips_legacy(counties_df) -> pd.DataFrame:
+    def add_nyc_fips(row):
+        temp_df = pd.DataFrame(columns=COUNTIES_COLS)
+        for i in NYC_FIPS:
+            s = pd.Series([row.date, row.county, row.state, i, row.cases, row.deaths],
+                          index=COUNTIES_COLS)
+            temp_df = pd.concat([temp_df, pd.DataFrame(s).transpose()]).reset_index(drop=True)
+        return temp_df
+
+    nyc_counties_df = pd.DataFrame(columns=COUNTIES_COLS)
+    non_nyc_counties_df = counties_df[counties_df['county'] != 'New York City']
+    for row in counties_df[counties_df['county'] == 'New York City'].itertuples():
+        nyc_counties_df = pd.concat([nyc_counties_df, add_nyc_fips(row)]).reset_index(drop=True)
+
+    return pd.concat([non_nyc_counties_df, nyc_counties_df])
+
+
+def check_equivalence(counties_df):
+    expected = expand_nyc_fips_legacy(counties_df)
+    actual = expand_nyc_fips(counties_df)
+    pd.testing.assert_frame_equal(actual.astype(object), expected.astype(object))
+
+
+def time_it(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NYC borough fan-out: vectorized vs legacy')
+    parser.add_argument('--days', type=int, default=100, help='NYC history length at 1x')
+    parser.add_argument('--counties', type=int, default=20)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--legacy-max-scale', type=int, default=10,
+                        help='skip the quadratic legacy path above this scale')
+    args = parser.parse_args()
+
+    check_equivalence(make_counties_df(n_counties=args.counties, n_days=args.days))
+    print('expand_nyc_fips matches legacy output')
+
+    print('%6s %10s %12s %12s' % ('scale', 'nyc rows', 'vectorized', 'legacy'))
+    for scale in args.scales:
+        counties_df = make_counties_df(n_counties=args.counties, n_days=args.days * scale)
+        n_nyc = int((counties_df['county'] == 'New York City').sum())
+        vectorized = time_it(expand_nyc_fips, counties_df)
+        if scale <= args.legacy_max_scale:
+            legacy = '%10.3fs' % time_it(expand_nyc_fips_legacy, counties_df, repeat=1)
+        else:
+            legacy = 'skipped'
+        print('%6dx %10d %11.4fs %12s' % (scale, n_nyc, vectorized, legacy))
+
+
+if __name__ == '__main__':
+    main()
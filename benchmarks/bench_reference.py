@@ -0,0 +1,73 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+# child run by tests/test_reference.py: start the app offline against an already converted
+# reference cache
+def check_startup():
+    from offline_app import start_offline_app, stop_offline_app
+
+    application, server, work_dir = start_offline_app(n_counties=100, n_days=60)
+    try:
+        status = application.application.test_client().get('/_dash-layout').status_code
+        assert status == 200, status
+        assert 'openpyxl' not in sys.modules, 'startup imported openpyxl'
+    finally:
+        stop_offline_app(application, server, work_dir)
+    print('startup and a full build ran without importing openpyxl')
+
+
+# run from the project root: python benchmarks/bench_reference.py
+def main():
+    parser = argparse.ArgumentParser(description='population reference array vs parsing the workbook and merging')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--startup', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup:
+        return check_startup()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, REFERENCE_CACHE_DIR=os.path.join(tmp, 'reference_cache'))
+        os.environ.update(env)
+        import reference
+
+        convert, _ = timed(lambda: subprocess.run([sys.executable, 'reference.py'], cwd=REPO_ROOT, env=env,
+                                                  check=True, capture_output=True))
+        load, popest_by_fips = timed(reference.popest_by_fips)
+        print('convert workbook (once, in a child): %.3fs   load array: %.4fs' % (convert, load))
+
+        workbook, popest = timed(lambda: pd.read_excel(os.path.join(REPO_ROOT, reference.POPEST_PATH), dtype=str))
+        print('parse workbook (every ingest before):  %.3fs' % workbook)
+
+        county_rows = popest[popest['county_fips'] != '000']
+
+        # per-row population for a county-series-sized frame: merge vs indexed gather
+        rng = np.random.default_rng(0)
+        fips = county_rows['fips'].to_numpy()[rng.integers(0, len(county_rows), args.rows)]
+        frame = pd.DataFrame({'fips': pd.Categorical(fips), 'cases': rng.integers(0, 1000, args.rows)})
+        lookup = county_rows.assign(popest=county_rows['popest'].astype(int))[['fips', 'popest']]
+        merge, merged = timed(lambda: frame.astype({'fips': str}).merge(lookup, on='fips', how='inner')['popest'])
+        gather, gathered = timed(lambda: reference.lookup_popest(frame['fips'].cat.categories)[frame['fips'].cat.codes])
+        np.testing.assert_array_equal(np.sort(merged.to_numpy()), np.sort(gathered))
+        print('per-row population for %d rows: merge %.3fs   gather %.4fs' % (args.rows, merge, gather))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pull_updated_data import (ROLLING_WINDOW, calculate_counties_metrics, expand_nyc_fips, group_day_keys,
+                               rolling_calendar_mean)
+from synthetic import make_counties_df
+
+
+# new cases and their rolling mean the way the pipeline used to: a 7 row window
+# over a (fips, date) index, merged back onto the frame
+def legacy_rolling(counties_df):
+    counties_df = counties_df.sort_values(by='date', ascending=True)
+    counties_df['cases_lagged'] = counties_df.groupby('fips')['cases'].shift(1)
+    counties_df['new_cases'] = counties_df['cases'] - counties_df['cases_lagged']
+    counties_df.loc[counties_df['new_cases'] < 0, 'new_cases'] = 0
+    newcases_rolling = (counties_df.set_index(['fips', 'date']).drop(columns=['county', 'state'])
+                        .groupby('fips').rolling(window=ROLLING_WINDOW).mean()['new_cases']
+                        .rename('new_cases_rolling').droplevel(0))
+    return counties_df.merge(pd.DataFrame(newcases_rolling), on=['fips', 'date'], how='left')
+
+
+# the calendar-day definition spelled out row by row: new cases reported in the
+# trailing window of days, over the window length. tests/test_rolling.py holds the engine to it
+def reference_calendar_mean(counties_df):
+    means = []
+    for fips, group in counties_df.groupby('fips', sort=False):
+        dates = pd.to_datetime(group['date']).to_numpy()
+        new_cases = group['new_cases'].to_numpy()
+        for i, day in enumerate(dates):
+            in_window = (dates > day - np.timedelta64(ROLLING_WINDOW, 'D')) & (dates <= day)
+            window = new_cases[in_window]
+            means.append(np.nan if np.isnan(window).any() else window.sum() / ROLLING_WINDOW)
+    return np.array(means)
+
+
+def comparable(df):
+    df = df.astype({'fips': str})
+    df['date'] = pd.to_datetime(df['date'])
+    return df.sort_values(['fips', 'date']).reset_index(drop=True)
+
+
+# run from the project root: python benchmarks/bench_rolling.py
+def main():
+    parser = argparse.ArgumentParser(description='rolling mean: row window round-trip vs calendar cumsum engine')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    counties_df = expand_nyc_fips(make_counties_df(n_counties=args.counties, n_days=args.days))
+
+    start = time.perf_counter()
+    legacy_rolling(counties_df.copy())
+    legacy = time.perf_counter() - start
+
+    # the engine on its own, from rows already sorted by (fips, date)
+    sorted_df = comparable(calculate_counties_metrics(counties_df.copy()))
+    keys = group_day_keys(sorted_df['fips'].astype('category').cat.codes.to_numpy(), sorted_df['date'].to_numpy())
+    start = time.perf_counter()
+    rolling_calendar_mean(keys, sorted_df['new_cases'].to_numpy())
+    engine = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_counties_metrics(counties_df.copy())
+    metrics = time.perf_counter() - start
+
+    print('%d rows' % len(counties_df))
+    print('set_index/groupby/rolling/merge:      %.3fs' % legacy)
+    print('rolling_calendar_mean:                %.3fs' % engine)
+    print('calculate_counties_metrics (all):     %.3fs' % metrics)
+
+
+if __name__ == '__main__':
+    main()
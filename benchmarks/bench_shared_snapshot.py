@@ -0,0 +1,171 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import county_store
+import shared_snapshot
+from analytics import GEOGRAPHIES, METRICS, ROLLING_WINDOWS, CountyAnalytics
+from pull_updated_data import calculate_counties_metrics, expand_nyc_fips
+from synthetic import make_counties_df
+
+MODES = ['idle', 'private', 'shared']
+# an added attached worker may cost a small fixed amount (its own counties frame and the
+# interpreter pages a fork dirties) plus a fraction of the snapshot; a private copy of the
+# series costs several times the snapshot
+ATTACH_FIXED_MB = 8
+ATTACH_SNAPSHOT_FRACTION = 0.1
+
+
+# unique (private) and proportional set size of a process, from its smaps rollup
+def uss_pss_mb(pid):
+    sizes = {}
+    with open('/proc/' + str(pid) + '/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                sizes[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return sizes['Private_Clean'] + sizes['Private_Dirty'], sizes['Pss']
+
+
+# fault in every page of the analytics series without allocating a copy of them
+def touch_series(analytics):
+    for series in analytics._series.values():
+        for values in series.values():
+            if isinstance(values, pd.Categorical):
+                values = values.codes
+            elif isinstance(values, pd.DatetimeIndex):
+                values = values.asi8
+            values[::512].sum()
+
+
+# a worker holding the analytics the way the app does: attached to the shared snapshot, or
+# loaded from the county store and computed privately; idle holds none, for what a fork costs alone
+def worker(mode, ready, release):
+    if mode == 'shared':
+        touch_series(CountyAnalytics.from_snapshot(shared_snapshot.attach_snapshot()))
+    elif mode == 'private':
+        analytics = CountyAnalytics.from_store()
+        for geography in GEOGRAPHIES:
+            analytics.series(geography)
+        touch_series(analytics)
+    ready.put(os.getpid())
+    release.wait()
+
+
+def measure_workers(mode, n_workers):
+    context = multiprocessing.get_context('fork')
+    ready = context.Queue()
+    release = context.Event()
+    processes = [context.Process(target=worker, args=(mode, ready, release)) for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    pids = [ready.get(timeout=300) for _ in processes]
+    sizes = [uss_pss_mb(pid) for pid in pids]
+    release.set()
+    for process in processes:
+        process.join()
+    return sum(uss for uss, _ in sizes), sum(pss for _, pss in sizes)
+
+
+# metrics from the attached snapshot match the analytics it was published from, and a
+# new version is picked up while the previous one stays readable
+def check_snapshot(counties_df, snapshot_dir):
+    analytics = CountyAnalytics(counties_df)
+    v1 = shared_snapshot.publish_snapshot(analytics.snapshot_tables(), snapshot_dir)
+    attached = CountyAnalytics.from_snapshot(shared_snapshot.attach_snapshot(snapshot_dir=snapshot_dir))
+    for metric in METRICS:
+        for window in ROLLING_WINDOWS:
+            for geography in GEOGRAPHIES:
+                pd.testing.assert_frame_equal(attached.select(metric, window, geography),
+                                              analytics.select(metric, window, geography), check_categorical=False)
+    pd.testing.assert_frame_equal(attached.counties, analytics.counties)
+    print('every metric, window and geography matches from the attached snapshot')
+
+    assert np.asarray(attached._series['county']['keys']).base is not None
+    assert not attached._series['county']['keys'].flags.writeable
+    v2 = shared_snapshot.publish_snapshot(analytics.snapshot_tables(), snapshot_dir)
+    assert v2 == v1 + 1 and shared_snapshot.current_version(snapshot_dir) == v2
+    shared_snapshot.publish_snapshot(analytics.snapshot_tables(), snapshot_dir)
+    assert not os.path.exists(shared_snapshot.version_path(v1, snapshot_dir))
+    attached.select('cases_per100k', 28, 'county')
+    print('version counter at v%d, v%d removed and still readable by its attached worker' % (v2 + 1, v1))
+
+
+# child: county store and snapshot written by a separate process, as the ingest would
+def prepare(counties, days, work_dir):
+    counties_df = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=counties, n_days=days)))
+    check_snapshot(counties_df[counties_df['date'] > counties_df['date'].max() - pd.Timedelta(days=30)],
+                   os.path.join(work_dir, 'check_snapshot'))
+    county_store.write_county_partitions(counties_df, os.path.join(work_dir, 'county_store'))
+    shared_snapshot.publish_snapshot(CountyAnalytics(counties_df).snapshot_tables(),
+                                     os.path.join(work_dir, 'snapshot_store'))
+
+
+# county store and snapshot of a synthetic series written by a separate process into work_dir
+def run_prepare(counties, days, work_dir):
+    return subprocess.run([sys.executable, os.path.abspath(__file__), '--prepare', work_dir,
+                           '--counties', str(counties), '--days', str(days)],
+                          check=True, capture_output=True, text=True).stdout
+
+
+def snapshot_size_mb():
+    version_dir = shared_snapshot.version_path(shared_snapshot.current_version())
+    return sum(os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir)) / 1024 ** 2
+
+
+# (uss, pss) totals per mode and worker count, and the pss each added worker costs over an
+# idle one, from the first worker count to the last. workers fork from this process
+def measure_growth(workers):
+    results = {mode: {n: measure_workers(mode, n) for n in workers} for mode in MODES}
+    first, last = workers[0], workers[-1]
+    growth = {mode: (results[mode][last][1] - results[mode][first][1]) / (last - first) for mode in results}
+    return results, growth['private'] - growth['idle'], growth['shared'] - growth['idle']
+
+
+def attach_limit_mb(snapshot_mb):
+    return ATTACH_FIXED_MB + ATTACH_SNAPSHOT_FRACTION * snapshot_mb
+
+
+# run from the project root: python benchmarks/bench_shared_snapshot.py
+def main():
+    parser = argparse.ArgumentParser(description='memory of worker processes attached to the shared snapshot')
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--prepare', metavar='DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        return prepare(args.counties, args.days, args.prepare)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(run_prepare(args.counties, args.days, tmp).strip())
+        county_store.COUNTY_STORE_DIR = os.path.join(tmp, 'county_store')
+        shared_snapshot.SNAPSHOT_DIR = os.path.join(tmp, 'snapshot_store')
+        snapshot_mb = snapshot_size_mb()
+
+        # workers fork from this process after the imports, like gunicorn --preload
+        results, private, shared = measure_growth(args.workers)
+
+    print('snapshot %.1f MB' % snapshot_mb)
+    print('%8s %20s %20s %20s' % ('', 'idle', 'private series', 'shared snapshot'))
+    print('%8s' % 'workers' + ' %9s %10s' % ('uss', 'pss') * 3)
+    for n in args.workers:
+        print('%8d' % n + ''.join(' %6.1f MB %7.1f MB' % results[mode][n] for mode in results))
+
+    # total pss per added worker, over what an idle worker adds
+    print('pss per added worker over an idle one: %.1f MB private, %.1f MB shared (limit %.1f MB)'
+          % (private, shared, attach_limit_mb(snapshot_mb)))
+    assert private > snapshot_mb, 'private workers should each hold a copy of the series'
+    assert shared < attach_limit_mb(snapshot_mb), 'attached workers grow by more than a fraction of the snapshot'
+
+if __name__ == '__main__':
+    main()
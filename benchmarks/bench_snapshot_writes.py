@@ -0,0 +1,99 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from db import connect
+from pull_updated_data import pull_table
+from update_db import CDC_TABLE_KEY, CDC_TABLE_SCHEMA, create_schema, migrate_snapshot_tables, write_snapshot
+
+
+# one snapshot as update_db hands it to the writer
+def snapshot_frames(conn, snapshot_date):
+    frames = {}
+    for name in CDC_TABLE_SCHEMA:
+        df = pull_table(conn, name, snapshot_date=snapshot_date).reset_index()
+        frames[name] = df.rename(columns={'community_spread': 'community_transmission'})
+    return frames
+
+
+def table(conn, name):
+    return pd.read_sql('SELECT * FROM ' + name, conn) \
+        .sort_values(['snapshot_date', CDC_TABLE_KEY[name]]).reset_index(drop=True)
+
+
+# the previous writer: a drop-and-replace to_sql per dataset, committing after each
+def legacy_write(conn, snapshot_date, frames):
+    for name, df in frames.items():
+        df.to_sql(name=name + snapshot_date.replace('-', ''), con=conn, if_exists='replace')
+
+
+def replay(write, conn, snapshots):
+    start = time.perf_counter()
+    for snapshot_date, frames in snapshots:
+        write(conn, snapshot_date, frames)
+    return time.perf_counter() - start
+
+
+# run from the project root: python benchmarks/bench_snapshot_writes.py
+def main():
+    parser = argparse.ArgumentParser(description='replay every cdc snapshot in 2019-nCoV-CDC.db through the snapshot writer')
+    parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, 'source.db')
+        shutil.copy(os.path.join(REPO_ROOT, '2019-nCoV-CDC.db'), source_path)
+        source = sqlite3.connect(source_path)
+        migrate_snapshot_tables(source, drop=False)
+        snapshot_dates = [row[0] for row in source.execute(
+            'SELECT DISTINCT snapshot_date FROM cdc_cases_by_state ORDER BY 1')]
+        snapshots = [(d, snapshot_frames(source, d)) for d in snapshot_dates]
+        n_rows = sum(len(df) for _, frames in snapshots for df in frames.values())
+
+        legacy_conn = sqlite3.connect(os.path.join(tmp, 'legacy.db'))
+        legacy = replay(legacy_write, legacy_conn, snapshots)
+        legacy_conn.close()
+
+        conn = connect(os.path.join(tmp, 'replay.db'))
+        create_schema(conn)
+        inserted = replay(write_snapshot, conn, snapshots)
+        # a second pass rewrites every day, exercising the upsert
+        upserted = replay(write_snapshot, conn, snapshots)
+
+        for name in CDC_TABLE_SCHEMA:
+            pd.testing.assert_frame_equal(table(conn, name), table(source, name))
+        print('%d snapshots (%d rows) replayed, every table matches the source' % (len(snapshots), n_rows))
+
+        # a failure in the last dataset rolls back the whole snapshot
+        before = {name: table(conn, name) for name in CDC_TABLE_SCHEMA}
+        snapshot_date, frames = snapshots[-1]
+        broken = dict(frames)
+        broken['cdc_cases_by_state'] = frames['cdc_cases_by_state'].assign(range=lambda df: df['range'] + ' changed')
+        broken['cdc_cases_by_onset_date'] = frames['cdc_cases_by_onset_date'].assign(n_cases=[{}] * len(frames['cdc_cases_by_onset_date']))
+        try:
+            write_snapshot(conn, snapshot_date, broken)
+            raise AssertionError('broken snapshot was written')
+        except sqlite3.Error:
+            pass
+        for name in CDC_TABLE_SCHEMA:
+            pd.testing.assert_frame_equal(table(conn, name), before[name])
+        print('a failed write leaves no partial snapshot')
+        print('journal mode', conn.execute('PRAGMA journal_mode').fetchone()[0])
+        conn.close()
+        source.close()
+
+    print('to_sql replace per dataset:     %.3fs  %8d rows/s' % (legacy, n_rows / legacy))
+    print('transactional upsert (insert):  %.3fs  %8d rows/s' % (inserted, n_rows / inserted))
+    print('transactional upsert (rewrite): %.3fs  %8d rows/s' % (upserted, n_rows / upserted))
+
+
+if __name__ == '__main__':
+    main()
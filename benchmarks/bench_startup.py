@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# what importing application used to pull in before the pipeline moved behind the factory
+EAGER_IMPORTS = 'import dash, build_dashboard, refresh, table_index, analytics, make_figures, callback_cache'
+
+
+# top-level modules and their cumulative import time in seconds, from python -X importtime
+def import_times(statement):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def report_import_time(label, statement, top):
+    times = import_times(statement)
+    print('%-40s %.3fs' % (label + ' (' + statement + ')', sum(times.values())))
+    for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:top]:
+        print('    %-36s %.3fs' % (name, seconds))
+    return sum(times.values())
+
+
+def get_ready(client):
+    start = time.perf_counter()
+    response = client.get('/ready')
+    return response.status_code, time.perf_counter() - start
+
+
+# child: app factory against offline sources, readiness while the first build runs and from its cache
+def check_readiness(timeout=300):
+    from offline_app import start_offline_sources
+
+    server, work_dir = start_offline_sources(n_counties=200, n_days=120)
+    import application
+
+    start = time.perf_counter()
+    application.create_app()
+    created = time.perf_counter() - start
+    client = application.application.test_client()
+    status, latency = get_ready(client)
+    print('create_app with no cached build: %.3fs, /ready %d in %.1f ms' % (created, status, latency * 1000))
+    assert status == 503, 'ready before the first build'
+
+    while get_ready(client)[0] != 200:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('not ready after ' + str(timeout) + 's')
+        time.sleep(0.05)
+    print('first build served after %.3fs' % (time.perf_counter() - start))
+    application.scheduler.stop()
+
+    # a second start finds the build in the figure cache and is ready straight away
+    start = time.perf_counter()
+    application.create_app(refresh=False)
+    created = time.perf_counter() - start
+    status, latency = get_ready(application.application.test_client())
+    print('create_app from the cached build:  %.3fs, /ready %d in %.1f ms' % (created, status, latency * 1000))
+    assert status == 200
+
+    server.__exit__(None, None, None)
+
+
+# run from the project root: python benchmarks/bench_startup.py [--import-time]
+def main():
+    parser = argparse.ArgumentParser(description='import cost of application and readiness of the app factory')
+    parser.add_argument('--import-time', action='store_true', help='only compare python -X importtime totals')
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--readiness', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.readiness:
+        return check_readiness()
+
+    eager = report_import_time('eager', EAGER_IMPORTS, args.top)
+    lazy = report_import_time('lazy', 'import application', args.top)
+    print('import time reduced %.1fx' % (eager / lazy))
+    assert lazy < eager
+
+    if not args.import_time:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--readiness'], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import county_store
+import pull_updated_data
+from instrument import peak_rss_mb, rss_mb
+from pull_updated_data import get_counties_df, read_counties_df, stream_counties_df, update_counties_table
+from synthetic import make_counties_df
+
+
+# categoricals compare by value, their category order depends on how the frame was built
+def normalized(df):
+    df = df.astype({'county': str, 'state': str, 'fips': str})
+    return df.sort_values(['fips', 'date']).reset_index(drop=True)
+
+
+# a fresh database and county store, ingested from csv_path the way the first refresh does
+def ingest(csv_path, tmp):
+    conn = sqlite3.connect(os.path.join(tmp, 'counties.db'))
+    county_store.COUNTY_STORE_DIR = os.path.join(tmp, 'county_store')
+    n_rows = update_counties_table(conn, url=csv_path, recent_url=csv_path)
+    return conn, n_rows
+
+
+# streamed chunks concatenate to the batch series, and the tables both ingest paths write agree
+def check_equivalence(n_counties, n_days, chunk_sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'us-counties.csv')
+        raw_df = make_counties_df(n_counties=n_counties, n_days=n_days)
+        raw_df.to_csv(csv_path, index=False)
+        expected = normalized(get_counties_df(csv_path))
+
+        for chunk_rows in chunk_sizes:
+            actual = pd.concat(list(stream_counties_df(csv_path, chunk_rows=chunk_rows)), ignore_index=True)
+            pd.testing.assert_frame_equal(normalized(actual), expected, check_dtype=False, check_exact=True)
+        print('streamed series matches the batch series at chunk sizes %s' % ', '.join(map(str, chunk_sizes)))
+
+        tables = {}
+        for label, chunk_rows in [('batch', 0), ('stream', min(chunk_sizes))]:
+            pull_updated_data.COUNTIES_STREAM_CHUNK_ROWS = chunk_rows
+            ingest_dir = os.path.join(tmp, label)
+            os.makedirs(ingest_dir)
+            conn, _ = ingest(csv_path, ingest_dir)
+            tables[label] = normalized(read_counties_df(conn))
+            conn.close()
+        pull_updated_data.COUNTIES_STREAM_CHUNK_ROWS = 0
+        pd.testing.assert_frame_equal(tables['stream'], tables['batch'], check_exact=True)
+        print('streamed county table matches the batch county table')
+
+        # a county's days out of order can't be carried, the ingest refuses them
+        shuffled_path = os.path.join(tmp, 'us-counties-shuffled.csv')
+        raw_df.sample(frac=1, random_state=0).to_csv(shuffled_path, index=False)
+        try:
+            list(stream_counties_df(shuffled_path, chunk_rows=min(chunk_sizes)))
+        except ValueError:
+            print('out of order days are rejected')
+        else:
+            raise AssertionError('out of order days streamed without error')
+
+
+# child: peak rss of a first ingest over the rss it starts from, streamed when
+# COUNTIES_STREAM_CHUNK_ROWS is set
+def measure(csv_path):
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = rss_mb()
+        start = time.perf_counter()
+        conn, n_rows = ingest(csv_path, tmp)
+        seconds = time.perf_counter() - start
+        conn.close()
+    print(json.dumps({'peak_mb': peak_rss_mb() - baseline, 'rows': n_rows, 'seconds': seconds}))
+
+
+# child: check equivalence, then write the measured history
+def prepare(n_counties, n_days, csv_path):
+    check_equivalence(n_counties=300, n_days=200, chunk_sizes=[997, 10000, 100000])
+    make_counties_df(n_counties=n_counties, n_days=n_days).to_csv(csv_path, index=False)
+
+
+# each step runs in its own interpreter: a child inherits the peak rss of its parent
+# at fork, so the parent stays small and never holds a frame itself
+def run_step(*step_args, env=None):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + list(step_args),
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return output.strip().splitlines()
+
+
+def run_measure(csv_path, chunk_rows):
+    env = dict(os.environ, COUNTIES_STREAM_CHUNK_ROWS=str(chunk_rows))
+    return json.loads(run_step('--measure', csv_path, env=env)[-1])
+
+
+# run from the project root: python benchmarks/bench_streaming_ingest.py
+def main():
+    parser = argparse.ArgumentParser(description='peak memory of the full-history county ingest, batch vs streamed')
+    # about the size of the full NYT county history
+    parser.add_argument('--counties', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=830)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--measure', metavar='CSV', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', metavar='CSV', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+    if args.prepare:
+        prepare(args.counties, args.days, args.prepare)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'us-counties.csv')
+        for line in run_step('--prepare', csv_path, '--counties', str(args.counties), '--days', str(args.days)):
+            print(line)
+        size_mb = os.path.getsize(csv_path) / 1024 ** 2
+        batch = run_measure(csv_path, 0)
+        streamed = {chunk_rows: run_measure(csv_path, chunk_rows) for chunk_rows in args.chunk_rows}
+
+    print('%d rows, %.1f MB of csv' % (batch['rows'], size_mb))
+    print('%-14s %12s %9s' % ('ingest', 'peak rss', 'time'))
+    print('%-14s %+9.1f MB %8.2fs' % ('batch', batch['peak_mb'], batch['seconds']))
+    for chunk_rows, result in streamed.items():
+        assert result['rows'] == batch['rows']
+        print('%-14s %+9.1f MB %8.2fs' % ('%d rows' % chunk_rows, result['peak_mb'], result['seconds']))
+        assert result['peak_mb'] < batch['peak_mb'], 'streamed ingest peaks above the batch ingest'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from instrument import peak_rss_mb, reset_peak_rss, rss_mb
+
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+# a stage regresses when it is this much slower or bigger than in the baseline run...
+REGRESSION_THRESHOLD = 0.25
+# ...and by more than these, so noise on stages of milliseconds or megabytes never fails a run
+SECONDS_FLOOR = 0.05
+PEAK_MB_FLOOR = 10.0
+
+
+def read_source(fixtures, name):
+    from fetch import FetchResult
+
+    path = os.path.join(fixtures, name)
+    with open(path, 'rb') as f:
+        return FetchResult(path, f.read(), True)
+
+
+# EVERY STAGE AS (prepare, run, repeats): prepare(fixtures, args) builds the inputs outside
+# the measurement, run(inputs) is what gets timed and memory profiled
+
+def prepare_counties_source(fixtures, args):
+    return read_source(fixtures, 'us-counties.csv')
+
+
+def run_get_counties_df(source):
+    from pull_updated_data import get_counties_df
+
+    get_counties_df(source)
+
+
+def prepare_counties_df(fixtures, args):
+    from pull_updated_data import get_counties_df
+
+    return get_counties_df(read_source(fixtures, 'us-counties.csv'))
+
+
+def run_make_current_counties_df(counties_df):
+    from pull_updated_data import make_current_counties_df
+
+    make_current_counties_df(counties_df)
+
+
+# the trailing working window and simplified geometry, as build_dashboard hands them to the map
+def prepare_county_map(fixtures, args):
+    import hashlib
+    import pandas as pd
+    from build_dashboard import COUNTY_WORKING_COLS, COUNTY_WORKING_DAYS
+    from geometry import simplify_geojson
+    from make_figures import ANIMATION_DAYS
+    from pull_updated_data import get_counties_df, get_counties_geojson, make_current_counties_df
+
+    counties_df = get_counties_df(read_source(fixtures, 'us-counties.csv'))
+    since = counties_df['date'].max() - pd.Timedelta(days=max(COUNTY_WORKING_DAYS, ANIMATION_DAYS) - 1)
+    counties_df = counties_df.loc[counties_df['date'] >= since, COUNTY_WORKING_COLS].reset_index(drop=True)
+    response = read_source(fixtures, 'counties.geojson')
+    counties = simplify_geojson(get_counties_geojson(response), source_key=hashlib.sha1(response.content).hexdigest())
+    return counties_df, make_current_counties_df(counties_df), counties
+
+
+def run_county_map(inputs):
+    import plotly.io as pio
+    from make_figures import make_cases_by_county_chloropleth
+
+    pio.to_json(make_cases_by_county_chloropleth(*inputs), validate=False)
+
+
+def prepare_update_db(fixtures, args):
+    from db import connect
+
+    responses = {name: read_source(fixtures, name + '.json')
+                 for name in ['cases_by_state', 'cases_by_report_date', 'cases_by_onset_date']}
+    return connect(os.path.join(fixtures, 'update_db.db')), responses
+
+
+def run_update_db(inputs):
+    from update_db import update_db
+
+    conn, responses = inputs
+    update_db(conn, snapshot_date='2020-06-01', responses=responses)
+
+
+# the app starts against the fixtures served locally, with empty caches and stores
+def prepare_startup(fixtures, args):
+    from offline_app import start_offline_sources
+
+    start_offline_sources(n_counties=args.counties, n_days=args.days, work_dir=os.path.join(args.work_dir, 'startup'))
+
+
+def run_startup(inputs):
+    import application
+
+    application.create_app()
+    while application.scheduler.snapshot is None:
+        time.sleep(0.05)
+
+
+def prepare_layout(fixtures, args):
+    from offline_app import start_offline_app
+
+    application = start_offline_app(n_counties=args.counties, n_days=args.days,
+                                    work_dir=os.path.join(args.work_dir, 'layout'))[0]
+    return application.application.test_client()
+
+
+def run_layout(client):
+    response = client.get('/_dash-layout')
+    assert response.status_code == 200, response.status_code
+
+
+STAGES = {
+    'get_counties_df': (prepare_counties_source, run_get_counties_df, None),
+    'make_current_counties_df': (prepare_counties_df, run_make_current_counties_df, None),
+    'make_cases_by_county_chloropleth': (prepare_county_map, run_county_map, None),
+    'update_db': (prepare_update_db, run_update_db, None),
+    'layout': (prepare_layout, run_layout, None),
+    # a second start would find the first build in the figure cache
+    'startup': (prepare_startup, run_startup, 1),
+}
+
+
+# child: one stage in a fresh interpreter, its peak counted from after its inputs are built
+def measure_stage(name, args):
+    prepare, run, repeats = STAGES[name]
+    os.chdir(args.work_dir)
+    inputs = prepare(os.path.join(args.work_dir, 'fixtures'), args)
+    # repeatable stages run once untimed, so lazy imports and first loads aren't counted
+    if repeats is None:
+        run(inputs)
+
+    reset_peak_rss()
+    baseline = rss_mb()
+    seconds = []
+    for _ in range(repeats or args.repeats):
+        start = time.perf_counter()
+        run(inputs)
+        seconds.append(time.perf_counter() - start)
+    print(json.dumps({'seconds': statistics.median(seconds),
+                      'min_seconds': min(seconds),
+                      'peak_mb': max(0.0, peak_rss_mb() - baseline),
+                      'repeats': len(seconds)}))
+    # servers and the refresh thread go down with the interpreter
+    sys.stdout.flush()
+    os._exit(0)
+
+
+# child: the data files, the synthetic fixtures and the converted reference data every stage shares
+def prepare_work_dir(args):
+    from offline_app import make_work_dir
+    from synthetic import write_fixtures
+
+    make_work_dir(args.work_dir)
+    os.chdir(args.work_dir)
+    write_fixtures(os.path.join(args.work_dir, 'fixtures'), n_counties=args.counties, n_days=args.days)
+    from reference import ensure_converted
+    ensure_converted()
+
+
+def run_child(args, *child_args):
+    command = [sys.executable, os.path.abspath(__file__), '--counties', str(args.counties), '--days', str(args.days),
+               '--repeats', str(args.repeats), '--work-dir', args.work_dir] + list(child_args)
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return output.strip().splitlines()
+
+
+# stages slower or bigger than the baseline by more than threshold, as messages
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            continue
+        for key, floor in [('seconds', SECONDS_FLOOR), ('peak_mb', PEAK_MB_FLOOR)]:
+            if result[key] > previous[key] * (1 + threshold) and result[key] - previous[key] > floor:
+                regressions.append('%s %s %.3f -> %.3f (+%.0f%%)' % (name, key, previous[key], result[key],
+                                                                   100 * (result[key] / previous[key] - 1)))
+    return regressions
+
+
+def change(result, previous, key):
+    if previous is None or not previous[key]:
+        return ''
+    return '%+6.0f%%' % (100 * (result[key] / previous[key] - 1))
+
+
+# run from the project root: python benchmarks/bench_suite.py [--baseline results.json]
+def main():
+    parser = argparse.ArgumentParser(description='time and peak memory of every pipeline stage on synthetic sources')
+    parser.add_argument('--counties', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--output', help='results json, by default a new file in benchmarks/results')
+    parser.add_argument('--baseline', help='results json of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--measure', metavar='STAGE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        return prepare_work_dir(args)
+    if args.measure:
+        return measure_stage(args.measure, args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'cpus': os.cpu_count(),
+               'params': {'counties': args.counties, 'days': args.days, 'repeats': args.repeats},
+               'stages': {}}
+    if baseline is not None and baseline['params'] != results['params']:
+        raise SystemExit('baseline ran with ' + json.dumps(baseline['params']) + ', rerun with the same parameters')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.work_dir = tmp
+        run_child(args, '--prepare')
+        for name in args.stages:
+            results['stages'][name] = json.loads(run_child(args, '--measure', name)[-1])
+
+    output = args.output or os.path.join(RESULTS_DIR, 'suite-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print('%d counties x %d days, %d cpus' % (args.counties, args.days, os.cpu_count() or 1))
+    print('%-34s %10s %8s %12s %8s' % ('stage', 'seconds', '', 'peak rss', ''))
+    for name, result in results['stages'].items():
+        previous = baseline['stages'].get(name) if baseline else None
+        print('%-34s %9.3fs %8s %+9.1f MB %8s' % (name, result['seconds'], change(result, previous, 'seconds'),
+                                                 result['peak_mb'], change(result, previous, 'peak_mb')))
+    print('results written to ' + output)
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            raise SystemExit('regressions over %.0f%% against %s:\n  ' % (100 * args.threshold, args.baseline)
+                             + '\n  '.join(regressions))
+        print('no regressions over %.0f%% against %s' % (100 * args.threshold, args.baseline))
+
+
+if __name__ == '__main__':
+    main()
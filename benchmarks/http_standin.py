@@ -0,0 +1,58 @@
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# LOCAL HTTP SERVER STANDING IN FOR THE CDC, NYT AND PLOTLY SOURCES
+# serves {path: bytes} with ETag/Last-Modified validators and an optional per-request delay
+class StandinServer:
+
+    def __init__(self, payloads, delay=0.0):
+        self.payloads = dict(payloads)
+        self.delay = delay
+        self.requests = []
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                standin.requests.append(self.path)
+                time.sleep(standin.delay)
+
+                body = standin.payloads.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', 'Mon, 21 Feb 2022 00:00:00 GMT')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return 'http://127.0.0.1:' + str(self.server.server_address[1]) + path
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILES = ['2019-nCoV-CDC.db', 'popest2019_nyc.xlsx', 'state_abbrev_mapping.csv']
+
+
+# SERVE SYNTHETIC SOURCES LOCALLY FROM A SCRATCH COPY OF THE DATA FILES
+# every source url is pointed at a StandinServer before any repo module reads it, and
+# the cwd moves to a temporary directory so caches and stores start empty
+def start_offline_sources(n_counties=200, n_days=120, work_dir=None):
+    from http_standin import StandinServer
+    from synthetic import make_source_payloads
+
+    payloads = {'/' + name: body for name, body in make_source_payloads(n_counties=n_counties, n_days=n_days).items()}
+
+    server = StandinServer(payloads).__enter__()
+    os.environ.update({
+        'CASES_BY_STATE_URL': server.url('/cases_by_state.json'),
+        'CASES_BY_REPORT_DATE_URL': server.url('/cases_by_report_date.json'),
+        'CASES_BY_ONSET_DATE_URL': server.url('/cases_by_onset_date.json'),
+        'NYT_COUNTIES_URL': server.url('/us-counties.csv'),
+        'NYT_COUNTIES_RECENT_URL': server.url('/us-counties-recent.csv'),
+        'COUNTIES_GEOJSON_URL': server.url('/counties.geojson'),
+    })
+    # modules imported above read their urls at import time
+    for name in ['pull_updated_data', 'update_db', 'synthetic', 'county_store', 'fetch']:
+        sys.modules.pop(name, None)
+
+    work_dir = make_work_dir(work_dir)
+    os.chdir(work_dir)
+    return server, work_dir
+
+
+# a temporary directory holding copies of the data files the pipeline reads from its cwd
+def make_work_dir(work_dir=None):
+    work_dir = work_dir or tempfile.mkdtemp()
+    os.makedirs(work_dir, exist_ok=True)
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(REPO_ROOT, name), work_dir)
+    return work_dir
+
+
+# the app on offline sources, once its first build is served
+def start_offline_app(n_counties=200, n_days=120, timeout=300, work_dir=None):
+    server, work_dir = start_offline_sources(n_counties=n_counties, n_days=n_days, work_dir=work_dir)
+
+    import application
+    application.create_app()
+    start = time.time()
+    while application.scheduler.snapshot is None:
+        if time.time() - start > timeout:
+            raise RuntimeError('no dashboard build after ' + str(timeout) + 's')
+        time.sleep(0.1)
+    return application, server, work_dir
+
+
+def stop_offline_app(application, server, work_dir):
+    application.scheduler.stop()
+    server.__exit__(None, None, None)
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,129 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from pull_updated_data import COUNTIES_COLS, NYC_FIPS
+from reference import county_names
+
+
+def load_county_universe() -> pd.DataFrame:
+    popest = county_names()
+    popest = popest[~popest['fips'].isin(NYC_FIPS)]
+    return popest[['fips', 'county', 'state']].reset_index(drop=True)
+
+
+# NYT-shaped us-counties history: one row per county per day, cumulative counts,
+# plus a single fips-less "New York City" row per day. counties are drawn from the
+# population workbook so they survive the popest merge
+def make_counties_df(n_counties=50, n_days=60, start='2020-03-01', seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_days).strftime('%Y-%m-%d')
+
+    universe = load_county_universe()
+    universe = universe.iloc[np.sort(rng.choice(len(universe), size=min(n_counties, len(universe)),
+                                                replace=False))]
+
+    fips = list(universe['fips']) + [np.nan]
+    county = [c.replace(' County', '') for c in universe['county']] + ['New York City']
+    state = list(universe['state']) + ['New York']
+
+    daily_cases = rng.poisson(20, size=(n_days, len(fips)))
+    daily_deaths = rng.binomial(daily_cases, 0.02)
+
+    counties_df = pd.DataFrame({
+        'date': np.repeat(dates, len(fips)),
+        'county': np.tile(county, n_days),
+        'state': np.tile(state, n_days),
+        'fips': np.tile(np.array(fips, dtype=object), n_days),
+        'cases': daily_cases.cumsum(axis=0).ravel(),
+        'deaths': daily_deaths.cumsum(axis=0).ravel()
+    })
+
+    return counties_df[COUNTIES_COLS]
+
+
+# CDC json payloads shaped like the three feeds update_db parses
+def make_cdc_payloads(n_days=60, start='2020-01-22', seed=0) -> dict:
+    rng = np.random.default_rng(seed)
+    states = pd.read_csv('state_abbrev_mapping.csv')['state_name']
+    n_cases = rng.integers(0, 5000, size=len(states))
+
+    cases_by_state = {'data': [{'Jurisdiction': state,
+                                'Range': '1 to 5000',
+                                'Cases Reported': str(n),
+                                'Community Transmission�': 'Yes, defined area(s)',
+                                'URL': 'http://example.org/'}
+                               for state, n in zip(states, n_cases)]}
+
+    def epi_curve(seed_offset):
+        daily = np.random.default_rng(seed + seed_offset).poisson(50, size=n_days)
+        dates = pd.date_range(start, periods=n_days).strftime('%Y-%m-%d').tolist()
+        return {'data': {'columns': [['x'] + dates, ['data1'] + daily.cumsum().tolist()]}}
+
+    return {
+        'cases_by_state': json.dumps(cases_by_state).encode(),
+        'cases_by_report_date': json.dumps(epi_curve(1)).encode(),
+        'cases_by_onset_date': json.dumps(epi_curve(2)).encode()
+    }
+
+
+# one grid cell per fips. cell edges carry vertices_per_edge jittered vertices, generated
+# per edge so neighbouring cells share identical borders like real county boundaries
+def make_counties_geojson(fips, vertices_per_edge=0, seed=0) -> dict:
+    width, height, n_cols = 1.0, 0.5, 60
+
+    def edge(a, b):
+        if vertices_per_edge == 0:
+            return [list(a)]
+        lo, hi = min(a, b), max(a, b)
+        rng = np.random.default_rng([seed, int(lo[0] * 1000) % 2 ** 31, int(lo[1] * 1000) % 2 ** 31,
+                                     int(hi[0] * 1000) % 2 ** 31, int(hi[1] * 1000) % 2 ** 31])
+        t = np.linspace(0, 1, vertices_per_edge + 2)[1:-1]
+        jitter = rng.normal(0, 0.01, size=vertices_per_edge)
+        normal = np.array([hi[1] - lo[1], lo[0] - hi[0]])
+        points = np.array(lo) + np.outer(t, np.array(hi) - np.array(lo)) + np.outer(jitter, normal)
+        points = np.round(points, 6).tolist()
+        if (a, b) != (lo, hi):
+            points = points[::-1]
+        return [list(a)] + points
+
+    features = []
+    for i, f in enumerate(sorted(fips)):
+        lon, lat = -125 + (i % n_cols) * width, 25 + (i // n_cols) * height
+        corners = [(lon, lat), (lon + width, lat), (lon + width, lat + height), (lon, lat + height)]
+        corners = [(round(x, 6), round(y, 6)) for x, y in corners]
+        ring = []
+        for k in range(4):
+            ring.extend(edge(corners[k], corners[(k + 1) % 4]))
+        ring.append(list(corners[0]))
+        features.append({'type': 'Feature',
+                         'id': f,
+                         'properties': {},
+                         'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# EVERY SOURCE THE PIPELINE FETCHES, KEYED BY FILE NAME: the NYT full and recent county
+# csvs (the recent one covers every day when there are fewer than recent_days), the three
+# CDC feeds and a geojson covering every county in the csvs
+def make_source_payloads(n_counties=200, n_days=120, recent_days=30) -> dict:
+    counties_df = make_counties_df(n_counties=n_counties, n_days=n_days)
+    dates = sorted(counties_df['date'].unique())
+    payloads = {name + '.json': body for name, body in make_cdc_payloads().items()}
+    payloads['us-counties.csv'] = counties_df.to_csv(index=False).encode()
+    payloads['us-counties-recent.csv'] = counties_df[counties_df['date'] >= dates[-min(recent_days, len(dates))]] \
+        .to_csv(index=False).encode()
+    fips = set(counties_df['fips'].dropna()) | set(NYC_FIPS)
+    payloads['counties.geojson'] = json.dumps(make_counties_geojson(fips)).encode()
+    return payloads
+
+
+def write_fixtures(out_dir, n_counties=200, n_days=120) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, body in make_source_payloads(n_counties=n_counties, n_days=n_days).items():
+        paths[name] = os.path.join(out_dir, name)
+        with open(paths[name], 'wb') as f:
+            f.write(body)
+    return paths
@@ -0,0 +1,169 @@
+import os
+import logging
+import datetime
+import hashlib
+import pandas as pd
+
+from fetch import commit_fetched, fetch_all
+from update_db import update_db, CDC_SOURCES
+from pull_updated_data import (
+    NYT_COUNTIES_URL,
+    NYT_COUNTIES_RECENT_URL,
+    NYT_TIMEOUT,
+    COUNTIES_GEOJSON_URL,
+    GEOJSON_TIMEOUT,
+    pull_table,
+    get_counties_high_water,
+    update_counties_table,
+    make_current_counties_df,
+    get_counties_geojson
+)
+from make_figures import (
+    make_cases_by_state_chloropleth,
+    make_cases_by_county_chloropleth,
+    make_cases_by_date_bar,
+    ANIMATION_DAYS
+)
+from county_store import load_counties_df
+from db import connect
+from analytics import ANALYTICS_DAYS, CountyAnalytics
+from shared_snapshot import publish_snapshot
+from geometry import geometry_key, shard_geojson, simplify_geojson
+from figure_cache import (
+    cached_figure,
+    cached_records,
+    lookup_cached_figure,
+    store_cached_figure,
+    save_manifest,
+    load_manifest_payloads
+)
+from figure_pool import get_figure_pool, figure_json
+from instrument import timed
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DB_PATH = '2019-nCoV-CDC.db'
+
+STATE_COLS = ['state','n_cases','range','community_spread']
+
+# trailing days of the county series loaded for the map and county table
+COUNTY_WORKING_DAYS = int(os.environ.get('COUNTY_WORKING_DAYS', 30))
+COUNTY_WORKING_COLS = ['date', 'county', 'state', 'fips', 'deaths', 'new_cases_per100k']
+
+
+# RUN THE PIPELINE AND RETURN EVERY FIGURE AND TABLE PAYLOAD THE LAYOUT NEEDS
+@timed
+def build_dashboard(conn) -> dict:
+    # FETCH EVERY SOURCE CONCURRENTLY
+    logger.info('FETCH CDC, NYT AND GEOJSON SOURCES')
+    counties_url = NYT_COUNTIES_RECENT_URL if get_counties_high_water(conn) else NYT_COUNTIES_URL
+    responses = fetch_all({**CDC_SOURCES,
+                           'counties': (counties_url, NYT_TIMEOUT),
+                           'counties_geojson': (COUNTIES_GEOJSON_URL, GEOJSON_TIMEOUT)})
+
+    # UPDATE DB
+    logger.info('UPDATE DATABASE W CDC DATA')
+    update_db(conn, responses={name: responses[name] for name in CDC_SOURCES})
+
+    # PULL UPDATED DATA
+    cases_by_state_df = (
+        pull_table(conn, 'cdc_cases_by_state')
+            .sort_values('n_cases',ascending=False)
+            .dropna().reset_index(drop=False)[STATE_COLS]
+    )
+    cases_by_report_date_df = pull_table(conn, 'cdc_cases_by_report_date').transpose()
+    cases_by_onset_date_df = pull_table(conn, 'cdc_cases_by_onset_date').transpose()
+
+    logger.info('cases by county')
+    update_counties_table(conn, prefetched={counties_url: responses['counties']})
+    # only the trailing working window and the columns the figures use leave the store
+    high_water = pd.Timestamp(get_counties_high_water(conn))
+    working_since = high_water - pd.Timedelta(days=max(COUNTY_WORKING_DAYS, ANIMATION_DAYS) - 1)
+    counties_df = load_counties_df(columns=COUNTY_WORKING_COLS, since=working_since)
+    current_counties_df = make_current_counties_df(counties_df)
+
+    # the map draws simplified, quantized county borders, loaded per state from shards by fips prefix
+    geojson_key = hashlib.sha1(responses['counties_geojson'].content).hexdigest()
+    counties = simplify_geojson(get_counties_geojson(responses['counties_geojson']), source_key=geojson_key)
+    county_geometry_key = shard_geojson(counties, geometry_key(geojson_key))
+    commit_fetched(responses['counties_geojson'])
+    fips_df = counties_df[['state', 'fips']].dropna().drop_duplicates('state')
+    state_fips_prefixes = dict(zip(fips_df['state'].astype(str), fips_df['fips'].astype(str).str[:2]))
+
+    display_counties_df = current_counties_df[['date','county','state','new_cases_per100k','deaths']] \
+                            .drop_duplicates() \
+                            .set_index('date') \
+                            .sort_values('new_cases_per100k', ascending=False)
+
+    # make Plotly figures, reusing cached json while their inputs are unchanged
+    payloads = {}
+    keys = {}
+
+    # the figures build as independent jobs in the figure pool, the county map's
+    # animation frames as one job per day, while the other figures run alongside
+    pool = get_figure_pool()
+    figure_jobs = {'cases_by_report_date_bar': ([cases_by_report_date_df], make_cases_by_date_bar,
+                                                (cases_by_report_date_df,)),
+                   'cases_by_onset_date_bar': ([cases_by_onset_date_df], make_cases_by_date_bar,
+                                               (cases_by_onset_date_df,)),
+                   'cases_by_state_chloropleth': ([cases_by_state_df], make_cases_by_state_chloropleth,
+                                                  (cases_by_state_df.copy(),))}
+    pending = {}
+    for name, (inputs, build, args) in figure_jobs.items():
+        keys[name], payloads[name] = lookup_cached_figure(name, inputs)
+        if payloads[name] is None:
+            pending[name] = pool.submit(figure_json, build, *args)
+
+    # no geometry: the page opens on the state map and each state drills down into its own counties
+    keys['cases_by_county_chloropleth'], payloads['cases_by_county_chloropleth'] = cached_figure(
+        'cases_by_county_chloropleth', [counties_df, current_counties_df, ANIMATION_DAYS],
+        lambda: make_cases_by_county_chloropleth(counties_df, current_counties_df, None, map=pool.map))
+
+    for name, future in pending.items():
+        keys[name], payloads[name] = store_cached_figure(name, keys[name], future.result())
+
+    # show data tables
+    for name, df in [('display_counties_records', display_counties_df),
+                     ('cases_by_state_records', cases_by_state_df),
+                     ('cases_by_report_date_records', cases_by_report_date_df),
+                     ('cases_by_onset_date_records', cases_by_onset_date_df)]:
+        keys[name], payloads[name] = cached_records(name, df)
+
+    # the metric views' series, computed once here and mapped read-only by every worker
+    analytics_start = high_water - pd.Timedelta(days=ANALYTICS_DAYS - 1)
+    shared_version = publish_snapshot(CountyAnalytics.from_store(since=analytics_start).snapshot_tables())
+
+    extras = {
+        'display_counties_columns': list(display_counties_df.columns),
+        'cases_by_report_date_columns': list(cases_by_report_date_df.columns),
+        'cases_by_onset_date_columns': list(cases_by_onset_date_df.columns),
+        # bounds and choices of the metric controls, the metric views load lazily per selection
+        'analytics_start': analytics_start.strftime('%Y-%m-%d'),
+        'analytics_end': high_water.strftime('%Y-%m-%d'),
+        'analytics_states': sorted(counties_df['state'].astype(str).unique()),
+        'shared_snapshot_version': shared_version,
+        'county_geometry_key': county_geometry_key,
+        'state_fips_prefixes': state_fips_prefixes,
+        'built_at': datetime.datetime.now().isoformat()
+    }
+    payloads.update(extras)
+    save_manifest(keys, extras)
+
+    return payloads
+
+
+# LOAD THE LAST BUILD FROM THE CACHE, RUNNING THE PIPELINE ONLY IF THERE IS NONE
+def load_dashboard(conn) -> dict:
+    payloads = load_manifest_payloads()
+    if payloads is None:
+        logger.info('no cached dashboard build, run pipeline')
+        return build_dashboard(conn)
+
+    logger.info('loaded dashboard payloads from cache')
+    return payloads
+
+
+# prebuild the cache before starting workers: python build_dashboard.py
+if __name__ == '__main__':
+    build_dashboard(connect(DB_PATH))
@@ -0,0 +1,61 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# callback results kept per worker, and seconds before one is rebuilt regardless
+CALLBACK_CACHE_SIZE = int(os.environ.get('CALLBACK_CACHE_SIZE', 256))
+CALLBACK_CACHE_TTL = int(os.environ.get('CALLBACK_CACHE_TTL', 15 * 60))
+
+
+# LRU CACHE WITH A TTL, EMPTIED WHENEVER THE DATA VERSION CHANGES
+class CallbackCache:
+
+    def __init__(self, maxsize=CALLBACK_CACHE_SIZE, ttl=CALLBACK_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # the cached value for key under this data version, building it on a miss
+    def get(self, version, key, build):
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    logger.info('data version changed, drop ' + str(len(self._entries)) + ' cached callback results')
+                self._entries.clear()
+                self.version = version
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        # built outside the lock so one slow view does not hold up the others
+        value = build()
+
+        with self._lock:
+            self.misses += 1
+            if version == self.version:
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'version': self.version, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,145 @@
+import os
+import shutil
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from instrument import timed
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# processed county series as parquet, one hive partition per month (month=YYYY-MM)
+COUNTY_STORE_DIR = os.environ.get('COUNTY_STORE_DIR', 'county_store')
+
+DICTIONARY_COLS = ['county', 'state', 'fips']
+
+
+def to_store_frame(counties_df) -> pd.DataFrame:
+    df = counties_df.copy()
+    df['date'] = pd.to_datetime(df['date'])
+    for col in DICTIONARY_COLS:
+        df[col] = df[col].astype('category')
+    # rows rebuilt from sqlite come back as 64 bit, store the compact widths
+    for col in df.columns:
+        if df[col].dtype == 'float64':
+            df[col] = df[col].astype('float32')
+        elif df[col].dtype == 'int64':
+            df[col] = df[col].astype('int32')
+    return df
+
+
+def partition_path(month, store_dir=None):
+    store_dir = store_dir or COUNTY_STORE_DIR
+    return os.path.join(store_dir, 'month=' + month, 'part-0.parquet')
+
+
+def store_exists(store_dir=None):
+    store_dir = store_dir or COUNTY_STORE_DIR
+    return os.path.isdir(store_dir) and any(name.startswith('month=') for name in os.listdir(store_dir))
+
+
+# LAST DATE IN THE STORE, FROM ITS LATEST WRITTEN MONTH, OR NONE WITHOUT A STORE
+def store_high_water(store_dir=None):
+    store_dir = store_dir or COUNTY_STORE_DIR
+    if not os.path.isdir(store_dir):
+        return None
+    months = sorted(name[len('month='):] for name in os.listdir(store_dir)
+                    if name.startswith('month=') and os.path.exists(partition_path(name[len('month='):], store_dir)))
+    if not months:
+        return None
+    dates = pq.read_table(partition_path(months[-1], store_dir), columns=['date']).column('date').to_pandas()
+    return pd.Timestamp(dates.max()).strftime('%Y-%m-%d')
+
+
+# MERGE ROWS INTO THE MONTH PARTITIONS THEY FALL IN, REWRITING ONLY THOSE MONTHS
+@timed
+def write_county_partitions(counties_df, store_dir=None) -> int:
+    store_dir = store_dir or COUNTY_STORE_DIR
+    df = to_store_frame(counties_df)
+    months = df['date'].dt.strftime('%Y-%m')
+
+    for month, month_df in df.groupby(months, sort=True):
+        path = partition_path(month, store_dir)
+        if os.path.exists(path):
+            existing_df = pq.read_table(path).to_pandas()
+            month_df = pd.concat([existing_df, month_df], ignore_index=True)
+            month_df = month_df.drop_duplicates(subset=['fips', 'date'], keep='last')
+        month_df = month_df.sort_values(['date', 'fips']).reset_index(drop=True)
+        for col in DICTIONARY_COLS:
+            month_df[col] = month_df[col].astype(str).astype('category')
+
+        # write then rename so readers never see a half-written month, the
+        # dot prefix keeps the temporary file out of dataset scans meanwhile
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), '.' + str(os.getpid()) + '.tmp')
+        pq.write_table(pa.Table.from_pandas(month_df, preserve_index=False), tmp_path,
+                       use_dictionary=DICTIONARY_COLS, compression='snappy')
+        os.replace(tmp_path, path)
+        logger.info(str(len(month_df)) + ' ROWS WRITTEN TO ' + path)
+
+    return len(df)
+
+
+# REBUILD THE WHOLE STORE FROM THE SQLITE COUNTY SERIES, ONE MONTH AT A TIME
+@timed
+def rebuild_county_store(conn, table, store_dir=None):
+    store_dir = store_dir or COUNTY_STORE_DIR
+    logger.info('rebuild county store from ' + table)
+    tmp_dir = store_dir + '.' + str(os.getpid()) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    months = [row[0] for row in conn.execute(
+        "SELECT DISTINCT substr(date, 1, 7) FROM " + table + " ORDER BY 1")]
+    for month in months:
+        month_df = pd.read_sql("SELECT * FROM " + table + " WHERE date LIKE ?", conn, params=(month + '-%',))
+        write_county_partitions(month_df, tmp_dir)
+
+    # swap by renames and delete the old store only once the new one is in its place,
+    # so readers never find the store missing or half deleted
+    old_dir = store_dir + '.' + str(os.getpid()) + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(store_dir):
+        os.replace(store_dir, old_dir)
+    if os.path.isdir(tmp_dir):
+        os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+# BRING A STORE THAT LAGS THE TABLE UP TO IT WITH THE ROWS AFTER THE STORE'S HIGH-WATER MARK
+@timed
+def backfill_county_store(conn, table, since, store_dir=None) -> int:
+    logger.info('backfill county store from ' + table + ' after ' + since)
+    counties_df = pd.read_sql("SELECT * FROM " + table + " WHERE date > ?", conn, params=(since,))
+    if counties_df.empty:
+        return 0
+    return write_county_partitions(counties_df, store_dir)
+
+
+# READ WITH COLUMN PROJECTION AND DATE/STATE PREDICATES PUSHED DOWN TO THE PARTITIONS
+@timed
+def load_counties_df(columns=None, since=None, until=None, states=None, store_dir=None) -> pd.DataFrame:
+    store_dir = store_dir or COUNTY_STORE_DIR
+    dataset = ds.dataset(store_dir, format='parquet', partitioning='hive')
+
+    predicate = None
+    for expression in [
+        (ds.field('month') >= pd.Timestamp(since).strftime('%Y-%m')) if since is not None else None,
+        (ds.field('date') >= pa.scalar(pd.Timestamp(since), pa.timestamp('ns'))) if since is not None else None,
+        (ds.field('month') <= pd.Timestamp(until).strftime('%Y-%m')) if until is not None else None,
+        (ds.field('date') <= pa.scalar(pd.Timestamp(until), pa.timestamp('ns'))) if until is not None else None,
+        ds.field('state').isin(list(states)) if states is not None else None
+    ]:
+        if expression is not None:
+            predicate = expression if predicate is None else predicate & expression
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != 'month']
+    table = dataset.to_table(columns=columns, filter=predicate)
+    counties_df = table.to_pandas()
+
+    logger.info(str(len(counties_df)) + ' ROWS LOADED FROM ' + store_dir)
+    return counties_df
+
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# read tuning applied to every connection: memory-mapped reads and page cache size (KiB when negative)
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 ** 2))
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+# OPEN A CONNECTION WITH READ-OPTIMIZED PRAGMAS
+# wal lets readers run alongside the ingest's writes, and sticks to the database file once set
+def connect(db_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=' + str(SQLITE_MMAP_SIZE))
+    conn.execute('PRAGMA cache_size=' + str(SQLITE_CACHE_SIZE))
+    return conn
+
+
+# ONE CONNECTION PER DATABASE PER PROCESS, SO ITS PAGE CACHE AND MMAP SURVIVE BETWEEN REFRESHES
+# keyed on the pid too, a forked worker never shares its parent's connection
+def shared_connection(db_path) -> sqlite3.Connection:
+    key = (os.getpid(), os.path.abspath(db_path))
+    with _connections_lock:
+        if key not in _connections:
+            logger.info('open shared connection to ' + db_path)
+            _connections[key] = connect(db_path)
+        return _connections[key]
+
+
+def close_shared_connections():
+    with _connections_lock:
+        for (pid, db_path), conn in list(_connections.items()):
+            if pid == os.getpid():
+                conn.close()
+                del _connections[(pid, db_path)]
+
+
+# DECODE A QUERY STRAIGHT INTO TYPED COLUMNS
+# one array per column from the fetched rows, handed to pandas without a copy or a
+# second pass over the values, unlike read_sql's per-column type inference
+def read_frame(conn, sql, params=(), index=None, dtypes=None) -> pd.DataFrame:
+    dtypes = dtypes or {}
+    c = conn.execute(sql, params)
+    names = [col[0] for col in c.description]
+    rows = c.fetchall()
+    columns = zip(*rows) if rows else [()] * len(names)
+    data = {name: np.array(col, dtype=dtypes.get(name, object)) for name, col in zip(names, columns)}
+
+    if index is None:
+        return pd.DataFrame(data, copy=False)
+    if isinstance(index, list):
+        index = pd.MultiIndex.from_arrays([data.pop(col) for col in index], names=index)
+    else:
+        index = pd.Index(data.pop(index), name=index)
+    return pd.DataFrame(data, index=index, copy=False)
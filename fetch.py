@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrument import timed
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# last ingested body and validators of every source, so unchanged sources answer 304
+FETCH_CACHE_DIR = os.environ.get('FETCH_CACHE_DIR', 'fetch_cache')
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 60)
+POOL_SIZE = 8
+RETRIES = 3
+
+# bodies are written to the fetch cache as they arrive, this many bytes at a time
+DOWNLOAD_CHUNK_BYTES = 1024 ** 2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# A FETCHED SOURCE: ITS BODY IN MEMORY OR IN A FILE, READ ON FIRST USE
+# validators are those of a new body, stored by commit_fetched once its consumer has used it
+class FetchResult:
+
+    def __init__(self, url, content=None, changed=True, path=None, validators=None):
+        self.url = url
+        self.changed = changed
+        self.path = path
+        self.validators = validators
+        self._content = content
+
+    @property
+    def content(self):
+        if self._content is None:
+            with open(self.path, 'rb') as f:
+                self._content = f.read()
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+# ONE KEEP-ALIVE SESSION SHARED BY EVERY DOWNLOAD
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=RETRIES,
+                          backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET']))
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def cache_paths(url):
+    stem = os.path.join(FETCH_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest())
+    return stem + '.body', stem + '.json'
+
+
+def load_validators(url):
+    body_path, meta_path = cache_paths(url)
+    if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+# a body downloaded but not yet ingested, it only replaces the stored body on commit
+def pending_path(url):
+    return cache_paths(url)[0] + '.pending'
+
+
+def write_atomic(path, chunks, mode) -> int:
+    tmp_path = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    n_bytes = 0
+    with open(tmp_path, mode) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            n_bytes += len(chunk)
+    os.replace(tmp_path, path)
+    return n_bytes
+
+
+# STORE THE BODY AND VALIDATORS OF A RESULT ONCE ITS CONSUMER HAS COMMITTED WHAT IT READ
+# until then the next fetch sends the previous validators, so a failed ingest is retried
+# with the full body instead of answered with a 304
+def commit_fetched(result):
+    if result is None or result.validators is None:
+        return
+    os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+    body_path, meta_path = cache_paths(result.url)
+    if result.url.startswith(('http://', 'https://')):
+        os.replace(pending_path(result.url), body_path)
+        result.path = body_path
+    else:
+        write_atomic(body_path, [b''], 'wb')
+    write_atomic(meta_path, [json.dumps(result.validators)], 'w')
+    result.validators = None
+
+
+# local paths stand in for urls when running offline, validated by mtime and size
+def fetch_local(path, conditional) -> FetchResult:
+    stat = os.stat(path)
+    validators = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if conditional and load_validators(path) == validators:
+        return FetchResult(path, changed=False, path=path)
+    return FetchResult(path, changed=True, path=path, validators=validators)
+
+
+def fetch(url, timeout=DEFAULT_TIMEOUT, conditional=True) -> FetchResult:
+    if not url.startswith(('http://', 'https://')):
+        return fetch_local(url, conditional)
+
+    headers = {}
+    validators = load_validators(url) if conditional else None
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    # the body streams to disk and is only read back if its content is asked for, so the
+    # full county history can be parsed from the file without ever being held in memory
+    with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            logger.info('UNCHANGED ' + url)
+            return FetchResult(url, changed=False, path=cache_paths(url)[0])
+        response.raise_for_status()
+
+        os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+        n_bytes = write_atomic(pending_path(url), response.iter_content(DOWNLOAD_CHUNK_BYTES), 'wb')
+        validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    logger.info(str(n_bytes) + ' BYTES FETCHED FROM ' + url)
+    return FetchResult(url, changed=True, path=pending_path(url), validators=validators)
+
+
+# DOWNLOAD {name: (url, timeout)} CONCURRENTLY OVER THE SHARED SESSION
+@timed
+def fetch_all(sources, max_workers=POOL_SIZE) -> dict:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(fetch, url, timeout) for name, (url, timeout) in sources.items()}
+        return {name: future.result() for name, future in futures.items()}
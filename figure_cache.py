@@ -0,0 +1,134 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+
+from instrument import record_payload_bytes
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# finished figures and table payloads, one json file per (name, input hash)
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', 'figure_cache')
+
+
+def hash_inputs(*inputs) -> str:
+    import pandas as pd
+    from plotly.utils import PlotlyJSONEncoder
+
+    h = hashlib.sha256()
+    for obj in inputs:
+        if isinstance(obj, pd.DataFrame):
+            h.update(json.dumps([str(col) for col in obj.columns]).encode())
+            h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        else:
+            h.update(json.dumps(obj, cls=PlotlyJSONEncoder).encode())
+    return h.hexdigest()[:16]
+
+
+def cache_path(name, key) -> str:
+    return os.path.join(FIGURE_CACHE_DIR, name + '-' + key + '.json')
+
+
+def load_cached(name, key):
+    path = cache_path(name, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        record_payload_bytes(name, os.fstat(f.fileno()).st_size)
+        return json.load(f)
+
+
+def save_cached(name, key, payload):
+    from plotly.utils import PlotlyJSONEncoder
+
+    save_cached_json(name, key, json.dumps(payload, cls=PlotlyJSONEncoder))
+
+
+# payloads already encoded, e.g. by a figure pool worker
+def save_cached_json(name, key, text):
+    os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+    path = cache_path(name, key)
+
+    # write then rename so a concurrent reader never sees a partial file
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# FIGURE AS A PLAIN DICT, BUILT ONLY WHEN ITS INPUTS CHANGE
+def cached_figure(name, inputs, build):
+    key, figure = lookup_cached_figure(name, inputs)
+    if figure is not None:
+        return key, figure
+
+    figure = build()
+    if not isinstance(figure, dict):
+        figure = figure.to_plotly_json()
+    save_cached(name, key, figure)
+    # round trip so a fresh build and a cache hit hand dash the same plain types
+    return key, load_cached(name, key)
+
+
+# the cached figure for these inputs, or None with the key to store a build under
+def lookup_cached_figure(name, inputs):
+    key = hash_inputs(*inputs)
+    figure = load_cached(name, key)
+    if figure is not None:
+        logger.info('load ' + name + ' from cache ' + key)
+    else:
+        logger.info('build ' + name + ' for cache ' + key)
+    return key, figure
+
+
+def store_cached_figure(name, key, text):
+    save_cached_json(name, key, text)
+    return key, load_cached(name, key)
+
+
+# DATATABLE RECORDS, KEYED BY THE FRAME THEY COME FROM
+def cached_records(name, df):
+    key = hash_inputs(df)
+    records = load_cached(name, key)
+    if records is not None:
+        logger.info('load ' + name + ' from cache ' + key)
+        return key, records
+
+    logger.info('build ' + name + ' for cache ' + key)
+    save_cached(name, key, df.to_dict('records'))
+    return key, load_cached(name, key)
+
+
+# THE MANIFEST NAMES THE CURRENT KEY OF EVERY PAYLOAD SO WORKERS CAN LOAD WITHOUT THE PIPELINE
+def save_manifest(keys, extras):
+    save_cached('manifest', 'current', {'keys': keys, 'extras': extras})
+    prune_stale_payloads(keys)
+
+
+# older versions of each payload, only removed once the manifest no longer names them:
+# a worker reading the previous manifest can still load everything it lists until then
+def prune_stale_payloads(keys):
+    for name, key in keys.items():
+        current_path = cache_path(name, key)
+        for stale_path in glob.glob(os.path.join(FIGURE_CACHE_DIR, name + '-*.json')):
+            if stale_path != current_path:
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError:
+                    pass
+
+
+def load_manifest_payloads():
+    manifest = load_cached('manifest', 'current')
+    if manifest is None:
+        return None
+
+    payloads = dict(manifest['extras'])
+    for name, key in manifest['keys'].items():
+        payload = load_cached(name, key)
+        if payload is None:
+            return None
+        payloads[name] = payload
+    return payloads
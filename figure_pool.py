@@ -0,0 +1,73 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# processes building figures, 1 builds them in the refresh thread
+FIGURE_WORKERS = int(os.environ.get('FIGURE_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_workers = None
+_lock = threading.Lock()
+
+
+# runs in a worker: the figure comes back as json text, never as a pickled plotly object
+def figure_json(build, *args) -> str:
+    import plotly.io as pio
+
+    figure = build(*args)
+    if not isinstance(figure, dict):
+        figure = figure.to_plotly_json()
+    return pio.to_json(figure, validate=False)
+
+
+# SAME INTERFACE AS THE POOL, RUNNING EVERY JOB IN THE CALLER
+class SerialExecutor:
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+# ONE POOL PER PROCESS, KEPT BETWEEN REFRESHES SO WORKERS ONLY IMPORT PLOTLY ONCE
+# workers come from a forkserver, never forked from the threaded app process
+def get_figure_pool(workers=None):
+    global _pool, _pool_workers
+    workers = workers or FIGURE_WORKERS
+    with _lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            if workers <= 1:
+                _pool = SerialExecutor()
+            else:
+                logger.info('start figure pool with ' + str(workers) + ' workers')
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['make_figures'])
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_figure_pool():
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+        _pool_workers = None
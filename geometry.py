@@ -0,0 +1,302 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from instrument import timed
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# simplified geometry, stored as topojson-style shared arcs
+GEOMETRY_CACHE_DIR = os.environ.get('GEOMETRY_CACHE_DIR', 'geometry_cache')
+
+# douglas-peucker tolerance in degrees (0 keeps every vertex) and the quantization grid
+COUNTY_GEOMETRY_TOLERANCE = float(os.environ.get('COUNTY_GEOMETRY_TOLERANCE', 0.01))
+COUNTY_GEOMETRY_QUANTIZATION = int(os.environ.get('COUNTY_GEOMETRY_QUANTIZATION', 100000))
+
+# state shards of the current geometry loaded by this process, by (key, fips prefix)
+_shards = {}
+_shards_lock = threading.Lock()
+
+
+def iter_polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+# SPLIT EVERY RING AT JUNCTIONS INTO ARCS SHARED BETWEEN NEIGHBOURING FEATURES
+def extract_arcs(geojson):
+    # a vertex is a junction where more than two distinct neighbours meet it,
+    # i.e. where the border between two features starts or ends
+    neighbours = {}
+    rings = []
+    for feature in geojson['features']:
+        for polygon in iter_polygons(feature['geometry']):
+            for ring in polygon:
+                points = [tuple(point[:2]) for point in ring]
+                if points[0] != points[-1]:
+                    points.append(points[0])
+                rings.append(points)
+                for i in range(len(points) - 1):
+                    neighbours.setdefault(points[i], set()).add(points[i + 1])
+                    neighbours.setdefault(points[i + 1], set()).add(points[i])
+    junctions = {point for point, adjacent in neighbours.items() if len(adjacent) > 2}
+
+    arcs = []
+    arc_ids = {}
+
+    def add_arc(points):
+        # an arc and its reverse are the same border, seen from either side
+        forward, backward = tuple(points), tuple(reversed(points))
+        if forward in arc_ids:
+            return arc_ids[forward]
+        if backward in arc_ids:
+            return ~arc_ids[backward]
+        arc_ids[forward] = len(arcs)
+        arcs.append(points)
+        return arc_ids[forward]
+
+    ring_arcs = []
+    for points in rings:
+        body = points[:-1]
+        cuts = [i for i, point in enumerate(body) if point in junctions]
+        if not cuts:
+            # a ring with no junction is one closed arc, rotated to a canonical start
+            start = min(range(len(body)), key=lambda i: body[i])
+            body = body[start:] + body[:start]
+            ring_arcs.append([add_arc(body + [body[0]])])
+            continue
+
+        body = body[cuts[0]:] + body[:cuts[0]]
+        cuts = [i - cuts[0] for i in cuts] + [len(body)]
+        body = body + [body[0]]
+        ring_arcs.append([add_arc(body[cuts[k]:cuts[k + 1] + 1]) for k in range(len(cuts) - 1)])
+
+    return arcs, ring_arcs
+
+
+def segment_distances(points, start, end):
+    a, b = points[start], points[end]
+    inner = points[start + 1:end]
+    ab = b - a
+    length = np.hypot(ab[0], ab[1])
+    if length == 0:
+        return np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+    return np.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / length
+
+
+def douglas_peucker(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = segment_distances(points, start, end)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            keep[start + 1 + i] = True
+            stack.append((start, start + 1 + i))
+            stack.append((start + 1 + i, end))
+    return keep
+
+
+# SIMPLIFY EACH SHARED ARC ONCE, SO NEIGHBOURS KEEP IDENTICAL BORDERS
+def simplify_arcs(arcs, ring_arcs, tolerance):
+    points = [np.asarray(arc, dtype=float) for arc in arcs]
+    keeps = []
+    for arc in points:
+        if tolerance <= 0 or len(arc) <= 2:
+            keeps.append(np.ones(len(arc), dtype=bool))
+        elif np.array_equal(arc[0], arc[-1]):
+            # closed arcs pivot on their farthest vertex so they cannot collapse to a point
+            far = int(np.argmax(np.hypot(arc[:, 0] - arc[0, 0], arc[:, 1] - arc[0, 1])))
+            keeps.append(np.concatenate([douglas_peucker(arc[:far + 1], tolerance)[:-1],
+                                         douglas_peucker(arc[far:], tolerance)]))
+        else:
+            keeps.append(douglas_peucker(arc, tolerance))
+
+    # a ring left with fewer than three distinct vertices gets back the most
+    # significant dropped vertex of each of its arcs, for every feature using them
+    for arc_refs in ring_arcs:
+        n_vertices = sum(int(keeps[ref if ref >= 0 else ~ref].sum()) - 1 for ref in arc_refs)
+        if n_vertices >= 3:
+            continue
+        for ref in arc_refs:
+            arc_id = ref if ref >= 0 else ~ref
+            dropped = np.flatnonzero(~keeps[arc_id])
+            if len(dropped):
+                distances = segment_distances(points[arc_id], 0, len(points[arc_id]) - 1)
+                keeps[arc_id][dropped[np.argmax(distances[dropped - 1])]] = True
+
+    return [arc[keep] for arc, keep in zip(points, keeps)]
+
+
+# TOPOJSON-STYLE TOPOLOGY: DELTA-ENCODED QUANTIZED ARCS REFERENCED BY EVERY FEATURE
+def to_topology(geojson, tolerance=COUNTY_GEOMETRY_TOLERANCE, quantization=COUNTY_GEOMETRY_QUANTIZATION) -> dict:
+    arcs, ring_arcs = extract_arcs(geojson)
+    arcs = simplify_arcs(arcs, ring_arcs, tolerance)
+
+    all_points = np.concatenate(arcs)
+    x0, y0 = all_points.min(axis=0)
+    x1, y1 = all_points.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) or 1
+    ky = (y1 - y0) / (quantization - 1) or 1
+
+    encoded_arcs = []
+    for arc in arcs:
+        q = np.round((arc - [x0, y0]) / [kx, ky]).astype(np.int64)
+        q = np.concatenate([q[:1], np.diff(q, axis=0)])
+        # consecutive vertices that land on the same grid cell add nothing
+        q = np.concatenate([q[:1], q[1:][np.any(q[1:] != 0, axis=1)]]) if len(q) > 2 else q
+        encoded_arcs.append(q.tolist())
+
+    geometries = []
+    ring_iter = iter(ring_arcs)
+    for feature in geojson['features']:
+        polygons = [[next(ring_iter) for _ in polygon] for polygon in iter_polygons(feature['geometry'])]
+        geometry = {'type': feature['geometry']['type'], 'id': feature.get('id'),
+                    'properties': feature.get('properties', {})}
+        geometry['arcs'] = polygons[0] if geometry['type'] == 'Polygon' else polygons
+        geometries.append(geometry)
+
+    return {'type': 'Topology',
+            'transform': {'scale': [kx, ky], 'translate': [x0, y0]},
+            'arcs': encoded_arcs,
+            'objects': {'counties': {'type': 'GeometryCollection', 'geometries': geometries}}}
+
+
+def from_topology(topology, precision=None) -> dict:
+    kx, ky = topology['transform']['scale']
+    x0, y0 = topology['transform']['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        coords = np.cumsum(np.asarray(arc, dtype=float).reshape(-1, 2), axis=0) * [kx, ky] + [x0, y0]
+        if precision is not None:
+            coords = np.round(coords, precision)
+        arcs.append(coords.tolist())
+
+    def ring(arc_refs):
+        coords = []
+        for ref in arc_refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            coords.extend(arc if not coords else arc[1:])
+        return coords
+
+    features = []
+    for geometry in topology['objects']['counties']['geometries']:
+        if geometry['type'] == 'Polygon':
+            coordinates = [ring(refs) for refs in geometry['arcs']]
+        else:
+            coordinates = [[ring(refs) for refs in polygon] for polygon in geometry['arcs']]
+        features.append({'type': 'Feature',
+                         'id': geometry['id'],
+                         'properties': geometry['properties'],
+                         'geometry': {'type': geometry['type'], 'coordinates': coordinates}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# decimals that keep the quantization grid, so the decoded json carries no extra digits
+def grid_precision(topology):
+    scale = min(topology['transform']['scale'])
+    return max(int(np.ceil(-np.log10(scale))), 0)
+
+
+# the simplified geometry of one source under these settings
+def geometry_key(source_key, tolerance=COUNTY_GEOMETRY_TOLERANCE, quantization=COUNTY_GEOMETRY_QUANTIZATION) -> str:
+    return hashlib.sha1((source_key + '-' + str(tolerance) + '-' + str(quantization)).encode()).hexdigest()[:16]
+
+
+# SIMPLIFIED GEOJSON FOR THE MAP, CACHED ON DISK PER SOURCE AND SETTINGS
+@timed
+def simplify_geojson(geojson, tolerance=COUNTY_GEOMETRY_TOLERANCE, quantization=COUNTY_GEOMETRY_QUANTIZATION,
+                     source_key=None) -> dict:
+    if source_key is None:
+        source_key = hashlib.sha1(json.dumps(geojson).encode()).hexdigest()
+    key = geometry_key(source_key, tolerance, quantization)
+    path = os.path.join(GEOMETRY_CACHE_DIR, 'counties-' + key + '.topojson')
+
+    if os.path.exists(path):
+        logger.info('load simplified counties geometry from cache ' + key)
+        with open(path) as f:
+            topology = json.load(f)
+    else:
+        logger.info('simplify counties geometry, tolerance ' + str(tolerance) + ', quantization ' + str(quantization))
+        topology = to_topology(geojson, tolerance, quantization)
+        os.makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+        tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(topology, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    return from_topology(topology, precision=grid_precision(topology))
+
+
+# [west, south, east, north] of every vertex of the features
+def features_bbox(features) -> list:
+    points = np.concatenate([np.asarray(ring, dtype=float)[:, :2]
+                             for feature in features
+                             for polygon in iter_polygons(feature['geometry'])
+                             for ring in polygon])
+    return points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+
+def shards_path(key) -> str:
+    return os.path.join(GEOMETRY_CACHE_DIR, 'counties-' + key + '.shards')
+
+
+# ONE FEATURE COLLECTION PER STATE FIPS PREFIX, SO A STATE'S MAP LOADS ONLY ITS OWN BORDERS
+# written once per simplified geometry; each shard carries its bbox for fitting the view
+@timed
+def shard_geojson(geojson, key) -> str:
+    path = shards_path(key)
+    if os.path.exists(path):
+        return key
+
+    logger.info('shard counties geometry ' + key + ' by state')
+    shards = {}
+    for feature in geojson['features']:
+        if feature.get('id'):
+            shards.setdefault(str(feature['id'])[:2], []).append(feature)
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+    for prefix, features in shards.items():
+        with open(os.path.join(tmp_path, prefix + '.geojson'), 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'bbox': features_bbox(features), 'features': features}, f,
+                      separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return key
+
+
+def load_geometry_shard(key, prefix) -> dict:
+    global _shards
+    with _shards_lock:
+        if (key, prefix) not in _shards:
+            path = os.path.join(shards_path(key), prefix + '.geojson')
+            if os.path.exists(path):
+                with open(path) as f:
+                    shard = json.load(f)
+            else:
+                shard = {'type': 'FeatureCollection', 'features': []}
+            # a new geometry replaces the shards of the previous one
+            _shards = {k: v for k, v in _shards.items() if k[0] == key}
+            _shards[(key, prefix)] = shard
+        return _shards[(key, prefix)]
+
+
+# the counties of these fips prefixes as one feature collection, bbox around all of them
+def load_state_geometry(key, prefixes) -> dict:
+    shards = [load_geometry_shard(key, prefix) for prefix in sorted(set(prefixes))]
+    geometry = {'type': 'FeatureCollection', 'features': [f for shard in shards for f in shard['features']]}
+    boxes = [shard['bbox'] for shard in shards if 'bbox' in shard]
+    if boxes:
+        geometry['bbox'] = [min(b[0] for b in boxes), min(b[1] for b in boxes),
+                            max(b[2] for b in boxes), max(b[3] for b in boxes)]
+    return geometry
@@ -0,0 +1,95 @@
+import os
+import gzip
+import hashlib
+import logging
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# responses validated against the data version: the layout and every callback
+HTTP_CACHE_PATHS = ['/_dash-layout', '/_dash-update-component']
+# revalidate on every use, a 304 costs the client one round trip and no body
+HTTP_CACHE_CONTROL = os.environ.get('HTTP_CACHE_CONTROL', 'no-cache')
+# bodies smaller than this go out as they are
+HTTP_COMPRESS_MIN_BYTES = int(os.environ.get('HTTP_COMPRESS_MIN_BYTES', 1024))
+HTTP_GZIP_LEVEL = int(os.environ.get('HTTP_GZIP_LEVEL', 6))
+HTTP_BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = ['application/json', 'text/html', 'text/css', 'application/javascript']
+
+# encoding -> (etag suffix, compress)
+ENCODINGS = {'gzip': ('-gz', lambda data: gzip.compress(data, compresslevel=HTTP_GZIP_LEVEL))}
+if brotli is not None:
+    ENCODINGS = {'br': ('-br', lambda data: brotli.compress(data, quality=HTTP_BROTLI_QUALITY)), **ENCODINGS}
+
+
+# strong validator: the same data version, path and callback request always produce the same body
+def make_etag(version, request) -> str:
+    h = hashlib.sha1(version.encode())
+    h.update(request.path.encode())
+    if request.method == 'POST':
+        h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+
+def accepted_encoding(request):
+    accepted = request.headers.get('Accept-Encoding', '')
+    for encoding in ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+# ETAGS, 304s AND COMPRESSION ON A FLASK SERVER
+# get_version returns the data version being served, or None while there is none
+def register_http_cache(server, get_version):
+
+    @server.before_request
+    def not_modified():
+        flask.g.etag = None
+        version = get_version()
+        if version is None or flask.request.path not in HTTP_CACHE_PATHS:
+            return None
+
+        etag = make_etag(version, flask.request)
+        flask.g.etag = etag
+        # the client holds one representation of this etag, plain or compressed
+        representations = {etag} | {etag + suffix for suffix, _ in ENCODINGS.values()}
+        matched = [tag for tag in flask.request.if_none_match if tag in representations]
+        if matched:
+            response = flask.Response(status=304)
+            response.set_etag(matched[0])
+            response.headers['Cache-Control'] = HTTP_CACHE_CONTROL
+            response.vary.add('Accept-Encoding')
+            return response
+        return None
+
+    @server.after_request
+    def compress_and_tag(response):
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        etag = flask.g.get('etag')
+        if etag is not None:
+            response.headers['Cache-Control'] = HTTP_CACHE_CONTROL
+
+        encoding = accepted_encoding(flask.request)
+        compressible = response.mimetype in COMPRESSIBLE_TYPES and 'Content-Encoding' not in response.headers
+        if compressible:
+            response.vary.add('Accept-Encoding')
+        if encoding is not None and compressible and response.content_length \
+                and response.content_length >= HTTP_COMPRESS_MIN_BYTES:
+            suffix, compress = ENCODINGS[encoding]
+            response.set_data(compress(response.get_data()))
+            response.headers['Content-Encoding'] = encoding
+            etag = etag + suffix if etag is not None else None
+
+        if etag is not None:
+            response.set_etag(etag)
+        return response
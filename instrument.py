@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+import resource
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# set MEMORY_LOG=1 to log peak rss and frame sizes after every pipeline stage
+MEMORY_LOG = os.environ.get('MEMORY_LOG', '0') == '1'
+# set INSTRUMENT=0 to leave stages undecorated and record no metrics
+INSTRUMENT = os.environ.get('INSTRUMENT', '1') == '1'
+
+METRICS_PREFIX = 'dashboard_'
+# upper bounds in seconds of the dash callback latency histogram
+CALLBACK_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# metrics of this process, read by /metrics: stage -> totals and last run, payload name ->
+# bytes of its json, callback output -> (bucket counts, sum, count)
+_metrics_lock = threading.Lock()
+_stages = {}
+_payload_bytes = {}
+_callbacks = {}
+
+
+# a VmRSS/VmHWM line of /proc/self/status in MB, None where /proc is not available
+def proc_status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# peak resident set size: VmHWM, which reset_peak_rss restarts, else ru_maxrss (kilobytes on linux)
+def peak_rss_mb() -> float:
+    peak = proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# resident set size now, where /proc is available; elsewhere the peak stands in for it
+def rss_mb() -> float:
+    rss = proc_status_mb('VmRSS')
+    if rss is not None:
+        return rss
+    return peak_rss_mb()
+
+
+# START A NEW PEAK: LINUX RESETS THE PEAK RSS WHEN 5 IS WRITTEN TO clear_refs
+# False where that isn't supported, the peak then still counts from process start
+def reset_peak_rss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def frame_mb(df) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+# MEMORY HOOK CALLED AFTER EACH STAGE, A NO-OP UNLESS MEMORY_LOG IS SET
+def log_memory(stage, **frames):
+    if not MEMORY_LOG:
+        return
+    sizes = ', '.join(name + ' ' + str(round(frame_mb(df), 1)) + ' MB' for name, df in frames.items())
+    logger.info('MEMORY ' + stage + ': peak rss ' + str(round(peak_rss_mb(), 1)) + ' MB'
+                + (', ' + sizes if sizes else ''))
+
+
+# rows and bytes of a frame or array, (None, None) for anything else. a (frame, ...)
+# tuple counts its frame, a returned int is a row count
+def rows_and_bytes(obj):
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if isinstance(obj, int) and not isinstance(obj, bool):
+        return obj, None
+    shape = getattr(obj, 'shape', None)
+    if not shape:
+        return None, None
+    if hasattr(obj, 'memory_usage'):
+        return shape[0], int(obj.memory_usage(index=True).sum())
+    return shape[0], getattr(obj, 'nbytes', None)
+
+
+def record_stage(stage, seconds, arg=None, result=None, failed=False):
+    rows_in = rows_and_bytes(arg)[0]
+    rows_out, frame_bytes = rows_and_bytes(result)
+    with _metrics_lock:
+        record = _stages.setdefault(stage, {'calls': 0, 'errors': 0, 'seconds': 0.0})
+        if failed:
+            record['errors'] += 1
+            return
+        record['calls'] += 1
+        record['seconds'] += seconds
+        record['last_seconds'] = seconds
+        for key, value in [('rows_in', rows_in), ('rows_out', rows_out), ('frame_bytes', frame_bytes)]:
+            if value is not None:
+                record[key] = value
+
+
+# DECORATOR TIMING A PIPELINE STAGE, NAMED module.function
+# records the duration, the rows of the first argument, the rows and memory of the frame
+# returned, and failures. with INSTRUMENT=0 the function is returned undecorated
+def timed(fn):
+    if not INSTRUMENT:
+        return fn
+    stage = fn.__module__ + '.' + fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            record_stage(stage, time.perf_counter() - start, failed=True)
+            raise
+        record_stage(stage, time.perf_counter() - start, args[0] if args else None, result)
+        return result
+    return wrapper
+
+
+# serialized size of a figure or table payload
+def record_payload_bytes(name, n_bytes):
+    if INSTRUMENT:
+        with _metrics_lock:
+            _payload_bytes[name] = n_bytes
+
+
+def observe_callback(callback, seconds):
+    with _metrics_lock:
+        counts, total, count = _callbacks.get(callback, ([0] * len(CALLBACK_LATENCY_BUCKETS), 0.0, 0))
+        for i, bound in enumerate(CALLBACK_LATENCY_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        _callbacks[callback] = (counts, total + seconds, count + 1)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(name + '="' + value + '"' for name, value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# EVERY METRIC OF THIS PROCESS IN THE PROMETHEUS TEXT EXPOSITION FORMAT
+def metrics_text() -> str:
+    with _metrics_lock:
+        stages = {stage: dict(record) for stage, record in _stages.items()}
+        payload_bytes = dict(_payload_bytes)
+        callbacks = {callback: (list(counts), total, count) for callback, (counts, total, count) in _callbacks.items()}
+
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        if not samples:
+            return
+        lines.append('# HELP ' + METRICS_PREFIX + name + ' ' + help_text)
+        lines.append('# TYPE ' + METRICS_PREFIX + name + ' ' + kind)
+        for suffix, labels, value in samples:
+            lines.append(METRICS_PREFIX + name + suffix + format_labels(labels) + ' ' + format_value(value))
+
+    def stage_samples(key):
+        return [('', {'stage': stage}, record[key]) for stage, record in sorted(stages.items()) if key in record]
+
+    family('stage_calls_total', 'counter', 'Completed runs of each pipeline stage.', stage_samples('calls'))
+    family('stage_errors_total', 'counter', 'Runs of each pipeline stage that raised.', stage_samples('errors'))
+    family('stage_seconds_total', 'counter', 'Time spent in each pipeline stage.', stage_samples('seconds'))
+    family('stage_last_seconds', 'gauge', 'Duration of the last run of each stage.', stage_samples('last_seconds'))
+    family('stage_rows_in', 'gauge', 'Rows of the frame the last run of each stage was given.',
+           stage_samples('rows_in'))
+    family('stage_rows_out', 'gauge', 'Rows the last run of each stage returned.', stage_samples('rows_out'))
+    family('stage_frame_bytes', 'gauge', 'Memory of the frame the last run of each stage returned.',
+           stage_samples('frame_bytes'))
+    family('payload_json_bytes', 'gauge', 'Serialized size of each figure and table payload.',
+           [('', {'payload': name}, n_bytes) for name, n_bytes in sorted(payload_bytes.items())])
+
+    samples = []
+    for callback, (counts, total, count) in sorted(callbacks.items()):
+        for bound, n in zip(CALLBACK_LATENCY_BUCKETS, counts):
+            samples.append(('_bucket', {'callback': callback, 'le': repr(bound)}, n))
+        samples.append(('_bucket', {'callback': callback, 'le': '+Inf'}, count))
+        samples.append(('_sum', {'callback': callback}, total))
+        samples.append(('_count', {'callback': callback}, count))
+    family('callback_seconds', 'histogram', 'Latency of dash callback requests.', samples)
+
+    return '\n'.join(lines) + '\n'
+
+
+# /metrics ON A FLASK SERVER, AND THE LATENCY OF EVERY DASH CALLBACK REQUEST
+# register before other request hooks so the latency includes theirs
+def register_metrics(server, path='/metrics'):
+    import flask
+
+    server.add_url_rule(path, 'metrics', lambda: flask.Response(
+        metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8'))
+    if not INSTRUMENT:
+        return
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.request_start = time.perf_counter()
+
+    @server.after_request
+    def observe_callback_latency(response):
+        if flask.request.path == '/_dash-update-component' and 'request_start' in flask.g:
+            body = flask.request.get_json(silent=True) or {}
+            observe_callback(str(body.get('output', 'unknown')), time.perf_counter() - flask.g.request_start)
+        return response
@@ -1,27 +1,38 @@
-import dash
-from dash import dash_table
-from dash import dcc
-from dash import html
+import os
 import plotly.graph_objects as go
 import logging
-import sqlite3
-import datetime
-import math
 import pandas as pd
 import numpy as np
-from update_db import update_db
-from pull_updated_data import pull_table
-from urllib.request import urlopen
-import json
+from reference import state_abbrevs
+from instrument import timed
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# days stepped through by the county map animation
+ANIMATION_DAYS = int(os.environ.get('ANIMATION_DAYS', 7))
 
+# the national view of the mapbox maps
+US_CENTER = {"lat": 37.0902, "lon": -95.7129}
+US_ZOOM = 2
+
+
+# mapbox center and zoom that fit a [west, south, east, north] bbox, the national view without one
+def fit_mapbox(bbox=None) -> dict:
+    if not bbox:
+        return {'center': US_CENTER, 'zoom': US_ZOOM}
+    west, south, east, north = bbox
+    # each zoom level halves the degrees across the map
+    zoom = np.log2(min(360 / max(east - west, 1e-3), 180 / max(north - south, 1e-3)))
+    return {'center': {'lat': (south + north) / 2, 'lon': (west + east) / 2},
+            'zoom': float(np.clip(zoom, US_ZOOM, 10))}
+
+
+@timed
 def make_cases_by_state_chloropleth(cases_by_state_df):
-    # create state name abbreviation mapping from file
-    mapping_dict = pd.read_csv('state_abbrev_mapping.csv',index_col='state_name').to_dict(orient='index')
-    cases_by_state_df['state_abbrev'] = [mapping_dict.get(i)['state_abbrev']
+    # state name abbreviation mapping from the reference data
+    mapping_dict = state_abbrevs()
+    cases_by_state_df['state_abbrev'] = [mapping_dict[i]
                                         for i in cases_by_state_df.reset_index().dropna().state.values]
 
     logger.info('create cases by state chloropleth')
@@ -44,34 +55,51 @@ def make_cases_by_state_chloropleth(cases_by_state_df):
     return cases_by_state_chloropleth
 
 
+# ONE ANIMATION FRAME: THAT DAY'S VALUES FOR THE COUNTIES DRAWN BY THE BASE TRACE
+# a plain dict, so it skips plotly validation and crosses process boundaries cheaply
+@timed
+def make_county_frame(day, plot_df) -> dict:
+    return {'data': [{'type': 'choroplethmapbox',
+                      'locations': plot_df.fips.to_numpy(),
+                      'z': np.log(plot_df.new_cases_per100k).to_numpy(),
+                      'text': (plot_df.county.astype(str) + ' County, ' + plot_df.state.astype(str)).to_numpy(),
+                      'customdata': round(plot_df.new_cases_per100k.astype(float),1).to_numpy()}],
+            'name': day}
+
+
+# the figure as a plain dict; frames are built with map, which may fan them out to a process pool.
+# without counties it carries no geometry, the state drill-down attaches each state's shard
+@timed
 def make_cases_by_county_chloropleth(
     counties_df, 
     current_counties_df, 
-    counties
-    ):
+    counties,
+    n_days=ANIMATION_DAYS,
+    map=map
+    ) -> dict:
 
     logger.info('cases by county chloropleth')
     days = counties_df.date.sort_values().unique()
-    days = days[-7:]
+    days = days[-n_days:]
     logger.info('fig data')
+    # the geometry is attached after validation, it is trusted and by far the largest input
     fig_data = go.Choroplethmapbox(
-                geojson=counties,
                 z=np.log(current_counties_df.new_cases_per100k),
                 locations=current_counties_df.fips,
                 colorbar_title='log(N Cases per 100k population)',
                 colorbar_title_side='right',
                 colorscale='Reds',
                 marker_opacity=0.5, marker_line_width=0,
-                text=(current_counties_df.county + ' County, ' + current_counties_df.state),
-                customdata=round(current_counties_df.new_cases_per100k,1),
+                text=(current_counties_df.county.astype(str) + ' County, ' + current_counties_df.state.astype(str)),
+                customdata=round(current_counties_df.new_cases_per100k.astype(float),1),
                 hovertemplate="%{text}<br>Cases per 100k: %{customdata}",
                 name=""
             )
 
     logger.info('fig layout')
     fig_layout = go.Layout(mapbox_style="carto-positron",
-                        mapbox_zoom=2, 
-                        mapbox_center={"lat": 37.0902, "lon": -95.7129},
+                        mapbox_zoom=US_ZOOM,
+                        mapbox_center=US_CENTER,
                         margin={"r": 0, "t": 0, "l": 0, "b": 0},
                         autosize=True,
                         title_text="log(N) Confirmed Cases/100k of COVID-19 by U.S. County",
@@ -120,19 +148,17 @@ def make_cases_by_county_chloropleth(
                         steps=[])
 
     logger.info('frames')
-    fig_frames = []
-    for day in days:
+    # geometry lives only on the base trace; frames carry just that day's values,
+    # split out of the animated days in one groupby pass
+    day_names = []
+    plot_dfs = []
+    animated_df = counties_df[counties_df.date.isin(days)]
+    for day, plot_df in animated_df.groupby('date', sort=True):
+        # dates come back from the county store as datetime64
+        day = pd.Timestamp(day).strftime('%Y-%m-%d')
         logger.info(f'frame {day}')
-        plot_df = counties_df[counties_df.date == day]
-        frame = go.Frame(data=[go.Choroplethmapbox(geojson=counties,
-                                                locations=plot_df.fips,
-                                                z=np.log(plot_df.new_cases_per100k),
-                                                name="",
-                                                text=(current_counties_df.county + ' County, ' + current_counties_df.state),
-                                                customdata=round(current_counties_df.new_cases_per100k,1),
-                                                hovertemplate="%{text}<br>%{customdata}")],
-                        name=day)
-        fig_frames.append(frame)
+        day_names.append(day)
+        plot_dfs.append(plot_df[['fips', 'county', 'state', 'new_cases_per100k']])
 
         slider_step = dict(args=[[day],
                                 dict(mode="immediate",
@@ -148,15 +174,94 @@ def make_cases_by_county_chloropleth(
     cases_by_county_chloropleth = \
         go.Figure(
             data=fig_data,
-            layout=fig_layout,
-            frames=fig_frames
+            layout=fig_layout
         )
     cases_by_county_chloropleth.update_yaxes(automargin=True)
 
+    cases_by_county_chloropleth = cases_by_county_chloropleth.to_plotly_json()
+    if counties is not None:
+        cases_by_county_chloropleth['data'][0]['geojson'] = counties
+    cases_by_county_chloropleth['frames'] = list(map(make_county_frame, day_names, plot_dfs))
+
     return cases_by_county_chloropleth
 
 
+# ONE STATE OF THE COUNTY MAP: ITS COUNTIES' VALUES IN THE BASE TRACE AND EVERY FRAME,
+# DRAWN OVER ITS OWN GEOMETRY AND FITTED TO IT
+@timed
+def make_state_county_chloropleth(county_figure, prefix, geometry, state) -> dict:
+    def state_trace(trace):
+        keep = [i for i, fips in enumerate(trace['locations']) if str(fips).startswith(prefix)]
+        return dict(trace, **{column: [trace[column][i] for i in keep]
+                              for column in ['locations', 'z', 'text', 'customdata'] if column in trace})
+
+    layout = dict(county_figure['layout'])
+    layout['mapbox'] = dict(layout.get('mapbox', {}), **fit_mapbox(geometry.get('bbox')))
+    layout['title'] = dict(layout.get('title', {}), text='log(N) Confirmed Cases/100k of COVID-19 in ' + state)
+    return dict(county_figure,
+                data=[dict(state_trace(county_figure['data'][0]), geojson=geometry)],
+                layout=layout,
+                frames=[dict(frame, data=[state_trace(trace) for trace in frame['data']])
+                        for frame in county_figure.get('frames', [])])
+
+
+@timed
 def make_cases_by_date_bar(cases_by_date_df):
     x = cases_by_date_df.transpose().reset_index().date
     y = cases_by_date_df.transpose().n_cases
-    return go.Figure([go.Bar(x=x, y=y)])
\ No newline at end of file
+    return go.Figure([go.Bar(x=x, y=y)])
+
+# MAPS AND BARS FOR ONE METRIC, BUILT PER SELECTION BY THE DASHBOARD CALLBACKS
+@timed
+def make_metric_county_chloropleth(values_df, counties, labels, title):
+    labels = labels.reindex(values_df.geo.astype(str))
+    fig = go.Figure(data=go.Choroplethmapbox(
+                geojson=counties,
+                z=values_df.value.astype(float),
+                locations=values_df.geo.astype(str),
+                colorbar_title=title,
+                colorbar_title_side='right',
+                colorscale='Reds',
+                marker_opacity=0.5, marker_line_width=0,
+                text=(labels.county + ' County, ' + labels.state).values,
+                customdata=round(values_df.value.astype(float), 1),
+                hovertemplate="%{text}<br>" + title + ": %{customdata}",
+                name=""
+            ))
+    view = fit_mapbox(counties.get('bbox'))
+    fig.update_layout(mapbox_style="carto-positron",
+                      mapbox_zoom=view['zoom'],
+                      mapbox_center=view['center'],
+                      margin={"r": 0, "t": 0, "l": 0, "b": 0},
+                      autosize=True,
+                      height=500)
+    return fig
+
+
+@timed
+def make_metric_state_chloropleth(values_df, title):
+    mapping_dict = state_abbrevs()
+    values_df = values_df[values_df.geo.astype(str).isin(mapping_dict)]
+    fig = go.Figure(data=go.Choropleth(
+                locations=values_df.geo.astype(str).map(mapping_dict),
+                z=values_df.value.astype(float),
+                locationmode='USA-states',
+                colorscale='Reds',
+                colorbar_title=title
+            ))
+    fig.update_layout(geo_scope='usa',
+                      title={'text': title + ' by U.S. State',
+                             'xanchor': 'center',
+                             'x': 0.5,
+                             'yanchor': 'top'})
+    return fig
+
+
+# one bar trace per geography over the selected dates
+@timed
+def make_metric_by_date_bar(values_df, title):
+    fig = go.Figure([go.Bar(x=plot_df.date, y=plot_df.value, name=str(geo))
+                     for geo, plot_df in values_df.groupby(values_df.geo.astype(str), sort=True)])
+    fig.update_layout(title={'text': title, 'xanchor': 'center', 'x': 0.5},
+                      barmode='group')
+    return fig
@@ -1,119 +1,435 @@
+import os
+import io
 import pandas as pd
+import numpy as np
 import json
-import sqlite3
-import datetime as dt
 import logging
-from urllib.request import urlopen
+
+from fetch import commit_fetched, fetch
+from instrument import log_memory, timed
+from db import read_frame
+from reference import lookup_popest
+from county_store import store_high_water, write_county_partitions, rebuild_county_store, backfill_county_store
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-CURRENT_DATE = dt.datetime.strftime(dt.datetime.now(), '%Y%m%d')
+# NYT reports the five boroughs as a single "New York City" row with no fips
+NYC_FIPS = ['36005', '36047', '36085', '36081', '36061']
+COUNTIES_COLS = ['date', 'county', 'state', 'fips', 'cases', 'deaths']
+# compact in-memory dtypes of the county series, dates are parsed to datetime64
+COUNTIES_DTYPES = {'county': 'category', 'state': 'category', 'fips': 'category',
+                   'cases': 'int32', 'deaths': 'float32'}
+COUNTIES_CSV_CHUNK_ROWS = 100000
+# rows per chunk of the streaming full-history ingest, 0 ingests the whole file at once
+COUNTIES_STREAM_CHUNK_ROWS = int(os.environ.get('COUNTIES_STREAM_CHUNK_ROWS', 0))
+# columns of the processed series as stored in the county table
+COUNTIES_READ_COLS = COUNTIES_COLS + ['cases_lagged', 'new_cases', 'new_cases_rolling', 'popest', 'new_cases_per100k']
 
+# source urls may point at local files to run offline
+NYT_COUNTIES_URL = os.environ.get(
+    'NYT_COUNTIES_URL',
+    'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
+)
+NYT_COUNTIES_RECENT_URL = os.environ.get(
+    'NYT_COUNTIES_RECENT_URL',
+    'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties-recent.csv'
+)
+NYT_TIMEOUT = (5, 300)
 
-# FUNCTION TO PULL TABLE FROM DB
-def pull_table(conn, name) -> pd.DataFrame:
-    c = conn.cursor()
-    c.execute("SELECT * FROM "+name+CURRENT_DATE)
+COUNTIES_GEOJSON_URL = os.environ.get(
+    'COUNTIES_GEOJSON_URL',
+    'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
+)
+GEOJSON_TIMEOUT = (5, 120)
+
+# columns read from each cdc snapshot table, its key and the dtypes they decode into
+CDC_READ_COLUMNS = {'cdc_cases_by_state': ['state', 'range', 'n_cases', 'community_transmission AS community_spread', 'url'],
+                    'cdc_cases_by_report_date': ['date', 'n_cases'],
+                    'cdc_cases_by_onset_date': ['date', 'n_cases']}
+CDC_READ_INDEX = {'cdc_cases_by_state': 'state',
+                  'cdc_cases_by_report_date': 'date',
+                  'cdc_cases_by_onset_date': 'date'}
+CDC_READ_DTYPES = {'cdc_cases_by_state': {'n_cases': 'float64'},
+                   'cdc_cases_by_report_date': {'n_cases': 'int64'},
+                   'cdc_cases_by_onset_date': {'n_cases': 'int64'}}
 
-    column_slice = {'cdc_cases_by_state': [0, 1, 2, 3, 4],
-                    'cdc_cases_by_report_date': [1, 2],
-                    'cdc_cases_by_onset_date': [1, 2]}
+# processed county series persisted between runs
+COUNTIES_TABLE = 'nyt_counties'
+ROLLING_WINDOW = 7
+# stored rows per county re-read to seed the lag and rolling mean of newly appended days,
+# at least ROLLING_WINDOW + 1: a county reports at most once a day
+CONTEXT_ROWS = 28
 
-    column_map = {'cdc_cases_by_state': {0: 'state', 1: 'range', 2: 'n_cases', 3: 'community_spread', 4: 'url'},
-                  'cdc_cases_by_report_date': {1: 'date', 2: 'n_cases'},
-                  'cdc_cases_by_onset_date': {1: 'date', 2: 'n_cases'}}
 
-    index_col = {'cdc_cases_by_state': 'state',
-                 'cdc_cases_by_report_date': 'date',
-                 'cdc_cases_by_onset_date': 'date'}
+# FUNCTION TO PULL TABLE FROM DB
+# latest snapshot by default, or one snapshot_date, or every snapshot between start and end
+@timed
+def pull_table(conn, name, snapshot_date=None, start=None, end=None) -> pd.DataFrame:
+    columns_from = ", ".join(CDC_READ_COLUMNS[name]) + " FROM " + name
+    key = CDC_READ_INDEX[name]
+    # snapshot_date is only selected to index a range of snapshots by it
+    select = "SELECT " + columns_from
+    if start is not None or end is not None:
+        sql = "SELECT snapshot_date, " + columns_from + " WHERE snapshot_date BETWEEN ? AND ? ORDER BY snapshot_date, " + key
+        params = (start or '0000-00-00', end or '9999-99-99')
+        index = ['snapshot_date', key]
+    elif snapshot_date is not None:
+        sql = select + " WHERE snapshot_date = ? ORDER BY " + key
+        params = (snapshot_date,)
+        index = key
+    else:
+        sql = select + " WHERE snapshot_date = (SELECT MAX(snapshot_date) FROM " + name + ") ORDER BY " + key
+        params = ()
+        index = key
 
-    df = pd.DataFrame(c.fetchall())[column_slice[name]].rename(columns=column_map[name]).set_index(index_col[name], drop=True)
+    df = read_frame(conn, sql, params, index=index, dtypes=CDC_READ_DTYPES[name])
 
     logger.info(str(len(df)) + " ROWS PULLED FROM "+name)
 
     return df
 
 
-def get_counties_df() -> pd.DataFrame:
-    logger.info('read data from source')
-    counties_df = pd.read_csv('https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv',
-                            dtype={'fips': 'str'})
-    nyc_fips = ['36005', '36047', '36085', '36081', '36061']
-    COLS = ['date', 'county', 'state', 'fips', 'cases', 'deaths']
-
-    def add_nyc_fips(row):
-        temp_df = pd.DataFrame(columns=COLS)
-        for i in nyc_fips:
-            s = pd.Series([row.date, row.county, row.state, i, row.cases, row.deaths],
-                        index=COLS)
-            temp_df = pd.concat([temp_df, pd.DataFrame(s).transpose()]).reset_index(drop=True)
-        return temp_df
+@timed
+def expand_nyc_fips(counties_df) -> pd.DataFrame:
+    # repeat every NYC row once per borough and tile the borough fips alongside,
+    # so the fan-out is a single gather instead of a concat per row
+    if counties_df['fips'].dtype == 'category':
+        # the borough fips join the categories so both halves concat as one categorical.
+        # set on a shallow copy, the caller's frame keeps its own categories
+        counties_df = counties_df.copy(deep=False)
+        counties_df['fips'] = counties_df['fips'].cat.add_categories(
+            [f for f in NYC_FIPS if f not in counties_df['fips'].cat.categories])
+    is_nyc = (counties_df['county'] == 'New York City').values
+    nyc_df = counties_df.loc[is_nyc, COUNTIES_COLS]
+    nyc_df = nyc_df.iloc[np.repeat(np.arange(len(nyc_df)), len(NYC_FIPS))].reset_index(drop=True)
+    nyc_df['fips'] = pd.Categorical(np.tile(NYC_FIPS, len(nyc_df) // len(NYC_FIPS)),
+                                    categories=counties_df['fips'].cat.categories) \
+        if counties_df['fips'].dtype == 'category' else np.tile(NYC_FIPS, len(nyc_df) // len(NYC_FIPS))
+
+    return pd.concat([counties_df[~is_nyc], nyc_df])
+
 
+# CAST TO THE COMPACT DTYPES IN PLACE, COLUMN BY COLUMN, SKIPPING ONES ALREADY CAST
+# (the frame passed in is modified)
+def compact_counties_dtypes(counties_df) -> pd.DataFrame:
+    for col, dtype in COUNTIES_DTYPES.items():
+        if col in counties_df.columns and counties_df[col].dtype != dtype:
+            counties_df[col] = counties_df[col].astype(dtype)
+    if counties_df['date'].dtype != 'datetime64[ns]':
+        counties_df['date'] = pd.to_datetime(counties_df['date'])
+    return counties_df
+
+
+# source is a url/path or an already fetched FetchResult
+@timed
+def read_counties_csv(source=NYT_COUNTIES_URL) -> pd.DataFrame:
+    if isinstance(source, str):
+        source = fetch(source, NYT_TIMEOUT)
+
+    # parse and fan out nyc a chunk at a time into columns allocated once up front,
+    # so the parser's buffers and the fan-out copies stay the size of one chunk.
+    # categoricals are kept as codes into categories that grow chunk by chunk
     logger.info('add nyc fips')
-    nyc_counties_df = pd.DataFrame(columns=COLS)
-    non_nyc_counties_df = counties_df[counties_df['county'] != 'New York City']
-    for row in counties_df[counties_df['county'] == 'New York City'].itertuples():
-        nyc_counties_df = pd.concat([nyc_counties_df, add_nyc_fips(row)]).reset_index(drop=True)
+    n_rows = source.content.count(b'\n') + (len(NYC_FIPS) - 1) * source.content.count(b',New York City,')
+    columns = {}
+    categories = {col: {} for col, dtype in COUNTIES_DTYPES.items() if dtype == 'category'}
+    n = 0
+    for chunk in pd.read_csv(io.BytesIO(source.content), dtype=COUNTIES_DTYPES, parse_dates=['date'],
+                             chunksize=COUNTIES_CSV_CHUNK_ROWS):
+        chunk = expand_nyc_fips(chunk)
+        for col in chunk.columns:
+            if col in categories:
+                # the trailing -1 is where missing values (code -1) land
+                lookup = categories[col]
+                chunk_codes = np.array([lookup.setdefault(c, len(lookup)) for c in chunk[col].cat.categories] + [-1],
+                                       dtype='int32')
+                values = chunk_codes[chunk[col].cat.codes.to_numpy()]
+            else:
+                values = chunk[col].to_numpy()
+            if col not in columns:
+                columns[col] = np.empty(n_rows, dtype=values.dtype)
+            columns[col][n: n + len(chunk)] = values
+        n += len(chunk)
 
-    counties_df = pd.concat([non_nyc_counties_df, nyc_counties_df])
+    counties_df = pd.DataFrame({
+        col: pd.Categorical.from_codes(values[:n], categories=list(categories[col])) if col in categories
+        else values[:n]
+        for col, values in columns.items()
+    })
+    log_memory('read csv', counties_df=counties_df)
+    return counties_df
 
-    logger.info('calculate new cases')
-    # calculate new cases per day
-    counties_df = counties_df.sort_values(by='date', ascending=True)
-    counties_df['cases_lagged'] = counties_df.groupby('fips')['cases'].shift(1)
-    counties_df['new_cases'] = counties_df['cases'] - counties_df['cases_lagged']
-    counties_df.loc[counties_df['new_cases'] < 0, 'new_cases'] = 0
-    # counties_df['new_cases'] = counties_df['new_cases'].astype(np.longdouble)
+
+@timed
+def get_counties_df(source=NYT_COUNTIES_URL) -> pd.DataFrame:
+    logger.info('read data from source')
+    counties_df = read_counties_csv(source)
+
+    return calculate_counties_metrics(counties_df)
+
+
+# (group, day) as one sortable int64: the group in the high bits, days since the epoch in the low 32
+def group_day_keys(codes, dates):
+    keys = codes.astype('int64')
+    keys <<= 32
+    keys |= dates.view('int64') // (86400 * 10 ** 9)
+    return keys
+
+
+# MEAN PER CALENDAR DAY OVER THE TRAILING window DAYS, FOR ROWS SORTED BY group_day_keys
+# one cumulative sum over every group: a window's total is the difference of the sums at
+# its two ends. days missing from a group add nothing to its windows, and a window
+# holding a NaN (the unknown first new_cases of a county) is NaN
+@timed
+def rolling_calendar_mean(keys, values, window=ROLLING_WINDOW):
+    window_start = np.searchsorted(keys, keys - (window - 1), side='left')
+
+    isnan = np.isnan(values)
+    sums = np.r_[0, np.cumsum(np.where(isnan, 0, values), dtype='float64')]
+    means = sums[1:] - sums[window_start]
+    means /= window
+    if isnan.any():
+        nans = np.r_[0, np.cumsum(isnan, dtype='int32')]
+        means[nans[1:] - nans[window_start] > 0] = np.nan
+    return means
+
+
+# state the streaming ingest carries from one chunk to the next: every county's rows of
+# its last ROLLING_WINDOW days, as group_day_keys with their cases and new cases
+def empty_carry() -> dict:
+    return {'keys': np.empty(0, dtype='int64'),
+            'cases': np.empty(0, dtype='int32'),
+            'new_cases': np.empty(0, dtype='float32')}
+
+
+# NEW CASES, ROLLING MEAN AND PER 100K FOR A RUN OF ROWS
+# codes index popest_by_code and follow a county from run to run. with a carry (see
+# empty_carry) the run continues the series of earlier runs and the updated carry is
+# returned alongside; without one the run is the whole series
+@timed
+def calculate_metrics_step(counties_df, codes, popest_by_code, carry=None):
+    # one sort by (fips, date) is the only full copy of the frame; counties without
+    # a population estimate drop out in the same take, as they did with the inner merge
+    row_popest = np.where(codes >= 0, popest_by_code[codes], np.nan) if len(popest_by_code) \
+        else np.full(len(codes), np.nan)
+    keys = group_day_keys(codes, counties_df['date'].to_numpy())
+    keep = np.flatnonzero(~np.isnan(row_popest))
+    n_carry = 0 if carry is None else len(carry['keys'])
+    if n_carry:
+        # carried rows sort in ahead of the run's rows of the same county
+        keys = np.r_[carry['keys'], keys[keep]]
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        is_new = order >= n_carry
+        rows = keep[order[is_new] - n_carry]
+        cases = np.r_[carry['cases'], counties_df['cases'].to_numpy()[keep]][order]
+        groups = keys >> 32
+        counties_df = counties_df.take(rows)
+    else:
+        rows = keep[np.argsort(keys[keep], kind='stable')]
+        is_new = slice(None)
+        counties_df = counties_df.take(rows)
+        keys = keys[rows]
+        cases = counties_df['cases'].to_numpy()
+        groups = codes[rows]
+    counties_df.index = pd.RangeIndex(len(counties_df))
+    row_popest = row_popest[rows].astype('int32')
+    group_start = np.r_[True, groups[1:] != groups[:-1]][:len(keys)]
+    del keep, rows, groups
+    if n_carry and (is_new[:-1] & ~is_new[1:] & ~group_start[1:]).any():
+        raise ValueError('county rows out of date order, a run holds days older than ones already processed')
+
+    # calculate new cases per day, contiguous within each county
+    cases_lagged = np.r_[np.nan, cases[:-1]][:len(cases)].astype('float32')
+    cases_lagged[group_start] = np.nan
+    new_cases = cases.astype('float32') - cases_lagged
+    np.maximum(new_cases, 0, out=new_cases)
+    if n_carry:
+        new_cases[~is_new] = carry['new_cases'][order[~is_new]]
+    counties_df['cases_lagged'] = cases_lagged[is_new]
+    counties_df['new_cases'] = new_cases[is_new]
+    log_memory('new cases', counties_df=counties_df)
 
     logger.info('calculate rolling mean')
-    # calculate 7 day rolling mean of new cases
-    newcases_rolling =  (
-            counties_df
-            .set_index(['fips','date'])
-            .drop(['county', 'state'])
-            .groupby('fips')
-            .rolling(window=7)
-            .mean()['new_cases']
-            .rename('new_cases_rolling')
-            .droplevel(0)
-            )
-    counties_df = counties_df.merge(
-        pd.DataFrame(newcases_rolling),
-        on=['fips', 'date'],
-        how='left'
-    )
+    # calculate 7 day rolling mean of new cases over calendar days
+    counties_df['new_cases_rolling'] = rolling_calendar_mean(keys, new_cases)[is_new].astype('float32')
+    log_memory('rolling mean', counties_df=counties_df)
 
-    # read in population data
-    dtypes={
-        'state_fips': str,
-        'county_fips': str,
-        'fips': str,
-        'state': str,
-        'county': str,
-        'popest': int
-    }
-    popest = pd.read_excel('popest2019_nyc.xlsx', dtype=dtypes)
-    popest[popest['county_fips'] != "000"]
-    popest = popest[['fips','popest']]
-
-    # incorporate into dataset
-    counties_df = counties_df.merge(
-        popest,
-        on='fips'
-    )
+    # incorporate population
+    counties_df['popest'] = row_popest
 
     logger.info('calculate new cases per 100k')
     # calculate rolling new cases per 100k population
     counties_df['new_cases_per100k'] = (
         (counties_df['new_cases_rolling']/counties_df['popest']) * 100000
+    ).astype('float32')
+    log_memory('new cases per 100k', counties_df=counties_df)
+
+    if carry is None or not len(keys):
+        return counties_df, carry
+    # keep each county's rows within a window of its latest day, counties missing from
+    # this run keep the rows they had
+    group_last = keys[np.r_[np.flatnonzero(group_start[1:]), len(keys) - 1]]
+    retain = keys > group_last[np.cumsum(group_start) - 1] - ROLLING_WINDOW
+    return counties_df, {'keys': keys[retain], 'cases': cases[retain], 'new_cases': new_cases[retain]}
+
+
+@timed
+def calculate_counties_metrics(counties_df) -> pd.DataFrame:
+    logger.info('calculate new cases')
+    counties_df = compact_counties_dtypes(counties_df)
+    popest_by_code = lookup_popest(counties_df['fips'].cat.categories)
+    counties_df, _ = calculate_metrics_step(counties_df, counties_df['fips'].cat.codes.to_numpy(), popest_by_code)
+    return counties_df
+
+
+# STREAMING INGEST: THE SERIES OF get_counties_df, ONE CHUNK OF CSV ROWS AT A TIME
+# yields each chunk's processed rows, sorted by fips then date within the chunk. memory
+# is bounded by the chunk plus the per-county carry, so the source must list days in
+# order, as the NYT file does. local paths and fetched bodies are parsed straight from disk
+def stream_counties_df(source=NYT_COUNTIES_URL, chunk_rows=None):
+    chunk_rows = chunk_rows or COUNTIES_STREAM_CHUNK_ROWS or COUNTIES_CSV_CHUNK_ROWS
+    if isinstance(source, str) and source.startswith(('http://', 'https://')):
+        source = fetch(source, NYT_TIMEOUT)
+    if isinstance(source, str):
+        csv = source
+    else:
+        csv = source.path if source.path is not None else io.BytesIO(source.content)
+
+    # codes into every fips seen so far, so a county keeps its code and carry across chunks
+    lookup = {}
+    popest_by_code = np.empty(0)
+    carry = empty_carry()
+    for chunk in pd.read_csv(csv, dtype=COUNTIES_DTYPES, parse_dates=['date'], chunksize=chunk_rows):
+        chunk = compact_counties_dtypes(expand_nyc_fips(chunk))
+        chunk_codes = np.array([lookup.setdefault(f, len(lookup)) for f in chunk['fips'].cat.categories] + [-1],
+                               dtype='int32')
+        if len(lookup) > len(popest_by_code):
+            popest_by_code = np.r_[popest_by_code, lookup_popest(list(lookup)[len(popest_by_code):])]
+        codes = chunk_codes[chunk['fips'].cat.codes.to_numpy()]
+        counties_df, carry = calculate_metrics_step(chunk, codes, popest_by_code, carry)
+        yield counties_df
+
+
+# the table keeps iso date strings so sqlite date functions and string comparisons work on it
+def write_counties_table(conn, counties_df, if_exists, table=COUNTIES_TABLE):
+    counties_df.assign(date=counties_df['date'].dt.strftime('%Y-%m-%d')) \
+        .to_sql(name=table, con=conn, index=False, if_exists=if_exists)
+
+
+# WRITE THE STREAMED SERIES CHUNK BY CHUNK, SWAPPED IN FOR THE COUNTY TABLE ONCE COMPLETE
+# so a failed ingest never leaves a partial history behind to be appended to
+@timed
+def stream_counties_table(conn, source) -> int:
+    ingest_table = COUNTIES_TABLE + '_ingest'
+    n_rows = 0
+    for i, counties_df in enumerate(stream_counties_df(source)):
+        write_counties_table(conn, counties_df, if_exists='append' if i else 'replace', table=ingest_table)
+        n_rows += len(counties_df)
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS " + COUNTIES_TABLE)
+        conn.execute("ALTER TABLE " + ingest_table + " RENAME TO " + COUNTIES_TABLE)
+    return n_rows
+
+
+def get_counties_high_water(conn):
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (COUNTIES_TABLE,))
+    if c.fetchone() is None:
+        return None
+    c.execute("SELECT MAX(date) FROM " + COUNTIES_TABLE)
+    return c.fetchone()[0]
+
+
+# APPEND DAYS NEWER THAN THE STORED HIGH-WATER MARK TO THE COUNTY SERIES
+# prefetched maps urls to FetchResults already downloaded alongside the other sources
+@timed
+def update_counties_table(conn, url=NYT_COUNTIES_URL, recent_url=NYT_COUNTIES_RECENT_URL, prefetched=None) -> int:
+    prefetched = prefetched or {}
+    high_water = get_counties_high_water(conn)
+
+    if high_water is None:
+        logger.info('no stored county series, ingest full history')
+        if COUNTIES_STREAM_CHUNK_ROWS:
+            n_rows = stream_counties_table(conn, prefetched.get(url, url))
+        else:
+            counties_df = get_counties_df(prefetched.get(url, url))
+            write_counties_table(conn, counties_df, if_exists='replace')
+            n_rows = len(counties_df)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_" + COUNTIES_TABLE + "_date ON " + COUNTIES_TABLE + " (date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_" + COUNTIES_TABLE + "_fips_date ON "
+                     + COUNTIES_TABLE + " (fips, date)")
+        conn.commit()
+        logger.info(str(n_rows) + " ROWS PERSISTED TO " + COUNTIES_TABLE)
+        rebuild_county_store(conn, COUNTIES_TABLE)
+        commit_fetched(prefetched.get(url))
+        return n_rows
+
+    # the columnar store is derived from the table: rebuild it if it went missing, and catch
+    # it up if a run committed rows to the table but failed before writing them to the store
+    stored_through = store_high_water()
+    if stored_through is None:
+        rebuild_county_store(conn, COUNTIES_TABLE)
+    elif stored_through < high_water:
+        backfill_county_store(conn, COUNTIES_TABLE, stored_through)
+
+    logger.info('county series stored through ' + high_water + ', read recent days from source')
+    recent_response = prefetched.get(recent_url) or fetch(recent_url, NYT_TIMEOUT)
+    new_df = read_counties_csv(recent_response)
+    # skip by the stored data, not by the fetch cache: a restored or older table still catches
+    # up from a recent file that is unchanged since the last fetch
+    if new_df.empty or new_df['date'].max() <= pd.Timestamp(high_water):
+        logger.info('recent county file has no days after ' + high_water)
+        commit_fetched(recent_response)
+        return 0
+    # the recent file only covers a trailing window, fall back to the full history on a gap
+    first_recent = pd.Timestamp(new_df['date'].min())
+    if first_recent > pd.Timestamp(high_water) + pd.Timedelta(days=1):
+        logger.info('recent file starts ' + str(first_recent.date()) + ', read full history from source')
+        new_df = read_counties_csv(url)
+    new_df = new_df[new_df['date'] > high_water]
+
+    if new_df.empty:
+        logger.info('county series already up to date')
+        commit_fetched(recent_response)
+        return 0
+
+    # each changed fips's last stored rows seed its lag and rolling window, however long ago
+    # it last reported. read through the (fips, date) index, one fips at a time
+    context_df = pd.read_sql(
+        "SELECT " + ", ".join('c.' + col for col in COUNTIES_COLS) + " FROM json_each(?) AS f JOIN "
+        + COUNTIES_TABLE + " AS c ON c.rowid IN (SELECT rowid FROM " + COUNTIES_TABLE
+        + " WHERE fips = f.value ORDER BY date DESC LIMIT ?)",
+        conn,
+        params=(json.dumps(new_df['fips'].dropna().unique().tolist()), CONTEXT_ROWS),
+        parse_dates=['date']
     )
-    
+
+    counties_df = calculate_counties_metrics(pd.concat([context_df, new_df], ignore_index=True))
+    counties_df = counties_df[counties_df['date'] > high_water]
+
+    write_counties_table(conn, counties_df, if_exists='append')
+    conn.commit()
+    logger.info(str(len(counties_df)) + " ROWS APPENDED TO " + COUNTIES_TABLE)
+    write_county_partitions(counties_df)
+    commit_fetched(recent_response)
+
+    return len(counties_df)
+
+
+@timed
+def read_counties_df(conn) -> pd.DataFrame:
+    counties_df = compact_counties_dtypes(
+        pd.read_sql("SELECT " + ", ".join(COUNTIES_READ_COLS) + " FROM " + COUNTIES_TABLE + " ORDER BY date", conn, parse_dates=['date']))
+    logger.info(str(len(counties_df)) + " ROWS PULLED FROM " + COUNTIES_TABLE)
     return counties_df
 
+
+@timed
 def make_current_counties_df(counties_df):
     logger.info('make current counties df')
-    most_recent_date = pd.DataFrame(counties_df.groupby(['fips']).max()['date'])
+    most_recent_date = pd.DataFrame(counties_df.groupby('fips', observed=True)['date'].max())
     current_counties_df = counties_df.join(
         most_recent_date, 
         on='fips',
@@ -126,8 +442,9 @@ def make_current_counties_df(counties_df):
     current_counties_df = current_counties_df[counties_df.columns]
     return current_counties_df
 
-def get_counties_geojson():
-    url = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
-    with urlopen(url) as response:
-        counties = json.load(response)
+@timed
+def get_counties_geojson(response=None):
+    if response is None:
+        response = fetch(COUNTIES_GEOJSON_URL, GEOJSON_TIMEOUT)
+    counties = json.loads(response.content)
     return counties
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import glob
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+POPEST_PATH = 'popest2019_nyc.xlsx'
+STATE_ABBREV_PATH = 'state_abbrev_mapping.csv'
+# converted reference data, one file per source version
+REFERENCE_CACHE_DIR = os.environ.get('REFERENCE_CACHE_DIR', 'reference_cache')
+
+# five digit county fips index the population array directly, -1 marks no estimate
+FIPS_SLOTS = 100000
+NO_POPEST = -1
+
+_popest = None
+_state_abbrevs = None
+_lock = threading.Lock()
+
+
+def source_key(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def reference_path(name, key, ext) -> str:
+    return os.path.join(REFERENCE_CACHE_DIR, name + '-' + key + ext)
+
+
+def save_reference(name, key, ext, save):
+    os.makedirs(REFERENCE_CACHE_DIR, exist_ok=True)
+    path = reference_path(name, key, ext)
+    # write then rename so a worker converting concurrently never reads a partial file
+    tmp_path = os.path.join(REFERENCE_CACHE_DIR, '.' + name + '-' + key + '.' + str(os.getpid()) + '.tmp' + ext)
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+    for stale_path in glob.glob(os.path.join(REFERENCE_CACHE_DIR, name + '-*' + ext)):
+        if stale_path != path:
+            os.remove(stale_path)
+
+
+# CONVERT THE POPULATION WORKBOOK ONCE: AN ARRAY OF POPULATION BY INTEGER FIPS, AND COUNTY NAMES
+# only county rows are kept: state totals (county fips 000) never match a county
+@timed
+def convert_popest(key, path=POPEST_PATH):
+    logger.info('convert ' + path + ' to reference data')
+    popest = pd.read_excel(path, dtype={'fips': str, 'county_fips': str, 'state': str, 'county': str,
+                                        'popest': 'int64'})
+    popest = popest[popest['county_fips'] != '000']
+
+    popest_by_fips = np.full(FIPS_SLOTS, NO_POPEST, dtype='int32')
+    popest_by_fips[popest['fips'].astype(int).to_numpy()] = popest['popest'].to_numpy()
+    save_reference('popest', key, '.npy', lambda tmp_path: np.save(tmp_path, popest_by_fips))
+    save_reference('counties', key, '.csv',
+                   lambda tmp_path: popest[['fips', 'county', 'state']].to_csv(tmp_path, index=False))
+
+
+def ensure_converted() -> str:
+    key = source_key(POPEST_PATH)
+    if not (os.path.exists(reference_path('popest', key, '.npy'))
+            and os.path.exists(reference_path('counties', key, '.csv'))):
+        convert_popest(key)
+    return key
+
+
+# LOADED ON FIRST USE AND MEMORY-MAPPED, SO FORKED WORKERS SHARE ONE COPY OF THE PAGES
+def popest_by_fips() -> np.ndarray:
+    global _popest
+    with _lock:
+        if _popest is None:
+            _popest = np.load(reference_path('popest', ensure_converted(), '.npy'), mmap_mode='r')
+        return _popest
+
+
+# fips, county and state of every county with a population estimate
+def county_names() -> pd.DataFrame:
+    with _lock:
+        key = ensure_converted()
+    return pd.read_csv(reference_path('counties', key, '.csv'), dtype=str)
+
+
+# population of each fips string as float64, NaN where there is no county estimate
+def lookup_popest(fips) -> np.ndarray:
+    fips = pd.to_numeric(pd.Series(fips, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    valid = ~np.isnan(fips) & (fips >= 0) & (fips < FIPS_SLOTS)
+    popest = np.full(len(fips), np.nan)
+    popest[valid] = popest_by_fips()[fips[valid].astype('int64')]
+    popest[popest == NO_POPEST] = np.nan
+    return popest
+
+
+# state name -> postal abbreviation
+def state_abbrevs() -> dict:
+    global _state_abbrevs
+    if _state_abbrevs is None:
+        _state_abbrevs = pd.read_csv(STATE_ABBREV_PATH, index_col='state_name')['state_abbrev'].to_dict()
+    return _state_abbrevs
+
+
+# convert the reference files before starting workers: python reference.py
+if __name__ == '__main__':
+    popest = popest_by_fips()
+    logger.info(str(int((popest != NO_POPEST).sum())) + ' COUNTY POPULATION ESTIMATES IN ' + REFERENCE_CACHE_DIR)
@@ -0,0 +1,138 @@
+import os
+import time
+import fcntl
+import logging
+import datetime
+import threading
+
+from figure_cache import FIGURE_CACHE_DIR, cache_path, load_manifest_payloads
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# seconds between ingests, and between checks for a build published by another worker
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 6 * 60 * 60))
+MANIFEST_POLL_INTERVAL = int(os.environ.get('MANIFEST_POLL_INTERVAL', 60))
+
+
+def manifest_mtime():
+    try:
+        return os.path.getmtime(cache_path('manifest', 'current'))
+    except OSError:
+        return None
+
+
+# RUNS THE PIPELINE OFF THE REQUEST PATH AND SWAPS IN EACH FINISHED BUILD
+class RefreshScheduler:
+
+    # snapshot serves a build already in memory instead of the cached one; either way the
+    # pipeline only runs on the background thread
+    def __init__(self, db_path=None, interval=REFRESH_INTERVAL, poll_interval=MANIFEST_POLL_INTERVAL, snapshot=None):
+        self.db_path = db_path
+        self.interval = interval
+        self.poll_interval = poll_interval
+
+        # readers only ever see a whole build, replaced by a single assignment
+        self.snapshot = snapshot if snapshot is not None else load_manifest_payloads()
+        self._manifest_mtime = manifest_mtime() if snapshot is None else None
+
+        self.last_refresh = None
+        self.last_refresh_duration = None
+        self.last_error = None
+
+        # threads don't survive fork: the thread belongs to the process that started it
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # START THE REFRESH THREAD OF THIS PROCESS, ONCE: A NO-OP WHERE IT WAS ALREADY STARTED,
+    # SO A WORKER FORKED FROM A PRELOADED MASTER STARTS ITS OWN ON FIRST USE
+    def start(self):
+        if self._pid == os.getpid():
+            return self
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='dashboard-refresh', daemon=True)
+                self._thread.start()
+                logger.info('refresh thread started in process ' + str(self._pid))
+        return self
+
+    def running(self) -> bool:
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        from db import close_shared_connections
+        from figure_pool import shutdown_figure_pool
+
+        self._stop.set()
+        if self.running():
+            self._thread.join()
+        close_shared_connections()
+        shutdown_figure_pool()
+
+    def status(self) -> dict:
+        return {
+            'built_at': self.snapshot['built_at'] if self.snapshot else None,
+            'last_refresh': self.last_refresh.isoformat() if self.last_refresh else None,
+            'last_refresh_duration': self.last_refresh_duration,
+            'last_error': self.last_error,
+            'pid': os.getpid(),
+            'refresh_running': self.running()
+        }
+
+    def refresh(self):
+        # the pipeline is only imported by the process that runs it
+        from build_dashboard import build_dashboard, DB_PATH
+        from db import shared_connection
+
+        start = time.perf_counter()
+        os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+
+        # only one process ingests at a time, the rest pick up its build from the manifest
+        with open(os.path.join(FIGURE_CACHE_DIR, 'refresh.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info('refresh already running in another process')
+                return
+
+            logger.info('REFRESH DASHBOARD DATA')
+            payloads = build_dashboard(shared_connection(self.db_path or DB_PATH))
+
+        self.snapshot = payloads
+        self._manifest_mtime = manifest_mtime()
+        self.last_refresh = datetime.datetime.now()
+        self.last_refresh_duration = time.perf_counter() - start
+        self.last_error = None
+        logger.info('refresh finished in ' + str(round(self.last_refresh_duration, 1)) + 's')
+
+    def reload_if_published(self):
+        mtime = manifest_mtime()
+        if mtime is None or mtime == self._manifest_mtime:
+            return
+
+        payloads = load_manifest_payloads()
+        if payloads is not None:
+            logger.info('load dashboard build published by another process')
+            self.snapshot = payloads
+            self._manifest_mtime = mtime
+
+    def _run(self):
+        next_refresh = time.monotonic() if self.snapshot is None else time.monotonic() + self.interval
+
+        while not self._stop.is_set():
+            if time.monotonic() >= next_refresh:
+                next_refresh = time.monotonic() + self.interval
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # keep serving the last good build
+                    logger.exception('refresh failed')
+                    self.last_error = repr(e)
+            else:
+                self.reload_if_published()
+
+            self._stop.wait(min(self.poll_interval, max(next_refresh - time.monotonic(), 0)))
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# COLUMNAR DATA WRITTEN ONCE BY THE INGESTING PROCESS AND MAPPED READ-ONLY BY EVERY WORKER
+# each version is a directory of one .npy file per column, strings stored as int codes into
+# strings.json, and CURRENT holds the latest version number
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshot_store')
+# versions kept on disk, so a worker still on the previous build can attach to it
+SNAPSHOT_KEEP_VERSIONS = int(os.environ.get('SNAPSHOT_KEEP_VERSIONS', 2))
+
+
+def version_path(version, snapshot_dir=None) -> str:
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, 'v' + str(version))
+
+
+def current_version(snapshot_dir=None) -> int:
+    try:
+        with open(os.path.join(snapshot_dir or SNAPSHOT_DIR, 'CURRENT')) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+# a column as an array numpy can save, plus its string dictionary if it has one
+def encode_column(values):
+    if isinstance(values, pd.Series):
+        values = values.array if values.dtype == 'category' else values.to_numpy()
+    if isinstance(values, pd.Categorical):
+        return np.asarray(values.codes), [str(c) for c in values.categories]
+    if isinstance(values, pd.DatetimeIndex):
+        return values.to_numpy(dtype='datetime64[ns]'), None
+    values = np.asarray(values)
+    if values.dtype == object:
+        codes, uniques = pd.factorize(values)
+        return codes.astype('int32'), [str(u) for u in uniques]
+    return values, None
+
+
+# WRITE {table: {column: values}} AS THE NEXT VERSION, THEN POINT CURRENT AT IT
+# only one process publishes at a time (the refresh lock); readers never see a partial version
+def publish_snapshot(tables, snapshot_dir=None) -> int:
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = current_version(snapshot_dir) + 1
+    path = version_path(version, snapshot_dir)
+    tmp_path = os.path.join(snapshot_dir, '.v' + str(version) + '.' + str(os.getpid()) + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    strings = {}
+    columns = {}
+    n_bytes = 0
+    for table, table_columns in tables.items():
+        columns[table] = list(table_columns)
+        for column, values in table_columns.items():
+            array, dictionary = encode_column(values)
+            np.save(os.path.join(tmp_path, table + '.' + column + '.npy'), np.ascontiguousarray(array))
+            n_bytes += array.nbytes
+            if dictionary is not None:
+                strings[table + '.' + column] = dictionary
+    with open(os.path.join(tmp_path, 'strings.json'), 'w') as f:
+        json.dump(strings, f)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'version': version, 'columns': columns}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    current_tmp = os.path.join(snapshot_dir, '.CURRENT.' + str(os.getpid()) + '.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(str(version))
+    os.replace(current_tmp, os.path.join(snapshot_dir, 'CURRENT'))
+    logger.info('published snapshot v' + str(version) + ', ' + str(round(n_bytes / 1024 ** 2, 1)) + ' MB')
+
+    # workers already mapping a removed version keep reading it until they let go
+    for name in os.listdir(snapshot_dir):
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) <= version - SNAPSHOT_KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+    return version
+
+
+# ONE VERSION, ATTACHED ZERO-COPY: COLUMNS ARE READ-ONLY MEMORY MAPS OF THE FILES
+class SharedSnapshot:
+
+    def __init__(self, version, snapshot_dir=None):
+        self.version = version
+        self.path = version_path(version, snapshot_dir)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.columns = json.load(f)['columns']
+        with open(os.path.join(self.path, 'strings.json')) as f:
+            self.strings = json.load(f)
+        self._arrays = {}
+
+    def array(self, table, column) -> np.ndarray:
+        name = table + '.' + column
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._arrays[name]
+
+    # string columns come back as categoricals over their dictionary, datetimes as an index
+    def column(self, table, column):
+        array = self.array(table, column)
+        name = table + '.' + column
+        if name in self.strings:
+            return pd.Categorical.from_codes(array, categories=self.strings[name])
+        if array.dtype.kind == 'M':
+            return pd.DatetimeIndex(array)
+        return array
+
+    # a small table as a frame of private copies
+    def frame(self, table) -> pd.DataFrame:
+        return pd.DataFrame({column: self.column(table, column) for column in self.columns[table]})
+
+
+# the given version, or the latest; None if there is none
+def attach_snapshot(version=None, snapshot_dir=None):
+    version = version or current_version(snapshot_dir)
+    if not version:
+        return None
+    snapshot = SharedSnapshot(version, snapshot_dir)
+    logger.info('attached snapshot v' + str(version))
+    return snapshot
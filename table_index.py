@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# filter expressions whose matching rows are kept per index
+FILTER_CACHE_SIZE = 32
+
+# dash datatable filter operators, longest spelling first so '>=' is not read as '>'
+FILTER_OPERATORS = [['ge ', '>='],
+                    ['le ', '<='],
+                    ['lt ', '<'],
+                    ['gt ', '>'],
+                    ['ne ', '!='],
+                    ['eq ', '='],
+                    ['contains '],
+                    ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 == value_part[-1:] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+# A TABLE WITH ONE PRESORTED ORDERING PER COLUMN, SO A PAGE IS A SLICE
+class TableIndex:
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.values = {col: df[col].to_numpy() for col in self.columns}
+        self.n_rows = len(df)
+
+        # ascending and descending, nulls last either way
+        self.orderings = {}
+        for col in self.columns:
+            isnull = pd.isnull(self.values[col])
+            valid = np.flatnonzero(~isnull)
+            order = valid[np.argsort(self.values[col][valid], kind='stable')]
+            nulls = np.flatnonzero(isnull)
+            self.orderings[(col, 'asc')] = np.concatenate([order, nulls])
+            self.orderings[(col, 'desc')] = np.concatenate([order[::-1], nulls])
+
+        self._filter_cache = OrderedDict()
+
+    @classmethod
+    def from_records(cls, records, columns):
+        return cls(pd.DataFrame.from_records(records, columns=columns))
+
+    # row order for a sort_by, None meaning the frame's own order
+    def sorted_rows(self, sort_by):
+        if not sort_by:
+            return None
+
+        if len(sort_by) == 1:
+            return self.orderings[(sort_by[0]['column_id'], sort_by[0]['direction'])]
+
+        # multi-column sorts are rare, fall back to a full lexsort
+        df = pd.DataFrame({col: self.values[col] for col in self.columns})
+        return df.sort_values([s['column_id'] for s in sort_by],
+                              ascending=[s['direction'] == 'asc' for s in sort_by],
+                              kind='stable').index.to_numpy()
+
+    def filter_mask(self, filter_query):
+        if filter_query in self._filter_cache:
+            self._filter_cache.move_to_end(filter_query)
+            return self._filter_cache[filter_query]
+
+        mask = np.ones(self.n_rows, dtype=bool)
+        for filter_part in filter_query.split(' && '):
+            col, operator, value = split_filter_part(filter_part)
+            if col not in self.values:
+                continue
+            values = self.values[col]
+
+            if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+                series = pd.Series(values)
+                if isinstance(value, float) and not pd.api.types.is_numeric_dtype(series):
+                    series = pd.to_numeric(series, errors='coerce')
+                mask &= getattr(series, operator)(value).to_numpy()
+            elif operator == 'contains':
+                mask &= pd.Series(values).astype(str).str.contains(str(value), regex=False).to_numpy()
+            elif operator == 'datestartswith':
+                mask &= pd.Series(values).astype(str).str.startswith(str(value)).to_numpy()
+
+        self._filter_cache[filter_query] = mask
+        if len(self._filter_cache) > FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+        return mask
+
+    # ONE PAGE OF RECORDS PLUS THE PAGE COUNT FOR THE CURRENT SORT AND FILTER
+    def page(self, page_current, page_size, sort_by=None, filter_query=''):
+        rows = self.sorted_rows(sort_by)
+        if filter_query:
+            mask = self.filter_mask(filter_query)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+        n_rows = self.n_rows if rows is None else len(rows)
+
+        # without a filter this only touches the rows of the page
+        start = (page_current or 0) * page_size
+        end = min(start + page_size, n_rows)
+        page_rows = np.arange(start, end) if rows is None else rows[start: end]
+
+        page_values = [self.values[col][page_rows].tolist() for col in self.columns]
+        records = [dict(zip(self.columns, row)) for row in zip(*page_values)]
+
+        page_count = max(int(np.ceil(n_rows / page_size)), 1)
+        return records, page_count
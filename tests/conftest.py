@@ -0,0 +1,30 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+
+FIXTURES_DIR = os.path.join(REPO_ROOT, 'tests', 'fixtures')
+DATA_FILES = ['2019-nCoV-CDC.db', 'popest2019_nyc.xlsx', 'state_abbrev_mapping.csv']
+
+
+# the pipeline reads its data files and writes its caches relative to the cwd: every test
+# runs in one scratch copy of the data files, so caches and stores start empty
+@pytest.fixture(scope='session', autouse=True)
+def work_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('work')
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(REPO_ROOT, name), path)
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield str(path)
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def fixture_path():
+    return lambda name: os.path.join(FIXTURES_DIR, name)
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from analytics import NATION, CountyAnalytics
+
+
+# one day of every county in the population workbook, each with its own popest
+@pytest.fixture(scope='module')
+def workbook():
+    return pd.read_excel('popest2019_nyc.xlsx', dtype={'fips': str, 'county_fips': str})
+
+
+@pytest.fixture(scope='module')
+def analytics(workbook):
+    counties_df = workbook[workbook['county_fips'] != '000'].assign(date=pd.Timestamp('2020-04-01'),
+                                                                    cases=1, deaths=0)
+    return CountyAnalytics(counties_df)
+
+
+def state_totals(workbook):
+    return workbook[workbook['county_fips'] == '000'].set_index('state')['popest']
+
+
+# the five boroughs each carry the whole city's population, counted once in the rollups
+def test_new_york_state_population_matches_the_workbook_total(analytics, workbook):
+    series = analytics.series('state')
+    popest = dict(zip(series['geo'].astype(str), series['popest']))
+    assert popest['New York'] == state_totals(workbook)['New York']
+    for state, total in state_totals(workbook).items():
+        if state in popest:
+            assert popest[state] == total, state
+
+
+def test_nation_population_matches_the_workbook_total(analytics, workbook):
+    series = analytics.series('nation')
+    assert list(series['geo'].astype(str)) == [NATION]
+    assert series['popest'][0] == state_totals(workbook).sum()
@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+import pytest
+
+from bench_counties_memory import MEMORY_TARGET, legacy_counties_df, run_step
+from fetch import FetchResult
+from pull_updated_data import COUNTIES_DTYPES, get_counties_df
+from synthetic import make_counties_df
+
+
+@pytest.fixture(params=['fixture', 'synthetic'])
+def counties_csv(request, fixture_path, tmp_path):
+    if request.param == 'fixture':
+        return fixture_path('nyt_counties_nyc.csv')
+    csv_path = str(tmp_path / 'us-counties.csv')
+    make_counties_df(n_counties=60, n_days=40).to_csv(csv_path, index=False)
+    return csv_path
+
+
+def read_both(csv_path):
+    with open(csv_path, 'rb') as f:
+        content = f.read()
+    return legacy_counties_df(content), get_counties_df(FetchResult(csv_path, content, True))
+
+
+# the compact series holds the same rows and values as the object-dtype one, up to float32
+# precision. the synthetic series reports every county every day: over a gap the legacy window
+# spans 7 rows, the current one 7 calendar days
+def test_compact_series_matches_object_dtypes(tmp_path):
+    csv_path = str(tmp_path / 'us-counties.csv')
+    make_counties_df(n_counties=60, n_days=40).to_csv(csv_path, index=False)
+    expected, actual = read_both(csv_path)
+    key = ['fips', 'date']
+    expected = expected.sort_values(key).reset_index(drop=True)
+    actual = actual.astype({'county': str, 'state': str, 'fips': str})
+    actual['date'] = actual['date'].dt.strftime('%Y-%m-%d')
+    actual = actual.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected[actual.columns], check_dtype=False, rtol=1e-5)
+
+
+def test_compact_dtypes(counties_csv):
+    legacy, counties_df = read_both(counties_csv)
+    for col, dtype in COUNTIES_DTYPES.items():
+        assert counties_df[col].dtype == dtype, col
+    assert counties_df['date'].dtype == 'datetime64[ns]'
+    assert not (counties_df.dtypes == 'float64').any()
+    assert not (counties_df.dtypes == object).any()
+
+    # the result frame is at most half the size of the object-dtype one (peak rss is
+    # measured by benchmarks/bench_counties_memory.py)
+    assert counties_df.memory_usage(deep=True).sum() <= 0.5 * legacy.memory_usage(deep=True).sum()
+
+
+# the documented target: peak rss of the compact pipeline at most half the object-dtype one's,
+# each measured in its own interpreter from a peak reset after the csv is read
+@pytest.mark.skipif(not os.path.exists('/proc/self/clear_refs'), reason='needs a resettable peak rss')
+def test_compact_peak_memory_within_target(tmp_path):
+    csv_path = str(tmp_path / 'us-counties.csv')
+    make_counties_df(n_counties=1000, n_days=120).to_csv(csv_path, index=False)
+    legacy = run_step('--measure', 'legacy', csv_path)
+    compact = run_step('--measure', 'compact', csv_path)
+    assert compact['peak_mb'] <= MEMORY_TARGET * legacy['peak_mb']
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import county_store
+import fetch
+import pull_updated_data
+from pull_updated_data import COUNTIES_TABLE, get_counties_high_water, read_counties_df, update_counties_table
+
+
+# a fresh database, county store and fetch cache per test, with the fixture as the full
+# history and its last days as the recent file
+@pytest.fixture
+def ingest_env(tmp_path, monkeypatch, fixture_path):
+    monkeypatch.setattr(county_store, 'COUNTY_STORE_DIR', str(tmp_path / 'county_store'))
+    monkeypatch.setattr(fetch, 'FETCH_CACHE_DIR', str(tmp_path / 'fetch_cache'))
+    full_path = fixture_path('nyt_counties_nyc.csv')
+    recent_path = str(tmp_path / 'us-counties-recent.csv')
+    raw_df = pd.read_csv(full_path, dtype={'fips': str})
+    raw_df[raw_df['date'] >= '2020-03-08'].to_csv(recent_path, index=False)
+    conn = sqlite3.connect(str(tmp_path / 'counties.db'))
+    yield conn, full_path, recent_path
+    conn.close()
+
+
+def normalized(df):
+    df = df.astype({'county': str, 'state': str, 'fips': str})
+    return df.sort_values(['fips', 'date']).reset_index(drop=True)
+
+
+# an older table next to a warm fetch cache still catches up: the skip goes by the stored
+# high-water mark, not by whether the recent file changed since it was last fetched
+def test_older_table_catches_up_from_an_unchanged_recent_file(ingest_env):
+    conn, full_path, recent_path = ingest_env
+    update_counties_table(conn, url=full_path, recent_url=recent_path)
+    expected = normalized(read_counties_df(conn))
+    assert update_counties_table(conn, url=full_path, recent_url=recent_path) == 0
+
+    # the table as restored from a backup taken two days earlier
+    conn.execute("DELETE FROM " + COUNTIES_TABLE + " WHERE date > '2020-03-10'")
+    conn.commit()
+    assert not fetch.fetch(recent_path).changed
+
+    assert update_counties_table(conn, url=full_path, recent_url=recent_path) > 0
+    assert get_counties_high_water(conn) == '2020-03-12'
+    pd.testing.assert_frame_equal(normalized(read_counties_df(conn)), expected)
+
+
+# rows committed to the table by a run that failed before writing them to the store are
+# copied to the store by the next run, which has nothing new to read from the source
+def test_store_catches_up_after_a_failed_partition_write(ingest_env, tmp_path, monkeypatch):
+    conn, full_path, recent_path = ingest_env
+    older_path = str(tmp_path / 'us-counties-older.csv')
+    raw_df = pd.read_csv(full_path, dtype={'fips': str})
+    raw_df[raw_df['date'] <= '2020-03-10'].to_csv(older_path, index=False)
+    update_counties_table(conn, url=older_path, recent_url=recent_path)
+
+    def failing_write(*args):
+        raise OSError('no space left on device')
+
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(pull_updated_data, 'write_county_partitions', failing_write)
+        update_counties_table(conn, url=full_path, recent_url=recent_path)
+    assert get_counties_high_water(conn) == '2020-03-12'
+    assert county_store.store_high_water() == '2020-03-10'
+
+    assert update_counties_table(conn, url=full_path, recent_url=recent_path) == 0
+    assert county_store.store_high_water() == '2020-03-12'
+    columns = ['date', 'county', 'state', 'fips', 'cases', 'deaths']
+    pd.testing.assert_frame_equal(normalized(county_store.load_counties_df(columns=columns)),
+                                  normalized(read_counties_df(conn)[columns]), check_dtype=False)
+
+
+# a county back after more than CONTEXT_ROWS days without a report takes its lag from
+# its last stored row, however old, and matches a full ingest of the same history
+def test_county_back_after_a_long_silence_matches_full_ingest(ingest_env, tmp_path):
+    conn, full_path, recent_path = ingest_env
+    raw_df = pd.read_csv(full_path, dtype={'fips': str})
+    # autauga reports once in january, then not again until the recent file's last day
+    autauga = raw_df['fips'] == '01001'
+    silent = raw_df[autauga].iloc[[-1]].assign(date='2020-01-15', cases=3, deaths=0)
+    raw_df = pd.concat([silent, raw_df[~autauga | (raw_df['date'] == '2020-03-12')]])
+    full_path = str(tmp_path / 'us-counties-silent.csv')
+    older_path = str(tmp_path / 'us-counties-older.csv')
+    raw_df.to_csv(full_path, index=False)
+    raw_df[raw_df['date'] <= '2020-03-10'].to_csv(older_path, index=False)
+    raw_df[raw_df['date'] >= '2020-03-08'].to_csv(recent_path, index=False)
+
+    update_counties_table(conn, url=older_path, recent_url=recent_path)
+    assert update_counties_table(conn, url=full_path, recent_url=recent_path) > 0
+    full_conn = sqlite3.connect(str(tmp_path / 'full.db'))
+    update_counties_table(full_conn, url=full_path, recent_url=recent_path)
+    expected = normalized(read_counties_df(full_conn))
+    full_conn.close()
+
+    actual = normalized(read_counties_df(conn))
+    returned = actual[(actual['fips'] == '01001') & (actual['date'] == '2020-03-12')]
+    assert returned['new_cases'].notna().all()
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+# a rebuild over an existing store swaps the new one in by renames: whenever a directory
+# is deleted the store is there in full, and no old or temporary directory is left behind
+def test_store_rebuild_never_leaves_the_store_missing(ingest_env, tmp_path, monkeypatch):
+    conn, full_path, recent_path = ingest_env
+    update_counties_table(conn, url=full_path, recent_url=recent_path)
+    rmtree = county_store.shutil.rmtree
+    seen = []
+
+    def checked_rmtree(path, *args, **kwargs):
+        seen.append(county_store.store_high_water())
+        rmtree(path, *args, **kwargs)
+        seen.append(county_store.store_high_water())
+
+    with monkeypatch.context() as patch:
+        patch.setattr(county_store.shutil, 'rmtree', checked_rmtree)
+        county_store.rebuild_county_store(conn, COUNTIES_TABLE)
+    assert seen and all(high_water == '2020-03-12' for high_water in seen)
+    assert [name for name in os.listdir(str(tmp_path)) if name.startswith('county_store')] == ['county_store']
@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import pytest
+
+from make_figures import make_cases_by_county_chloropleth
+from pull_updated_data import calculate_counties_metrics, expand_nyc_fips, make_current_counties_df
+from synthetic import make_counties_df, make_counties_geojson
+
+DAYS = [1, 2, 4, 8]
+
+
+@pytest.fixture(scope='module')
+def county_inputs():
+    counties_df = calculate_counties_metrics(expand_nyc_fips(make_counties_df(n_counties=150, n_days=max(DAYS) + 7)))
+    counties = make_counties_geojson(counties_df['fips'].dropna().unique(), vertices_per_edge=20)
+    return counties_df, make_current_counties_df(counties_df), counties
+
+
+# every frame holds only its own day's values, no geometry
+def test_frames_carry_their_own_day_without_geometry(county_inputs):
+    counties_df, current_counties_df, counties = county_inputs
+    figure = make_cases_by_county_chloropleth(counties_df, current_counties_df, counties, n_days=4)
+    days = np.sort(counties_df['date'].unique())[-4:]
+    assert len(figure['frames']) == len(days)
+    for day, frame in zip(days, figure['frames']):
+        data = frame['data'][0]
+        assert 'geojson' not in data
+        day_df = counties_df[counties_df['date'] == day]
+        expected = dict(zip(day_df['fips'].astype(str), day_df['new_cases_per100k'].astype(float).round(1)))
+        actual = dict(zip(map(str, data['locations']), data['customdata']))
+        assert actual.keys() == expected.keys()
+        np.testing.assert_allclose(pd.Series(actual)[list(expected)], pd.Series(expected), equal_nan=True)
+
+
+# the payload grows by one day of values per animated day, never by the geometry
+def test_payload_grows_linearly_in_days(county_inputs):
+    counties_df, current_counties_df, counties = county_inputs
+    sizes = [len(pio.to_json(make_cases_by_county_chloropleth(counties_df, current_counties_df, counties, n_days=n),
+                             validate=False))
+             for n in DAYS]
+    per_day = np.diff(sizes) / np.diff(DAYS)
+    assert per_day.max() < 1.1 * per_day.min()
+    assert per_day.max() < len(json.dumps(counties)) / 2
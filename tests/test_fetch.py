@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+import fetch
+import update_db
+from synthetic import make_cdc_payloads
+
+
+@pytest.fixture
+def cdc_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, 'FETCH_CACHE_DIR', str(tmp_path / 'fetch_cache'))
+    sources = {}
+    for name, body in make_cdc_payloads().items():
+        path = tmp_path / (name + '.json')
+        path.write_bytes(body)
+        sources[name] = (str(path), update_db.CDC_TIMEOUT)
+    return sources
+
+
+def n_snapshot_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM cdc_cases_by_state").fetchone()[0]
+
+
+# a snapshot that fails to write leaves the fetch cache as it was: the next run gets the
+# sources in full and writes them, only then do they come back unchanged
+def test_failed_ingest_is_fetched_again(cdc_sources, tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'cdc.db'))
+
+    def failing_write(*args):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    with monkeypatch.context() as patch, pytest.raises(sqlite3.OperationalError):
+        patch.setattr(update_db, 'write_snapshot', failing_write)
+        update_db.update_db(conn, '2020-04-01', responses=fetch.fetch_all(cdc_sources))
+
+    responses = fetch.fetch_all(cdc_sources)
+    assert all(response.changed for response in responses.values())
+    update_db.update_db(conn, '2020-04-01', responses=responses)
+    assert n_snapshot_rows(conn) > 0
+
+    assert not any(response.changed for response in fetch.fetch_all(cdc_sources).values())
+    conn.close()
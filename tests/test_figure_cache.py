@@ -0,0 +1,20 @@
+import os
+
+import figure_cache
+from figure_cache import cache_path, load_manifest_payloads, save_cached, save_manifest
+
+
+# a new build's payloads land next to the previous ones, which stay loadable through the
+# still-current manifest until the new manifest replaces it
+def test_stale_payloads_outlive_the_manifest_that_names_them(tmp_path, monkeypatch):
+    monkeypatch.setattr(figure_cache, 'FIGURE_CACHE_DIR', str(tmp_path))
+    save_cached('cases_by_state_records', 'old', [{'state': 'Alabama'}])
+    save_manifest({'cases_by_state_records': 'old'}, {'built_at': '2020-03-01T00:00:00'})
+
+    save_cached('cases_by_state_records', 'new', [{'state': 'Alaska'}])
+    assert os.path.exists(cache_path('cases_by_state_records', 'old'))
+    assert load_manifest_payloads()['cases_by_state_records'] == [{'state': 'Alabama'}]
+
+    save_manifest({'cases_by_state_records': 'new'}, {'built_at': '2020-03-02T00:00:00'})
+    assert not os.path.exists(cache_path('cases_by_state_records', 'old'))
+    assert load_manifest_payloads()['cases_by_state_records'] == [{'state': 'Alaska'}]
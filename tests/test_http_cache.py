@@ -0,0 +1,63 @@
+import datetime
+import gzip
+import os
+
+import pytest
+
+from bench_callbacks import make_selections, update_request
+from offline_app import start_offline_app, stop_offline_app
+
+
+# the app on synthetic sources once its first build is served, in a work dir of its own
+@pytest.fixture(scope='module')
+def app(work_dir, tmp_path_factory):
+    environ = dict(os.environ)
+    application, server, app_dir = start_offline_app(n_counties=50, n_days=40,
+                                                     work_dir=str(tmp_path_factory.mktemp('app')))
+    yield application
+    stop_offline_app(application, server, app_dir)
+    os.environ.clear()
+    os.environ.update(environ)
+    os.chdir(work_dir)
+
+
+@pytest.fixture
+def send(app):
+    client = app.application.test_client()
+    body = update_request('metric-by-date-bar', make_selections(app.scheduler.snapshot, 1)[0])
+    return {'layout': lambda headers: client.get('/_dash-layout', headers=headers),
+            'callback': lambda headers: client.post('/_dash-update-component', json=body, headers=headers)}
+
+
+@pytest.mark.parametrize('name', ['layout', 'callback'])
+def test_gzip_shrinks_the_body(send, name):
+    plain = send[name]({})
+    compressed = send[name]({'Accept-Encoding': 'gzip'})
+    assert plain.status_code == compressed.status_code == 200
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data) / 2
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+
+@pytest.mark.parametrize('name', ['layout', 'callback'])
+def test_same_data_version_revalidates_with_304(send, name):
+    for headers in [{}, {'Accept-Encoding': 'gzip'}]:
+        first = send[name](headers)
+        assert first.headers['Cache-Control'] == 'no-cache'
+        revalidated = send[name](dict(headers, **{'If-None-Match': first.headers['ETag']}))
+        assert revalidated.status_code == 304
+        assert revalidated.data == b''
+        assert revalidated.headers['ETag'] == first.headers['ETag']
+
+
+def test_new_data_version_answers_200(app, send):
+    etag = send['layout']({}).headers['ETag']
+    snapshot = app.scheduler.snapshot
+    app.scheduler.snapshot = dict(snapshot, built_at=datetime.datetime.now().isoformat())
+    try:
+        response = send['layout']({'If-None-Match': etag})
+    finally:
+        app.scheduler.snapshot = snapshot
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from bench_nyc_fanout import expand_nyc_fips_legacy
+from pull_updated_data import COUNTIES_COLS, NYC_FIPS, expand_nyc_fips, get_counties_df
+
+
+def read_fixture(fixture_path):
+    return pd.read_csv(fixture_path('nyt_counties_nyc.csv'), dtype={'fips': str})
+
+
+def test_expand_nyc_fips_matches_legacy(fixture_path):
+    counties_df = read_fixture(fixture_path)
+    expected = expand_nyc_fips_legacy(counties_df)
+    actual = expand_nyc_fips(counties_df)
+    pd.testing.assert_frame_equal(actual.astype(object), expected.astype(object))
+
+
+def test_every_nyc_row_fans_out_to_the_five_boroughs(fixture_path):
+    raw_df = read_fixture(fixture_path)
+    nyc_df = raw_df[raw_df['county'] == 'New York City']
+    expanded = expand_nyc_fips(raw_df)
+
+    boroughs = expanded[expanded['fips'].isin(NYC_FIPS)]
+    assert len(boroughs) == len(NYC_FIPS) * len(nyc_df)
+    for date, day_df in boroughs.groupby('date'):
+        assert sorted(day_df['fips']) == sorted(NYC_FIPS)
+        city = nyc_df[nyc_df['date'] == date].iloc[0]
+        assert (day_df[['cases', 'deaths']].to_numpy() == [city['cases'], city['deaths']]).all()
+    # the other rows pass through untouched
+    others = expanded[~expanded['fips'].isin(NYC_FIPS)]
+    pd.testing.assert_frame_equal(others[COUNTIES_COLS].reset_index(drop=True),
+                                  raw_df[raw_df['county'] != 'New York City'].reset_index(drop=True))
+
+
+# every borough carries the city's counts over the city's population, so each borough's
+# rate and the population-weighted rate over the five are the city's own
+def test_nyc_population_weighted_totals(fixture_path):
+    raw_df = read_fixture(fixture_path)
+    counties_df = get_counties_df(fixture_path('nyt_counties_nyc.csv'))
+    boroughs = counties_df[counties_df['fips'].astype(str).isin(NYC_FIPS)]
+    assert set(boroughs['fips'].astype(str)) == set(NYC_FIPS)
+
+    city_cases = raw_df[raw_df['county'] == 'New York City'].set_index('date')['cases'].astype(float)
+    city_cases.index = pd.to_datetime(city_cases.index)
+    city_rolling = city_cases.diff().clip(lower=0).rolling(7).mean()
+    for date, day_df in boroughs.groupby('date'):
+        weighted = (day_df['new_cases_per100k'] * day_df['popest']).sum() / day_df['popest'].sum()
+        expected = city_rolling[date] / day_df['popest'].iloc[0] * 100000
+        if np.isnan(expected):
+            assert day_df['new_cases_per100k'].isna().all()
+        else:
+            np.testing.assert_allclose(day_df['new_cases_per100k'], expected, rtol=1e-5)
+            np.testing.assert_allclose(weighted, expected, rtol=1e-5)
+        assert (day_df['new_cases_rolling'].nunique(dropna=False)) == 1
+
+    # fips-less rows other than NYC have no population and drop out
+    assert 'Unknown' not in set(counties_df['county'].astype(str))
+
+
+# the borough fips are added to the fan-out's own categories, not the caller's
+def test_expand_nyc_fips_leaves_the_input_frame_alone(fixture_path):
+    raw_df = read_fixture(fixture_path).astype({'fips': 'category'})
+    categories = raw_df['fips'].cat.categories.tolist()
+    expanded = expand_nyc_fips(raw_df)
+    assert raw_df['fips'].cat.categories.tolist() == categories
+    assert set(NYC_FIPS) <= set(expanded['fips'].cat.categories)
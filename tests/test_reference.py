@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import reference
+
+BENCH_REFERENCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'benchmarks', 'bench_reference.py')
+
+
+@pytest.fixture
+def reference_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'reference_cache')
+    monkeypatch.setattr(reference, 'REFERENCE_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(reference, '_popest', None)
+    return cache_dir
+
+
+# state totals (county fips 000) are not county estimates and never match, every county row does
+def test_state_total_rows_are_excluded(reference_cache):
+    popest = pd.read_excel(reference.POPEST_PATH, dtype=str)
+    state_rows = popest[popest['county_fips'] == '000']
+    county_rows = popest[popest['county_fips'] != '000']
+    assert len(state_rows) > 0
+    assert np.isnan(reference.lookup_popest(state_rows['fips'])).all()
+    np.testing.assert_array_equal(reference.lookup_popest(county_rows['fips']), county_rows['popest'].astype(float))
+    assert not reference.county_names()['fips'].isin(state_rows['fips']).any()
+
+
+# with the workbook converted ahead of time, an offline start and full build never import openpyxl
+def test_startup_never_imports_openpyxl(reference_cache):
+    env = dict(os.environ, REFERENCE_CACHE_DIR=reference_cache)
+    subprocess.run([sys.executable, '-c', 'import reference; reference.popest_by_fips()'],
+                   env=dict(env, PYTHONPATH=os.path.dirname(os.path.dirname(BENCH_REFERENCE))),
+                   check=True, capture_output=True)
+    result = subprocess.run([sys.executable, BENCH_REFERENCE, '--startup'], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from bench_rolling import comparable, legacy_rolling, reference_calendar_mean
+from pull_updated_data import calculate_counties_metrics, expand_nyc_fips
+from synthetic import make_counties_df
+
+
+# gap-free: a 7 day calendar window is a 7 row window, so the engine matches the old round-trip
+def test_calendar_engine_matches_row_window_without_gaps():
+    fixture = expand_nyc_fips(make_counties_df(n_counties=30, n_days=60))
+    expected = comparable(legacy_rolling(fixture.copy()).dropna(subset=['fips']))
+    actual = comparable(calculate_counties_metrics(fixture.copy()))
+    expected = expected[expected['fips'].isin(actual['fips'])].reset_index(drop=True)
+    np.testing.assert_allclose(actual['new_cases_rolling'], expected['new_cases_rolling'], rtol=1e-6)
+
+
+# missing days: the window covers calendar days, checked against the row-by-row definition
+def test_calendar_engine_matches_reference_with_missing_days():
+    fixture = expand_nyc_fips(make_counties_df(n_counties=30, n_days=60))
+    rng = np.random.default_rng(1)
+    gappy = fixture.iloc[np.sort(rng.choice(len(fixture), size=int(len(fixture) * 0.8), replace=False))]
+    actual = comparable(calculate_counties_metrics(gappy.copy()))
+    np.testing.assert_allclose(actual['new_cases_rolling'], reference_calendar_mean(actual), rtol=1e-6)
+
+
+# the checked-in fixture, where Cook County skips a day
+def test_calendar_engine_on_the_reference_fixture(fixture_path):
+    raw_df = pd.read_csv(fixture_path('nyt_counties_nyc.csv'), dtype={'fips': str})
+    actual = comparable(calculate_counties_metrics(expand_nyc_fips(raw_df)))
+    np.testing.assert_allclose(actual['new_cases_rolling'], reference_calendar_mean(actual), rtol=1e-6)
+    # the gap is really there, and a 7 row window reads across it differently
+    assert len(actual[actual['fips'] == '17031']) == 11
+    legacy = comparable(legacy_rolling(expand_nyc_fips(raw_df)).dropna(subset=['fips']))
+    legacy = legacy[legacy['fips'] == '17031']['new_cases_rolling'].to_numpy()
+    engine = actual[actual['fips'] == '17031']['new_cases_rolling'].to_numpy()
+    assert not np.allclose(engine, legacy, equal_nan=True)
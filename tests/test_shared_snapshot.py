@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import county_store
+import shared_snapshot
+from bench_shared_snapshot import attach_limit_mb, check_snapshot, measure_growth, run_prepare, snapshot_size_mb
+from pull_updated_data import get_counties_df
+
+WORKERS = [1, 3]
+
+
+# every metric, window and geography read from the attached snapshot matches the analytics
+# it was published from, and a new version is picked up while the old one stays readable
+def test_attached_snapshot_matches_and_versions(fixture_path, tmp_path):
+    counties_df = get_counties_df(fixture_path('nyt_counties_nyc.csv'))
+    check_snapshot(counties_df, str(tmp_path / 'snapshot_store'))
+
+
+# forked workers attached to the snapshot add a small fixed cost each, not a copy of the
+# series, while workers computing the series privately each add more than the snapshot
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='needs /proc/<pid>/smaps_rollup')
+def test_attached_workers_stay_nearly_flat(tmp_path, monkeypatch):
+    run_prepare(1000, 60, str(tmp_path))
+    monkeypatch.setattr(county_store, 'COUNTY_STORE_DIR', str(tmp_path / 'county_store'))
+    monkeypatch.setattr(shared_snapshot, 'SNAPSHOT_DIR', str(tmp_path / 'snapshot_store'))
+    snapshot_mb = snapshot_size_mb()
+
+    results, private, shared = measure_growth(WORKERS)
+    assert private > snapshot_mb
+    assert shared < attach_limit_mb(snapshot_mb)
+    # unique memory too: what an added attached worker holds alone
+    first, last = WORKERS[0], WORKERS[-1]
+    uss = {mode: (results[mode][last][0] - results[mode][first][0]) / (last - first) for mode in results}
+    assert uss['shared'] - uss['idle'] < attach_limit_mb(snapshot_mb)
@@ -0,0 +1,49 @@
+import shutil
+
+import pytest
+
+from bench_snapshot_writes import snapshot_frames, table
+from db import connect
+from update_db import CDC_TABLE_SCHEMA, migrate_snapshot_tables, write_snapshot
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_path = str(tmp_path / '2019-nCoV-CDC.db')
+    shutil.copy('2019-nCoV-CDC.db', db_path)
+    conn = connect(db_path)
+    migrate_snapshot_tables(conn)
+    yield conn
+    conn.close()
+
+
+def latest_date(conn):
+    return conn.execute("SELECT MAX(snapshot_date) FROM cdc_cases_by_state").fetchone()[0]
+
+
+# rewriting a day leaves every table exactly as it was
+def test_rewrite_of_a_day_is_idempotent(conn):
+    before = {name: table(conn, name) for name in CDC_TABLE_SCHEMA}
+    write_snapshot(conn, latest_date(conn), snapshot_frames(conn, latest_date(conn)))
+    for name in CDC_TABLE_SCHEMA:
+        assert table(conn, name).equals(before[name]), name
+
+
+# a count that disagrees with the rows written fails the row check inside the transaction,
+# and the day keeps its previous rows
+def test_row_check_rolls_back_the_snapshot(conn):
+    snapshot_date = latest_date(conn)
+    frames = snapshot_frames(conn, snapshot_date)
+    before = table(conn, 'cdc_cases_by_state')
+    conn.execute("DELETE FROM cdc_cases_by_report_date WHERE snapshot_date = ?", (snapshot_date,))
+    conn.commit()
+    conn.execute("CREATE TRIGGER extra_row AFTER INSERT ON cdc_cases_by_report_date WHEN NEW.date = "
+                 "(SELECT MIN(date) FROM cdc_cases_by_report_date WHERE snapshot_date = NEW.snapshot_date) "
+                 "BEGIN INSERT INTO cdc_cases_by_report_date (snapshot_date, date, n_cases) "
+                 "VALUES (NEW.snapshot_date, NULL, 0); END")
+
+    with pytest.raises(ValueError, match='cdc_cases_by_report_date'):
+        write_snapshot(conn, snapshot_date, frames)
+    assert table(conn, 'cdc_cases_by_state').equals(before)
+    assert conn.execute("SELECT COUNT(*) FROM cdc_cases_by_report_date WHERE snapshot_date = ?",
+                        (snapshot_date,)).fetchone()[0] == 0
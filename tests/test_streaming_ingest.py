@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+import fetch
+from http_standin import StandinServer
+from pull_updated_data import get_counties_df, stream_counties_df
+from synthetic import make_counties_df
+
+
+def normalized(df):
+    df = df.astype({'county': str, 'state': str, 'fips': str})
+    return df.sort_values(['fips', 'date']).reset_index(drop=True)
+
+
+@pytest.fixture
+def raw_df():
+    return make_counties_df(n_counties=40, n_days=30)
+
+
+@pytest.fixture
+def csv_path(raw_df, tmp_path):
+    path = str(tmp_path / 'us-counties.csv')
+    raw_df.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('chunk_rows', [37, 500, 100000])
+def test_streamed_series_matches_batch(csv_path, chunk_rows):
+    expected = normalized(get_counties_df(csv_path))
+    actual = pd.concat(list(stream_counties_df(csv_path, chunk_rows=chunk_rows)), ignore_index=True)
+    pd.testing.assert_frame_equal(normalized(actual), expected, check_dtype=False, check_exact=True)
+
+
+# a county's days out of order can't be carried, the ingest refuses them
+def test_out_of_order_days_are_rejected(raw_df, tmp_path):
+    shuffled_path = str(tmp_path / 'us-counties-shuffled.csv')
+    raw_df.sample(frac=1, random_state=0).to_csv(shuffled_path, index=False)
+    with pytest.raises(ValueError):
+        list(stream_counties_df(shuffled_path, chunk_rows=37))
+
+
+# a downloaded history goes to the fetch cache as it arrives and streams from that file,
+# its body never loaded into memory
+def test_download_streams_from_the_fetch_cache(csv_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, 'FETCH_CACHE_DIR', str(tmp_path / 'fetch_cache'))
+    with open(csv_path, 'rb') as f:
+        body = f.read()
+    with StandinServer({'/us-counties.csv': body}) as server:
+        response = fetch.fetch(server.url('/us-counties.csv'))
+
+    assert response.path.startswith(fetch.FETCH_CACHE_DIR)
+    actual = pd.concat(list(stream_counties_df(response, chunk_rows=500)), ignore_index=True)
+    assert response._content is None
+    pd.testing.assert_frame_equal(normalized(actual), normalized(get_counties_df(csv_path)),
+                                  check_dtype=False, check_exact=True)
+    assert response.content == body
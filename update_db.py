@@ -1,22 +1,51 @@
 # -*- coding: utf-8 -*-
 # IMPORT NECESSARY PACKAGES
+import os
 import pandas as pd
 import numpy as np
-import requests
 import json
 import datetime as dt
+import time
 import logging
 
+from fetch import commit_fetched, fetch_all
+from instrument import timed
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 logger.info('SET ENVIRONMENT VARIABLES')
 
 # ENVIRONMENT VARIABLES
-CASES_BY_STATE_URL = 'https://www.cdc.gov/coronavirus/2019-ncov/map-cases-us.json'
-CASES_BY_REPORT_DATE_URL = 'https://www.cdc.gov/coronavirus/2019-ncov/cases-updates/total-cases-onset.json'
-CASES_BY_ONSET_DATE_URL = 'https://www.cdc.gov/coronavirus/2019-ncov/cases-updates/us-cases-epi-chart.json'
-CURRENT_DATE = dt.datetime.strftime(dt.datetime.now(), '%Y%m%d')
+CASES_BY_STATE_URL = os.environ.get(
+    'CASES_BY_STATE_URL',
+    'https://www.cdc.gov/coronavirus/2019-ncov/map-cases-us.json'
+)
+CASES_BY_REPORT_DATE_URL = os.environ.get(
+    'CASES_BY_REPORT_DATE_URL',
+    'https://www.cdc.gov/coronavirus/2019-ncov/cases-updates/total-cases-onset.json'
+)
+CASES_BY_ONSET_DATE_URL = os.environ.get(
+    'CASES_BY_ONSET_DATE_URL',
+    'https://www.cdc.gov/coronavirus/2019-ncov/cases-updates/us-cases-epi-chart.json'
+)
+CDC_TIMEOUT = (5, 30)
+
+CDC_SOURCES = {'cases_by_state': (CASES_BY_STATE_URL, CDC_TIMEOUT),
+               'cases_by_report_date': (CASES_BY_REPORT_DATE_URL, CDC_TIMEOUT),
+               'cases_by_onset_date': (CASES_BY_ONSET_DATE_URL, CDC_TIMEOUT)}
+
+# ONE LONG TABLE PER DATASET, KEYED BY SNAPSHOT DATE
+CDC_TABLE_SCHEMA = {'cdc_cases_by_state': {'state': 'TEXT',
+                                            'range': 'TEXT',
+                                            'n_cases': 'REAL',
+                                            'community_transmission': 'TEXT',
+                                            'url': 'TEXT'},
+                    'cdc_cases_by_report_date': {'date': 'TEXT', 'n_cases': 'INTEGER'},
+                    'cdc_cases_by_onset_date': {'date': 'TEXT', 'n_cases': 'INTEGER'}}
+CDC_TABLE_KEY = {'cdc_cases_by_state': 'state',
+                 'cdc_cases_by_report_date': 'date',
+                 'cdc_cases_by_onset_date': 'date'}
 
 # # CREDENTIALS IF NEEDED
 # credentials_json_path = "secrets/credentials.json"
@@ -25,15 +54,111 @@ CURRENT_DATE = dt.datetime.strftime(dt.datetime.now(), '%Y%m%d')
 # MONGODB_PASSWORD = credentials["mongodb_password"]
 
 
-def update_db(conn):
+def create_schema(conn):
+    for name, schema in CDC_TABLE_SCHEMA.items():
+        key = CDC_TABLE_KEY[name]
+        conn.execute('CREATE TABLE IF NOT EXISTS ' + name + ' (snapshot_date TEXT NOT NULL, '
+                     + ', '.join(col + ' ' + col_type for col, col_type in schema.items()) + ')')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_' + name + '_snapshot_date_' + key
+                     + ' ON ' + name + ' (snapshot_date, ' + key + ')')
+    conn.commit()
+
+
+# FOLD LEGACY PER-DAY TABLES (e.g. cdc_cases_by_state20200325) INTO THE LONG TABLES
+def migrate_snapshot_tables(conn, drop=True):
+    create_schema(conn)
+    c = conn.cursor()
+
+    for name, schema in CDC_TABLE_SCHEMA.items():
+        cols = list(schema)
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+                  (name + '[0-9]' * 8,))
+        legacy_tables = [row[0] for row in c.fetchall()]
+
+        for legacy_table in legacy_tables:
+            stamp = legacy_table[len(name):]
+            snapshot_date = stamp[:4] + '-' + stamp[4:6] + '-' + stamp[6:]
+
+            # some early snapshots kept the raw CDC header for community transmission
+            c.execute('PRAGMA table_info("' + legacy_table + '")')
+            legacy_cols = {('community_transmission' if col.startswith('Community Transmission') else col): col
+                           for col in (row[1] for row in c.fetchall())}
+
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO ' + name + ' (snapshot_date, ' + ', '.join(cols) + ') '
+                             + 'SELECT ?, ' + ', '.join('"' + legacy_cols[col] + '"' for col in cols)
+                             + ' FROM "' + legacy_table + '"',
+                             (snapshot_date,))
+                if drop:
+                    conn.execute('DROP TABLE "' + legacy_table + '"')
+            logger.info('MIGRATED ' + legacy_table + ' INTO ' + name)
+
+
+# UPSERT ONE SNAPSHOT OF EVERY DATASET IN A SINGLE TRANSACTION
+# readers see either the previous snapshot or all of this one; keys missing from the new
+# snapshot (and rows without a key, which never conflict) are deleted first, so a rewrite
+# of the same day matches what was fetched
+@timed
+def write_snapshot(conn, snapshot_date, frames) -> int:
+    start = time.perf_counter()
+    n_rows = 0
+    with conn:
+        for name, df in frames.items():
+            cols = list(CDC_TABLE_SCHEMA[name])
+            key = CDC_TABLE_KEY[name]
+            df = df.reindex(columns=cols)
+            if 'date' in df.columns and df['date'].dtype.kind == 'M':
+                df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+
+            conn.execute('DELETE FROM ' + name + ' WHERE snapshot_date = ? AND (' + key + ' IS NULL OR ' + key
+                         + ' NOT IN (SELECT value FROM json_each(?)))',
+                         (snapshot_date, json.dumps([k for k in df[key].tolist() if pd.notna(k)])))
+            rows = [(snapshot_date,) + row for row in df.itertuples(index=False, name=None)]
+            conn.executemany('INSERT INTO ' + name + ' (snapshot_date, ' + ', '.join(cols) + ') '
+                             + 'VALUES (?, ' + ', '.join('?' * len(cols)) + ') '
+                             + 'ON CONFLICT (snapshot_date, ' + key + ') DO UPDATE SET '
+                             + ', '.join(col + ' = excluded.' + col for col in cols if col != key),
+                             rows)
+
+            # row check before the commit: one row per key plus every keyless row, or the
+            # whole snapshot rolls back
+            keys = df[key].dropna()
+            expected = keys.nunique() + len(df) - len(keys)
+            stored = conn.execute('SELECT COUNT(*) FROM ' + name + ' WHERE snapshot_date = ?',
+                                  (snapshot_date,)).fetchone()[0]
+            if stored != expected:
+                raise ValueError(name + ' holds ' + str(stored) + ' rows for ' + snapshot_date
+                                 + ', expected ' + str(expected))
+            n_rows += len(rows)
+
+    elapsed = time.perf_counter() - start
+    logger.info(str(n_rows) + ' ROWS PERSISTED FOR ' + snapshot_date + ' IN ' + str(round(elapsed, 3)) + 's ('
+                + str(int(n_rows / max(elapsed, 1e-9))) + ' ROWS/S)')
+    return n_rows
+
+
+# responses may be prefetched with fetch_all(CDC_SOURCES) alongside the other sources
+@timed
+def update_db(conn, snapshot_date=None, responses=None):
+
+    if snapshot_date is None:
+        snapshot_date = dt.date.today().isoformat()
 
     c = conn.cursor()
+    migrate_snapshot_tables(conn)
 
     # GET UPDATED DATA FROM CDC
-    logger.info('GET UPDATED DATA FROM CDC.GOV')
-    cases_by_state_response = requests.get(CASES_BY_STATE_URL)
-    cases_by_report_date_response = requests.get(CASES_BY_REPORT_DATE_URL)
-    cases_by_onset_date_response = requests.get(CASES_BY_ONSET_DATE_URL)
+    if responses is None:
+        logger.info('GET UPDATED DATA FROM CDC.GOV')
+        responses = fetch_all(CDC_SOURCES)
+    cases_by_state_response = responses['cases_by_state']
+    cases_by_report_date_response = responses['cases_by_report_date']
+    cases_by_onset_date_response = responses['cases_by_onset_date']
+
+    c.execute("SELECT 1 FROM cdc_cases_by_state LIMIT 1")
+    if not any(response.changed for response in responses.values()) and c.fetchone() is not None:
+        logger.info('CDC SOURCES UNCHANGED SINCE LAST SNAPSHOT')
+        return
 
     # DECODE JSON AND PULL OUT DATA
     logger.info('DECODE AND FORMAT DATA')
@@ -77,24 +202,12 @@ def update_db(conn):
 
     # ADD OR UPDATE DATA INTO SQL DB
     logger.info('INSERT UPDATED DATA INTO DB')
-    cases_by_state_df.to_sql(name='cdc_cases_by_state'+CURRENT_DATE, con=conn, if_exists='replace')
-    cases_by_report_date_df.to_sql(name='cdc_cases_by_report_date'+CURRENT_DATE, con=conn, if_exists='replace')
-    cases_by_onset_date_df.to_sql(name='cdc_cases_by_onset_date'+CURRENT_DATE, con=conn, if_exists='replace')
-
-    # pull nrows for logging and error checking
-    # by state
-    c.execute("SELECT * FROM cdc_cases_by_state"+CURRENT_DATE)
-    cases_by_state_nrows = len(pd.DataFrame(c.fetchall()))
-    logger.info(str(cases_by_state_nrows) + " ROWS PERSISTED TO cdc_cases_by_state"+CURRENT_DATE)
-
-    # by report date
-    c.execute("SELECT * FROM cdc_cases_by_report_date"+CURRENT_DATE)
-    cases_by_report_date_nrows = len(pd.DataFrame(c.fetchall()))
-    logger.info(str(cases_by_report_date_nrows) + " ROWS PERSISTED TO cdc_cases_by_report_date"+CURRENT_DATE)
-
-    # by onset date
-    c.execute("SELECT * FROM cdc_cases_by_onset_date"+CURRENT_DATE)
-    cases_by_onset_date_nrows = len(pd.DataFrame(c.fetchall()))
-    logger.info(str(cases_by_onset_date_nrows) + " ROWS PERSISTED TO cdc_cases_by_onset_date"+CURRENT_DATE)
+    cases_by_state_df = cases_by_state_df.reset_index()
+    write_snapshot(conn, snapshot_date, {'cdc_cases_by_state': cases_by_state_df,
+                                         'cdc_cases_by_report_date': cases_by_report_date_df,
+                                         'cdc_cases_by_onset_date': cases_by_onset_date_df})
+    # the snapshot is committed, the next run may answer these sources with a 304
+    for response in responses.values():
+        commit_fetched(response)
 
     return